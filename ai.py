@@ -0,0 +1,385 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Компьютерный боец. Выбирает действие, проигрывая короткое будущее боя в
+отдельной безголовой симуляции (песочнице): для каждого своего варианта
+(движение + действие PlayerBase) и каждого предсказанного ответа противника
+считается, чем кончится следующие полсекунды, и берётся вариант с лучшим
+худшим исходом.
+
+Поиск - с любым временем остановки: сначала короткий горизонт и один ответ
+противника, потом длиннее и больше ответов. За кадр на поиск уходит не
+больше budget секунд, решение принимается, когда поиск закончен или прошло
+THINK_FRAMES кадров. Чем больше бюджет, тем дальше и внимательнее смотрит
+боец. С worker=True поиск идёт в отдельном процессе и кадр не тратит вовсе.
+'''
+
+import multiprocessing
+import time
+
+import fighters
+import gamelog
+from snapshot import capture
+
+SIDES = ('left','right')
+
+# Варианты бойца: направление движения (к противнику, от него, стоять) и действие.
+MOVES = (1,-1,0)
+ACTIONS = (None,'hit','block','jump','throw','jump-hit')
+# Ответы противника, от простого предсказания ко всё более подозрительным.
+RESPONSES = ('continue','hit','block','jump')
+# Уровни поиска: (горизонт в шагах, сколько ответов противника учитывать).
+LEVELS = ((15,1),(30,2),(45,4))
+
+# Через сколько шагов после прыжка бьёт 'jump-hit'.
+JUMP_HIT_DELAY = 12
+# Сколько шагов держится выбранное движение (и блок) до следующего решения.
+COMMIT_TICKS = 12
+
+def _other(side):
+	return 'right' if side == 'left' else 'left'
+
+def observe(game,side):
+	'''
+	Всё, что боец видит в игре game: бойцы и летящие причинятели ущерба.
+	Время действий - относительно текущего момента.
+	'''
+	now = game.currentTime
+	players = {}
+	for s in SIDES:
+		p = game.handle('player-'+s).get()
+		players[s] = {'class': type(p).__name__,'position': tuple(p.position),'velocity': tuple(p.velocity),
+			'state': p.state,'health': p.health,'timeout': p._action_timeout - now,
+			'defence_level': p.defence_level,'move': dict(p.move)}
+	hurters = []
+	for h in game.getEntitiesByTag('hurter'):
+		if not getattr(h,'active',True) or h.owner is None:
+			continue
+		times = [t.time for t in game.timers._byOwner.get(h,())]
+		hurters.append({'owner': h.owner.id[7:],'position': tuple(h.position),'velocity': tuple(h.velocity),
+			'ttl': (min(times) - now) if times else 0.3,'damage': h.damage,'radius': h.radius,
+			'level': h.level,'type_': h.type_})
+	return {'side': side,'players': players,'hurters': hurters}
+
+class _Quiet(object):
+	'''
+	Песочница в окне игры: без звука, журнала, спрайтов и анимаций.
+	'''
+	def __enter__(self):
+		self.saved = fighters.playSound, fighters.LOG, fighters.HEADLESS
+		fighters.playSound = fighters._silence
+		fighters.LOG = gamelog.SILENT
+		fighters.HEADLESS = True
+
+	def __exit__(self,*args):
+		fighters.playSound, fighters.LOG, fighters.HEADLESS = self.saved
+
+class Planner(object):
+	def __init__(self):
+		from sim import Match
+		headless = fighters.HEADLESS
+		self.match = Match(roundTime=1e9,seed=0)
+		fighters.HEADLESS = headless
+		self.game = self.match.game
+		self._search = None
+		self._score = None
+		self.best = None
+		self.level = 0
+		self.rollouts = 0
+
+	def prepare(self,choices):
+		'''
+		Песочница с бойцами choices ({'player-left': класс, 'player-right': класс}).
+		'''
+		match = self.match
+		if any(type(match.players[s]) is not choices['player-'+s] for s in SIDES):
+			from sim import Match
+			with _Quiet():
+				match = self.match = Match(choices,roundTime=1e9,seed=0)
+			self.game = match.game
+
+	def _load(self,state):
+		self.prepare({'player-'+s: getattr(fighters,state['players'][s]['class']) for s in SIDES})
+		game = self.game
+		match = self.match
+		with _Quiet():
+			game.stopAttacks()
+			now = game.currentTime
+			for s in SIDES:
+				p, st = match.players[s], state['players'][s]
+				p.position = st['position']
+				p.velocity = st['velocity']
+				p.state = st['state']
+				p.health = st['health']
+				p._action_timeout = now + st['timeout']
+				p.defence_level = st['defence_level']
+				p.move = dict(st['move'])
+			for h in state['hurters']:
+				fighters.Hurter.static_init(game=game,owner=match.players[h['owner']],position=h['position'],
+					velocity=h['velocity'],ttl=max(h['ttl'],game.TICK),damage=h['damage'],radius=h['radius'],
+					level=h['level'],type_=h['type_'])
+		return capture(game)
+
+	def begin(self,state):
+		self._search = self._run(state)
+		self.best = None
+		self.level = 0
+
+	def work(self,seconds):
+		'''
+		Ищет не дольше seconds. Возвращает True, когда поиск закончен.
+		'''
+		if self._search is None:
+			return True
+		if seconds <= 0:
+			return False
+		deadline = time.perf_counter() + seconds
+		with _Quiet():
+			for x in self._search:
+				if time.perf_counter() >= deadline:
+					return False
+		self._search = None
+		return True
+
+	def _rollout(self,start,side,plan,response,horizon):
+		game = self.game
+		start.restore(game)
+		yield
+		me = self.match.players[side]
+		other = self.match.players[_other(side)]
+		health = me.health, other.health
+		toward = 1 if other.position[0] > me.position[0] else -1
+
+		move, action = plan
+		if move:
+			game.input(side,'go',True,{'direction': move * toward})
+		if action == 'jump-hit':
+			game.input(side,'jump',True)
+		elif action is not None:
+			game.input(side,action,True)
+		if response != 'continue':
+			game.input(_other(side),response,True)
+
+		for t in range(horizon):
+			if action == 'jump-hit' and t == JUMP_HIT_DELAY:
+				game.input(side,'hit',True)
+			if t == COMMIT_TICKS:
+				if move:
+					game.input(side,'go',False,{'direction': move * toward})
+				if action == 'block':
+					game.input(side,'block',False)
+			game.step()
+			# Останавливаться можно после любого шага, чтобы не выйти за бюджет кадра.
+			yield
+		self.rollouts += 1
+
+		score = (me.health - health[0]) - (other.health - health[1])
+		if me.state == 'lying':
+			score -= 1000
+		if other.state == 'lying':
+			score += 1000
+		# При равном уроне лучше быть на расстоянии удара.
+		score -= abs(abs(other.position[0] - me.position[0]) - 130) / 1000.0
+		self._score = score
+
+	def _run(self,state):
+		side = state['side']
+		start = self._load(state)
+		yield
+		plans = [(m,a) for a in ACTIONS for m in MOVES]
+		for level, (horizon, responses) in enumerate(LEVELS):
+			values = {}
+			for plan in plans:
+				worst = None
+				for response in RESPONSES[:responses]:
+					for x in self._rollout(start,side,plan,response,horizon):
+						yield
+					score = self._score
+					worst = score if worst is None else min(worst,score)
+				values[plan] = worst
+			self.best = max(plans,key=lambda plan: values[plan])
+			self.level = level + 1
+
+def _workerMain(conn):
+	'''
+	Процесс поиска: получает состояние, ищет, пока не придёт новое или не
+	кончится время на решение, и отправляет лучший вариант.
+	'''
+	planner = Planner()
+	while True:
+		message = conn.recv()
+		if message is None:
+			return
+		state, seconds = message
+		planner.begin(state)
+		deadline = time.perf_counter() + seconds
+		while not planner.work(0.005):
+			if conn.poll() or (time.perf_counter() >= deadline and planner.best is not None):
+				break
+		conn.send((planner.best,planner.level))
+
+class CpuController(object):
+	'''
+	Управляет бойцом side через FightGame.input. Ставится в FightGame.controllers
+	и вызывается перед каждым шагом. Бюджет - на кадр (FightGame.startFrame):
+	если кадр догоняет время несколькими шагами, они делят один бюджет.
+	'''
+	THINK_FRAMES = 6
+
+	def __init__(self,budget=0.002,worker=False):
+		self.budget = budget
+		self.worker = worker
+		# Песочница (или процесс с ней) строится сразу: первое решение не должно
+		# тратить кадр на загрузку уровня.
+		self.planner = None
+		self._conn = None
+		self._process = None
+		if worker:
+			self._conn, child = multiprocessing.Pipe()
+			self._process = multiprocessing.Process(target=_workerMain,args=(child,))
+			self._process.daemon = True
+			self._process.start()
+		else:
+			self.planner = Planner()
+		self._thinking = False
+		self._frames = 0
+		# Сколько секунд бюджета уже потрачено в этом кадре.
+		self._spent = 0.0
+		self._held = []
+		self._pending = []
+		# Ответы процесса поиска на запросы, отменённые reset: их нужно пропустить.
+		self._stale = 0
+		self.stats = {'decisions': 0,'thinkTime': 0.0,'maxThinkTime': 0.0,'level': 0}
+
+	def startFrame(self):
+		self._spent = 0.0
+
+	def prepare(self,game):
+		'''
+		Заранее, вне бюджета кадра, строит песочницу с бойцами игры game.
+		'''
+		if self.planner is not None:
+			self.planner.prepare({pid: type(game.handle(pid).get()) for pid in ('player-left','player-right')})
+
+	def _start(self,state):
+		if self.worker:
+			self._conn.send((state,self.budget * self.THINK_FRAMES))
+		else:
+			self.planner.begin(state)
+		self._thinking = True
+		self._frames = 0
+
+	def _think(self,started):
+		'''
+		Возвращает (вариант, уровень поиска), если решение готово, иначе None.
+		started - начало обдумывания в этом шаге (perf_counter), включая наблюдение.
+		'''
+		self._frames += 1
+		if self.worker:
+			while self._conn.poll():
+				reply = self._conn.recv()
+				if not self._stale:
+					return reply
+				self._stale -= 1
+			return None
+		done = self.planner.work(self.budget - self._spent - (time.perf_counter() - started))
+		spent = time.perf_counter() - started
+		self._spent += spent
+		self.stats['thinkTime'] += spent
+		self.stats['maxThinkTime'] = max(self.stats['maxThinkTime'],self._spent)
+		if done or (self._frames >= self.THINK_FRAMES and self.planner.best is not None):
+			return self.planner.best, self.planner.level
+		return None
+
+	def __call__(self,game,side):
+		while self._pending and self._pending[0][0] <= game.ticks:
+			tick, action, pressed, kw = self._pending.pop(0)
+			game.input(side,action,pressed,kw)
+			if not pressed and (action,kw) in self._held:
+				self._held.remove((action,kw))
+
+		started = time.perf_counter()
+		if not self._thinking:
+			self._start(observe(game,side))
+		result = self._think(started)
+		if result is None:
+			return
+		plan, level = result
+		self._thinking = False
+		player = game.handle('player-'+side).get()
+		if plan is None or not player.checkActionTimeout() or player.state == 'lying':
+			return
+		self.stats['decisions'] += 1
+		self.stats['level'] = level
+		self._execute(game,side,plan)
+
+	def _execute(self,game,side,plan):
+		for action, kw in self._held:
+			game.input(side,action,False,kw)
+		self._held = []
+		self._pending = []
+
+		me = game.handle('player-'+side).get()
+		other = game.handle('player-'+_other(side)).get()
+		move, action = plan
+		if move:
+			kw = {'direction': move * (1 if other.position[0] > me.position[0] else -1)}
+			game.input(side,'go',True,kw)
+			self._held.append(('go',kw))
+		if action == 'jump-hit':
+			game.input(side,'jump',True)
+			self._pending.append((game.ticks + JUMP_HIT_DELAY,'hit',True,None))
+		elif action is not None:
+			game.input(side,action,True)
+			if action == 'block':
+				self._held.append(('block',None))
+		# Отпускание - после pending-удара из 'jump-hit', порядок по шагу сохраняется.
+		for held, kw in self._held:
+			self._pending.append((game.ticks + COMMIT_TICKS,held,False,kw))
+
+	def reset(self):
+		'''
+		Забывает решение и запланированные нажатия (новый раунд или новая игра).
+		Ответ процесса поиска, который ещё в пути, будет пропущен.
+		'''
+		if self.worker and self._thinking:
+			self._stale += 1
+		self._held = []
+		self._pending = []
+		self._thinking = False
+		self._frames = 0
+		self._spent = 0.0
+
+	def close(self):
+		if self._process is not None:
+			self._conn.send(None)
+			self._process.join(1.0)
+			self._process = None
+
+if __name__ == '__main__':
+	import argparse
+	from sim import Match
+	from tournament import RandomController
+
+	parser = argparse.ArgumentParser(description='CPU fighter against the random controller.')
+	parser.add_argument('--budget',type=float,default=2.0,help='thinking budget per frame, ms')
+	parser.add_argument('--worker',action='store_true',help='search in a separate process')
+	parser.add_argument('--rounds',type=int,default=5)
+	args = parser.parse_args()
+
+	import random
+	wins = {'player-left': 0,'player-right': 0,None: 0}
+	for r in range(args.rounds):
+		match = Match(seed=r)
+		cpu = CpuController(args.budget / 1000.0,worker=args.worker)
+		cpu.prepare(match.game)
+		match.game.controllers['left'] = cpu
+		match.controllers['right'] = RandomController(random.Random(r))
+		res = match.run()
+		cpu.close()
+		wins[res['winner']] += 1
+		st = cpu.stats
+		print('round {}: winner {} health {} decisions {} search level {} max think {:.2f} ms'.format(
+			r + 1,res['winner'],res['health'],st['decisions'],st['level'],st['maxThinkTime'] * 1000.0))
+	print('cpu {player-left} random {player-right} draws {}'.format(wins[None],**{k: v for k, v in wins.items() if k}))
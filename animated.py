@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Анимации бойцов из rc/ani.bundle (или rc/ani/*.json, если он не собран).
+
+Animated заменяет GameEntity.mixin.Animation и ставится вместе с
+GameEntity.mixin.Sprite. Тот же интерфейс: animations - путь к описанию
+анимации, animation - имя последовательности. Последовательности общие для
+всех бойцов (bundle.sequences), а кадр выбирается по игровому времени в
+FightGame.animate раз за кадр окна двоичным поиском (Sequence.frameAt).
+Картинка кадра - область атласа (или исходной картинки) с якорем от всей
+исходной картинки и отражением из "transform"; она ставится спрайту fwk
+(_sprite, pyglet.sprite.Sprite) и создаётся один раз на все сущности.
+'''
+
+import bundle
+
+# {путь: текстура} картинок, с которых берутся области кадров.
+_TEXTURES = {}
+# {(кадр, флаги): картинка pyglet}
+_IMAGES = {}
+
+def _anchor(frame,width,height):
+	fullW, fullH = frame.fullW or width, frame.fullH or height
+	if frame.anchor == 'center':
+		x, y = fullW // 2, fullH // 2
+	else:
+		x, y = 0, 0
+	return x - frame.trimX, y - frame.trimY
+
+class Animated(object):
+	'''
+	Подмешивается вместо GameEntity.mixin.Animation, вместе с GameEntity.mixin.Sprite
+	и первым, чтобы его свойства не перекрывались (как StoredMovement).
+	'''
+	_animationsPath = None
+	_sequences = None
+	_animationName = None
+	_animationStart = 0.0
+	_shown = None
+
+	@property
+	def animations(self):
+		return self._animationsPath
+
+	@animations.setter
+	def animations(self,path):
+		self._animationsPath = path
+		self._sequences = bundle.sequences(path)
+		self._shown = None
+
+	@property
+	def animation(self):
+		return self._animationName
+
+	@animation.setter
+	def animation(self,name):
+		self._animationName = name
+		game = getattr(self,'game',None)
+		self._animationStart = game.currentTime if game is not None else 0.0
+		self._shown = None
+
+	def animate(self,now):
+		'''
+		Показывает кадр текущей последовательности на момент now.
+		'''
+		seqs = self._sequences
+		if seqs is None:
+			return
+		seq = seqs.get(self._animationName)
+		if seq is None or not seq.duration:
+			return
+		frame = seq.frameAt(now - self._animationStart)
+		shown = frame, seq.flags(frame)
+		if shown != self._shown:
+			self._shown = shown
+			self.showFrame(*shown)
+
+	def showFrame(self,frame,flags):
+		image = _IMAGES.get((frame,flags))
+		if image is None:
+			texture = _TEXTURES.get(frame.img)
+			if texture is None:
+				# Текстуру загружает сам спрайт fwk: атлас читается один раз.
+				self.sprite = frame.img
+				texture = _TEXTURES[frame.img] = self._sprite.image.get_texture()
+			width, height = frame.width or texture.width, frame.height or texture.height
+			image = texture.get_region(frame.left,frame.bottom,width,height)
+			image.anchor_x, image.anchor_y = _anchor(frame,width,height)
+			if flags & (bundle.FLAG_FLIP_X | bundle.FLAG_FLIP_Y):
+				image = image.get_transform(flip_x=bool(flags & bundle.FLAG_FLIP_X),
+					flip_y=bool(flags & bundle.FLAG_FLIP_Y))
+			_IMAGES[(frame,flags)] = image
+		if getattr(self,'_sprite',None) is None:
+			self.sprite = frame.img
+		self._sprite.image = image
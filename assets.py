@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Реестр ресурсов с отложенной загрузкой.
+
+ASSETS.image(path) сразу возвращает описатель, а файл читается и декодируется
+в фоновом потоке. В видеопамять картинка загружается в главном потоке при
+первом get(). report() показывает, сколько времени ушло на каждый ресурс.
+'''
+
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pyglet
+
+class Asset(object):
+	def __init__(self,registry,path,decode,upload):
+		self.path = path
+		self._registry = registry
+		self._upload = upload
+		self._value = None
+		self._loaded = False
+		self.requested = time.time()
+		self.decodeTime = None
+		self.waitTime = 0.0
+		self.uploadTime = None
+		self._future = registry._executor.submit(self._decode,decode)
+
+	def _decode(self,decode):
+		started = time.time()
+		try:
+			return decode(self.path)
+		finally:
+			self.decodeTime = time.time() - started
+
+	def ready(self):
+		'''
+		Декодирование закончено, get() не будет ждать фоновый поток.
+		'''
+		return self._loaded or self._future.done()
+
+	def get(self):
+		'''
+		Готовый ресурс. Вызывается только из главного потока.
+		'''
+		if not self._loaded:
+			started = time.time()
+			data = self._future.result()
+			self.waitTime = time.time() - started
+			started = time.time()
+			self._value = self._upload(data) if self._upload else data
+			self.uploadTime = time.time() - started
+			self._loaded = True
+			self._future = None
+		return self._value
+
+class AssetRegistry(object):
+	def __init__(self,workers=2):
+		self._executor = ThreadPoolExecutor(max_workers=workers)
+		self._assets = {}
+		self._lock = threading.Lock()
+
+	def _asset(self,kind,path,decode,upload):
+		with self._lock:
+			key = kind, path
+			if key not in self._assets:
+				self._assets[key] = Asset(self,path,decode,upload)
+			return self._assets[key]
+
+	def image(self,path):
+		return self._asset('image',path,pyglet.image.load,lambda img: img.get_texture())
+
+	def sound(self,path):
+		return self._asset('sound',path,lambda p: pyglet.media.load(p,streaming=False),None)
+
+	def report(self):
+		'''
+		Строки "ресурс: декодирование / ожидание / загрузка в видеопамять" в миллисекундах.
+		'''
+		def ms(v):
+			return '   -   ' if v is None else '{:7.1f}'.format(v * 1e3)
+		lines = []
+		for (kind, path), a in sorted(self._assets.items()):
+			lines.append('{:6} {:40} decode {} wait {} upload {}'.format(
+				kind,path,ms(a.decodeTime),ms(a.waitTime),ms(a.uploadTime)))
+		return '\n'.join(lines)
+
+ASSETS = AssetRegistry()
@@ -0,0 +1,18 @@
+# coding=UTF-8
+
+'''
+Замеры производительности на безголовой симуляции. Запускаются из корня проекта:
+
+	$ python -m bench.collision
+'''
+
+import time
+
+def ticksPerSecond(step,ticks):
+	'''
+	Выполняет step() ticks раз и возвращает число шагов в секунду.
+	'''
+	started = time.time()
+	for i in range(ticks):
+		step()
+	return ticks / max(time.time() - started,1e-9)
@@ -0,0 +1,82 @@
+# coding=UTF-8
+
+'''
+Память описаний анимаций для многих бойцов на экране: у каждого бойца своя
+копия описания из json против общих последовательностей bundle.sequences
+(отражённые анимации - без копий кадров). Нужен собранный rc/ani.bundle
+(python build_assets.py).
+
+Выбор кадра на момент t: проход по кадрам с вычитанием их времён (как было
+до Sequence.frameAt) против двоичного поиска по cumulative, на настоящих
+последовательностях бойцов и на длинных искусственных.
+'''
+
+import glob
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import bundle
+
+FIGHTERS = 200
+LOOKUPS = 200000
+
+def _memory(load):
+	tracemalloc.start()
+	kept = [load(i) for i in range(FIGHTERS)]
+	size = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return size
+
+def linearFrameAt(seq,t):
+	t %= seq.duration
+	for frame in seq.frames:
+		if t < frame.t:
+			return frame
+		t -= frame.t
+	return seq.frames[-1]
+
+def _lookup(frameAt,seqs,times):
+	started = time.perf_counter()
+	for seq, t in zip(seqs,times):
+		frameAt(seq,t)
+	return (time.perf_counter() - started) / len(times) * 1e9
+
+def _compareLookup(title,sequences):
+	rnd = random.Random(0)
+	seqs = [rnd.choice(sequences) for i in range(LOOKUPS)]
+	times = [rnd.uniform(0.0,2.0 * seq.duration) for seq in seqs]
+	for seq, t in zip(seqs[:1000],times[:1000]):
+		assert linearFrameAt(seq,t) is seq.frameAt(t)
+	linear = _lookup(linearFrameAt,seqs,times)
+	bisected = _lookup(bundle.Sequence.frameAt,seqs,times)
+	print('{:>28} linear {:7.0f} ns, bisect {:7.0f} ns, {:+.0f}%'.format(
+		title,linear,bisected,(bisected / linear - 1.0) * 100.0))
+
+def _synthetic(count):
+	rnd = random.Random(count)
+	return bundle.Sequence([bundle.Frame(0,0,0,1,1,rnd.uniform(0.02,0.1),'center',0) for i in range(count)])
+
+def main():
+	b = bundle._bundle()
+	if b is None:
+		print('{} is not built, run build_assets.py first'.format(bundle.BUNDLE_PATH))
+		sys.exit(1)
+	paths = sorted(p.replace('\\','/') for p in glob.glob('rc/ani/fighter-*.json'))
+	print('{} animations, mirrored in bundle: {}'.format(len(b.animations),len(bundle.findMirrors(b.animations))))
+
+	def perFighter(i):
+		with open(paths[i % len(paths)]) as f:
+			return json.load(f)
+	print('{:>28} {:>10.1f} KiB'.format('json copy per fighter',_memory(perFighter) / 1024.0))
+	print('{:>28} {:>10.1f} KiB'.format('shared bundle sequences',_memory(lambda i: bundle.sequences(paths[i % len(paths)])) / 1024.0))
+
+	fighters = [seq for path in paths for seq in bundle.sequences(path).values()]
+	_compareLookup('fighters (1-3 frames)',fighters)
+	for count in (8,32,128):
+		_compareLookup('{} frames'.format(count),[_synthetic(count)])
+
+if __name__ == '__main__':
+	main()
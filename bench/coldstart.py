@@ -0,0 +1,72 @@
+# coding=UTF-8
+
+'''
+Холодный старт анимаций бойцов в новом процессе: описания и картинки, которые
+нужны до первого кадра. Без собранного rc/ani.bundle - все rc/ani/fighter-*.json
+и каждая картинка их кадров, с ним - rc/ani.bundle и страницы атласа.
+
+Картинки декодирует build_assets.readPNG на чистом Python, как pyglet без
+GdkPixbuf и PIL, и окно не открывается: загрузка в видеопамять не входит,
+вместо неё показано число пикселей текстур. Атлас записан без PNG-фильтров,
+поэтому такой декодер разбирает его намного быстрее исходных картинок; с
+декодером на C время ближе к числу пикселей и байт. Нужен python build_assets.py.
+'''
+
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+import bundle
+
+RUNS = 3
+
+def _images(paths):
+	images = set()
+	for path in paths:
+		with open(path) as f:
+			for frames in json.load(f).values():
+				images.update(frame['img'] for frame in frames)
+	return sorted(images)
+
+def _load(variant):
+	import build_assets
+	paths = sorted(glob.glob('rc/ani/fighter-*.json'))
+	if variant == 'json':
+		images = _images(paths)
+	else:
+		b = bundle.read(bundle.BUNDLE_PATH)
+		images = [path for path, size in b.atlases]
+	pixels = 0
+	for path in images:
+		w, h, rows = build_assets.readPNG(path)
+		pixels += w * h
+	return len(images), pixels, sum(os.path.getsize(path) for path in images)
+
+def _cold(variant):
+	'''
+	(секунды, число картинок, пикселей, байт в файлах) в новом интерпретаторе.
+	'''
+	started = time.perf_counter()
+	out = subprocess.check_output([sys.executable,'-m','bench.coldstart','--child',variant])
+	elapsed = time.perf_counter() - started
+	images, pixels, size = map(int,out.split())
+	return elapsed, images, pixels, size
+
+def main():
+	if bundle._bundle() is None:
+		print('{} is not built, run build_assets.py first'.format(bundle.BUNDLE_PATH))
+		sys.exit(1)
+	for variant, title in (('json','rc/ani json + images'),('bundle','rc/ani.bundle + atlas')):
+		runs = sorted(_cold(variant) for i in range(RUNS))
+		elapsed, images, pixels, size = runs[len(runs) // 2]
+		print('{:>24}: {:6.0f} ms (median of {}), {} images, {:.2f} Mpx, {:.0f} KiB'.format(
+			title,elapsed * 1e3,RUNS,images,pixels / 1e6,size / 1024.0))
+
+if __name__ == '__main__':
+	if '--child' in sys.argv:
+		print('{} {} {}'.format(*_load(sys.argv[sys.argv.index('--child')+1])))
+	else:
+		main()
@@ -0,0 +1,36 @@
+# coding=UTF-8
+
+'''
+Шаги в секунду при 10, 100 и 1000 одновременных причинятелях ущерба,
+с пакетной (numpy) и поштучной проверкой столкновений.
+'''
+
+import collision
+
+from sim import Match
+from fighters import Hurter
+from bench import ticksPerSecond
+
+TICKS = 300
+
+def scene(count):
+	match = Match(roundTime=1e9)
+	owner = match.players['left']
+	for i in range(count):
+		# Высоко над ареной: проверяются все, но никто не попадает и не исчезает.
+		Hurter.static_init(game=match.game,owner=owner,position=(i % 200 * 10 - 1000,5000 + i // 200 * 10),
+			velocity=(0,0),ttl=1e9,damage=0,radius=16,level=1)
+	return match
+
+def main():
+	print('{:>8} {:>14} {:>14}'.format('hurters','loop ticks/s','numpy ticks/s'))
+	for count in (10,100,1000):
+		results = []
+		for threshold in (float('inf'),0):
+			collision.VECTORIZE_MIN_PAIRS = threshold
+			match = scene(count)
+			results.append(ticksPerSecond(match.step,TICKS))
+		print('{:>8} {:>14.0f} {:>14.0f}'.format(count,*results))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,51 @@
+# coding=UTF-8
+
+'''
+Цена шага при 100, 1000 и 10000 сущностях на большой арене, из которых камера
+видит примерно одинаковое число: с отсечением по сетке и без него.
+'''
+
+from sim import Match
+from fighters import TestEntity
+from bench import ticksPerSecond
+
+TICKS = 300
+# Арена намного больше _MOVEMENT_LIMIT_* бойцов.
+ARENA = 50000
+
+class Wanderer(TestEntity):
+	'''
+	TestEntity, который ходит туда-сюда на своём месте, а не прыгает к началу координат.
+	'''
+	def think(self):
+		self.game.scheduleAfter(1.0,self.think)
+		self.velocity = (100*(-1 if self.i % 2 == 0 else 1),0)
+		self.i += 1
+
+def scene(count,culling):
+	match = Match(roundTime=1e9)
+	game = match.game
+	game.culling = culling
+	side = int(count ** 0.5) or 1
+	step = 2.0 * ARENA / side
+	for i in range(count):
+		e = Wanderer()
+		game.addEntity(e)
+		e.position = (-ARENA + (i % side) * step,-ARENA + (i // side) * step)
+		# Камера следит только за бойцами, иначе она охватит всю арену.
+		game.unsetEntityTags(e,'camera-target')
+	return match
+
+def main():
+	print('{:>8} {:>8} {:>14} {:>14}'.format('entities','awake','culled ticks/s','all ticks/s'))
+	for count in (100,1000,10000):
+		results = []
+		for culling in (True,False):
+			match = scene(count,culling)
+			results.append(ticksPerSecond(match.step,TICKS))
+			if culling:
+				awake = len(match.game.awake)
+		print('{:>8} {:>8} {:>14.0f} {:>14.0f}'.format(count,awake,*results))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,42 @@
+# coding=UTF-8
+
+'''
+Шагов в секунду при 100, 1000 и 10000 неподвижных сущностях: спящих (@dormant)
+и обновляемых каждый кадр.
+'''
+
+from fwk.game.entity import GameEntity
+
+from sim import Match
+from fightgame import dormant
+from bench import ticksPerSecond
+
+TICKS = 300
+
+class Prop(GameEntity):
+	def update(self,dt):
+		self.position = self.position[0], self.position[1]
+
+@dormant
+class DormantProp(Prop):
+	pass
+
+def scene(cls,count):
+	match = Match(roundTime=1e9)
+	for i in range(count):
+		match.game.addEntity(cls())
+	return match
+
+def main():
+	print('{:>8} {:>14} {:>14} {:>8}'.format('entities','dormant tps','always tps','active'))
+	for count in (100,1000,10000):
+		results = []
+		for cls in (DormantProp,Prop):
+			match = scene(cls,count)
+			results.append(ticksPerSecond(match.step,TICKS))
+			if cls is DormantProp:
+				active = len(match.game.active)
+		print('{:>8} {:>14.0f} {:>14.0f} {:>8}'.format(count,results[0],results[1],active))
+
+if __name__ == '__main__':
+	main()
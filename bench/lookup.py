@@ -0,0 +1,40 @@
+# coding=UTF-8
+
+'''
+Стоимость поиска сущностей, который игра делает каждый кадр (EntityHandle.get
+и getEntitiesByTag), при 10, 1000 и 100000 посторонних сущностей в игре.
+'''
+
+import time
+
+from fwk.game.entity import GameEntity
+
+from sim import Match
+
+LOOKUPS = 100000
+
+class Filler(GameEntity):
+	def spawn(self):
+		self.addTags('filler')
+
+def measure(count):
+	match = Match(roundTime=1e9)
+	game = match.game
+	for i in range(count):
+		game.addEntity(Filler())
+
+	left = game.handle('player-left')
+	started = time.time()
+	for i in range(LOOKUPS):
+		left.get()
+		game.handle('camera-controller').get()
+		game.getEntitiesByTag('player')
+	return (time.time() - started) / LOOKUPS * 1e6
+
+def main():
+	print('{:>8} {:>16}'.format('entities','us/frame lookups'))
+	for count in (10,1000,100000):
+		print('{:>8} {:>16.3f}'.format(count,measure(count)))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,112 @@
+# coding=UTF-8
+
+'''
+Стоимость шага движения для 10000 движущихся сущностей: кортежи в каждой
+сущности (как GameEntity.mixin.Movement и PlayerBase.update) против одного
+векторного шага MovementStore и шага ListStore (хранилище без NumPy).
+Чтение тоже замеряется: атрибуты-кортежи, свойства StoredMovement и чтение
+столбца хранилища за раз (movement.values), как у столкновений и трансляции,
+и поиск сдвинутых для сетки отсечения (moved) против сравнения по одной.
+'''
+
+import time
+
+import movement
+
+from movement import ListStore, MovementStore, StoredMovement
+
+COUNT = 10000
+STEPS = 100
+DT = 1.0 / 60
+
+class TupleMover(object):
+	def __init__(self,i):
+		self.position = (float(i),0.0)
+		self.velocity = (100.0,float(i % 7))
+		self.rotation = 0.0
+		self.angularVelocity = 10.0
+
+	def step(self,dt):
+		self.velocity = self.velocity[0], self.velocity[1] - 2000 * dt
+		self.position = self.position[0] + self.velocity[0] * dt, self.position[1] + self.velocity[1] * dt
+		self.rotation += self.angularVelocity * dt
+
+class StoredMover(StoredMovement):
+	def __init__(self,i):
+		self.position = (float(i),0.0)
+		self.velocity = (100.0,float(i % 7))
+		self.angularVelocity = 10.0
+
+def _time(fn):
+	started = time.time()
+	for i in range(STEPS):
+		fn()
+	return (time.time() - started) / STEPS * 1000.0
+
+def main():
+	print('numpy: {}'.format('yes' if movement.ENABLED else 'no'))
+	movers = [TupleMover(i) for i in range(COUNT)]
+
+	def tupleStep():
+		for m in movers:
+			m.step(DT)
+	print('{:>24} {:>10.3f} ms/tick'.format('tuples',_time(tupleStep)))
+
+	def tupleRead():
+		for m in movers:
+			m.position
+	print('{:>24} {:>10.3f} ms/tick'.format('read tuples',_time(tupleRead)))
+
+	lists = ListStore()
+	for i in range(COUNT):
+		lists.attach(StoredMover(i))
+	print('{:>24} {:>10.3f} ms/tick'.format('list store',_time(lambda: lists.integrate(DT))))
+	if not movement.ENABLED:
+		return
+
+	store = MovementStore()
+	stored = [StoredMover(i) for i in range(COUNT)]
+	for m in stored:
+		store.attach(m)
+
+	def storeStep():
+		# Гравитация тоже одним действием над столбцом скоростей.
+		store.vel[:store.size,1] -= 2000 * DT
+		store.integrate(DT)
+	print('{:>24} {:>10.3f} ms/tick'.format('store',_time(storeStep)))
+
+	def readAll():
+		for m in stored:
+			m.position
+	print('{:>24} {:>10.3f} ms/tick'.format('read properties',_time(readAll)))
+	print('{:>24} {:>10.3f} ms/tick'.format('read movement.values',_time(lambda: movement.values(stored))))
+
+	# Отсечение: половина стоит, половина двигается.
+	store.vel[:COUNT // 2] = 0
+	seen = {m: m.position for m in stored}
+	def compareEach():
+		store.integrate(DT)
+		for m in stored:
+			p = m.position
+			if seen[m] != p:
+				seen[m] = p
+	def compareArrays():
+		store.integrate(DT)
+		store.moved()
+	print('{:>24} {:>10.3f} ms/tick'.format('moved: one by one',_time(compareEach)))
+	print('{:>24} {:>10.3f} ms/tick'.format('moved: store.moved()',_time(compareArrays)))
+	store.vel[:COUNT] = [(100.0,float(i % 7)) for i in range(COUNT)]
+
+	# Оба способа дают одни и те же положения.
+	check = TupleMover(3)
+	other = stored[3]
+	store.pos[3] = check.position = (3.0,0.0)
+	store.vel[3] = check.velocity = (100.0,3.0)
+	for i in range(10):
+		check.step(DT)
+		store.vel[3,1] -= 2000 * DT
+		store.integrate(DT)
+	assert other.position == check.position, (other.position,check.position)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,32 @@
+# coding=UTF-8
+
+'''
+Стоимость шага и подготовки вершин для 100, 1000 и 10000 живых искр.
+'''
+
+import time
+
+import particles
+
+from particles import ParticleEmitter
+
+STEPS = 200
+
+def measure(count):
+	e = ParticleEmitter(capacity=count,seed=0)
+	started = time.time()
+	for i in range(STEPS):
+		# Отжившие искры сразу заменяются новыми, живых всегда count.
+		e.emit(0.0,0.0,count - e.count,speed=(100.0,300.0),life=(0.2,0.6))
+		e.step(1.0 / 60)
+		e.quads()
+	return (time.time() - started) / STEPS * 1000.0
+
+def main():
+	print('numpy: {}'.format('yes' if particles.numpy is not None else 'no'))
+	print('{:>8} {:>12}'.format('sparks','ms/tick'))
+	for count in (100,1000,10000):
+		print('{:>8} {:>12.3f}'.format(count,measure(count)))
+
+if __name__ == '__main__':
+	main()
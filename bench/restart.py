@@ -0,0 +1,48 @@
+# coding=UTF-8
+
+'''
+Начало следующего раунда: новая игра (уровень, бойцы, снимок начала, как
+новый GameScreen) против возврата той же игры к снимку (Match.restart, как
+GameScreen.nextRound). Между раундами играется ROUND_TICKS случайных шагов.
+'''
+
+import random
+import time
+
+from sim import Match, SIDES
+
+ROUNDS = 50
+ROUND_TICKS = 300
+
+def _play(match,rnd):
+	for t in range(ROUND_TICKS):
+		if t % 10 == 0:
+			side = rnd.choice(SIDES)
+			action = rnd.choice(('jump','hit','throw','block'))
+			match.input(side,action,True)
+		match.step()
+
+def main():
+	rnd = random.Random(0)
+	cold = 0.0
+	for r in range(ROUNDS):
+		started = time.perf_counter()
+		match = Match()
+		cold += time.perf_counter() - started
+		_play(match,rnd)
+
+	rnd = random.Random(0)
+	warm = 0.0
+	match = Match()
+	for r in range(ROUNDS):
+		started = time.perf_counter()
+		match.restart()
+		warm += time.perf_counter() - started
+		_play(match,rnd)
+		assert match.ticks == ROUND_TICKS
+
+	print('{:>10} {:>10.3f} ms/round'.format('new game',cold / ROUNDS * 1000.0))
+	print('{:>10} {:>10.3f} ms/round'.format('restart',warm / ROUNDS * 1000.0))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,45 @@
+# coding=UTF-8
+
+'''
+Стоимость шага очереди отложенных вызовов при 0, 1000 и 100000 ожидающих
+вызовов: на каждом шаге ставятся и выполняются 10 коротких и отменяется 1.
+'''
+
+import time
+
+from scheduler import Scheduler
+
+TICKS = 20000
+TICK = 1.0 / 60
+
+def _noop():
+	pass
+
+def measure(pending):
+	timers = Scheduler()
+	for i in range(pending):
+		timers.schedule(1e6 + i,_noop,owner=i % 100)
+	now = 0.0
+	started = time.time()
+	for tick in range(TICKS):
+		for i in range(10):
+			timers.schedule(now + TICK * (i % 3),_noop)
+		timers.cancel(timers.schedule(now + 1.0,_noop))
+		now += TICK
+		timers.run(now)
+	return (time.time() - started) / TICKS * 1e6
+
+def main():
+	print('{:>8} {:>12}'.format('pending','us/tick'))
+	for pending in (0,1000,100000):
+		print('{:>8} {:>12.2f}'.format(pending,measure(pending)))
+
+	timers = Scheduler()
+	for i in range(100000):
+		timers.schedule(1e6 + i,_noop,owner=i % 100)
+	started = time.time()
+	timers.cancelOwner(7)
+	print('cancelOwner of 1000 out of 100000 timers: {:.2f} ms'.format((time.time() - started) * 1e3))
+
+if __name__ == '__main__':
+	main()
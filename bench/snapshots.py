@@ -0,0 +1,63 @@
+# coding=UTF-8
+
+'''
+Снимки состояния обычного раунда (после ROUND_TICKS случайных шагов, с
+летящими гитарами и ударами в очереди): время снятия (с общими полями и
+без), восстановления, записи и чтения байтов, размер снимка и разностей.
+'''
+
+import random
+import time
+
+import snapshot
+
+from sim import Match, SIDES
+
+ROUND_TICKS = 600
+REPEAT = 2000
+
+def _us(fn,repeat=REPEAT):
+	started = time.perf_counter()
+	for i in range(repeat):
+		fn()
+	return (time.perf_counter() - started) / repeat * 1e6
+
+def main():
+	rnd = random.Random(0)
+	match = Match(seed=0)
+	game = match.game
+	for t in range(ROUND_TICKS):
+		if t % 15 == 0:
+			match.input(rnd.choice(SIDES),rnd.choice(('hit','throw','jump','block')),True)
+		match.step()
+
+	state = snapshot.capture(game)
+	data = snapshot.encode(state,game)
+	print('{} entities, {} pending calls, {} bytes'.format(len(state.entities),len(game.timers),len(data)))
+	print('{:>22} {:>10.1f} us'.format('capture',_us(lambda: snapshot.capture(game))))
+	print('{:>22} {:>10.1f} us'.format('capture (shared)',_us(lambda: snapshot.capture(game,state))))
+	print('{:>22} {:>10.1f} us'.format('restore',_us(lambda: state.restore(game))))
+	print('{:>22} {:>10.1f} us'.format('encode',_us(lambda: snapshot.encode(state,game))))
+	print('{:>22} {:>10.1f} us'.format('decode',_us(lambda: snapshot.decode(data,game))))
+
+	# Разности между соседними шагами.
+	encoder = snapshot.DeltaEncoder(game,keyframe=10 ** 9)
+	decoder = snapshot.DeltaDecoder(game)
+	previous = None
+	sizes = []
+	spent = 0.0
+	for t in range(300):
+		if t % 15 == 0:
+			match.input(rnd.choice(SIDES),rnd.choice(('hit','throw','jump','block')),True)
+		match.step()
+		started = time.perf_counter()
+		previous = snapshot.capture(game,previous)
+		message = encoder.push(previous)
+		spent += time.perf_counter() - started
+		sizes.append(len(message))
+		decoder.push(message)
+	print('{:>22} {:>10.1f} us'.format('capture + delta',spent / len(sizes) * 1e6))
+	print('{:>22} {:>10} bytes (keyframe {})'.format('delta mean',sum(sizes[1:]) // (len(sizes) - 1),sizes[0]))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,59 @@
+# coding=UTF-8
+
+'''
+Нагрузка на банк звуков: 1000 запросов в секунду при 60 кадрах в секунду.
+Меряется время в игровом потоке (play) и в разборе очереди (flush) без
+настоящего вывода звука, чтобы считалась только работа банка.
+'''
+
+import random
+import time
+
+from soundbank import SoundBank
+
+SECONDS = 10
+FPS = 60
+REQUESTS_PER_SECOND = 1000
+SOUNDS = ['rc/snd/hit.wav','rc/snd/chainsaw.wav','rc/snd/smash.wav','rc/snd/hop.wav','rc/snd/hu.wav']
+
+class _Source(object):
+	duration = 0.4
+
+class _Loaded(object):
+	source = _Source()
+
+	def get(self):
+		return self.source
+
+def main():
+	now = [0.0]
+	bank = SoundBank(load=lambda path: _Loaded(),makeVoice=object,play=lambda player,source: None,
+		clock=lambda: now[0])
+	rnd = random.Random(0)
+
+	inGame = inFlush = 0.0
+	# Остаток запросов переносится на следующий кадр: за секунду их ровно REQUESTS_PER_SECOND.
+	carry = 0
+	for frame in range(SECONDS * FPS):
+		carry += REQUESTS_PER_SECOND
+		perFrame, carry = divmod(carry,FPS)
+		started = time.time()
+		for i in range(perFrame):
+			bank.play(rnd.choice(SOUNDS))
+		inGame += time.time() - started
+
+		started = time.time()
+		bank.flush()
+		inFlush += time.time() - started
+		now[0] += 1.0 / FPS
+
+	frames = SECONDS * FPS
+	print('play() in game thread: {:.2f} us/frame, {:.3f} us/request'.format(
+		inGame / frames * 1e6,inGame / bank.stats['requested'] * 1e6))
+	print('flush() between frames: {:.2f} us/frame'.format(inFlush / frames * 1e6))
+	print('requested {} ({:.0f}/s), dropped {}'.format(bank.stats['requested'],
+		bank.stats['requested'] / float(SECONDS),bank.stats['dropped']))
+	print(bank.stats)
+
+if __name__ == '__main__':
+	main()
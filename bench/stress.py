@@ -0,0 +1,151 @@
+# coding=UTF-8
+
+'''
+Нагрузочные сцены из настоящих классов игры: N TestEntity, M Hurter,
+K искр (SparksEntity) и T сущностей с тегом camera-target для FightingCameraController.
+Для каждой сцены - шагов в секунду, медиана и 99-й процентиль времени шага,
+пик выделенной памяти. Результаты пишутся в JSON и сравниваются с базовыми:
+
+	$ python -m bench.stress --save-baseline
+	$ python -m bench.stress              # код возврата 1, если стало хуже
+'''
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from fwk.game.entity import GameEntity
+
+from sim import Match
+from fighters import TestEntity, Hurter, SparksEntity
+
+BASELINE = os.path.join(os.path.dirname(__file__),'baseline.json')
+
+# Имя: (TestEntity, Hurter, искры, camera-target).
+SCENES = {
+	'empty': (0,0,0,0),
+	'movers-1000': (1000,0,0,0),
+	'hurters-500': (0,500,0,0),
+	'sparks-2000': (0,0,2000,0),
+	'targets-5000': (0,0,0,5000),
+	'mixed': (300,200,500,2000),
+}
+
+TICKS = 600
+MEMORY_TICKS = 60
+
+class CameraTarget(GameEntity):
+	'''
+	Неподвижная сущность, за которой следит камера.
+	'''
+	def spawn(self):
+		self.addTags('camera-target')
+
+class Scene(object):
+	def __init__(self,movers,hurters,fx,targets):
+		self.match = Match(roundTime=1e9)
+		game = self.game = self.match.game
+		for i in range(movers):
+			game.addEntity(TestEntity())
+		owner = self.match.players['left']
+		for i in range(hurters):
+			# Высоко над ареной: проверяются все, но никто не попадает и не исчезает.
+			Hurter.static_init(game=game,owner=owner,position=(i % 200 * 10 - 1000,5000 + i // 200 * 10),
+				velocity=(0,0),ttl=1e9,damage=0,radius=16,level=1)
+		for i in range(targets):
+			e = CameraTarget()
+			game.addEntity(e)
+			e.position = (i % 100 * 20 - 1000,i // 100 * 20)
+		self.fx = fx
+		self.sparks = SparksEntity.get(game)
+
+	def step(self):
+		# Искры живут до 0.6 с, новые удары добавляются, чтобы их всё время было около fx.
+		sparks = self.sparks
+		while sparks.count() < self.fx:
+			sparks.burst(Hurter._FX_PICS['hit'],(self.game.random.uniform(-500,500),self.game.random.uniform(0,300)))
+		self.match.step()
+
+def _percentile(values,q):
+	values = sorted(values)
+	return values[min(len(values) - 1,int(q * len(values)))]
+
+def measure(params,ticks=TICKS):
+	scene = Scene(*params)
+	times = []
+	clock = time.perf_counter
+	started = clock()
+	for i in range(ticks):
+		t = clock()
+		scene.step()
+		times.append(clock() - t)
+	elapsed = clock() - started
+
+	# Память меряется отдельным коротким прогоном: tracemalloc сильно замедляет шаги.
+	tracemalloc.start()
+	scene = Scene(*params)
+	for i in range(MEMORY_TICKS):
+		scene.step()
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {'ticksPerSec': ticks / max(elapsed,1e-9),'p50Ms': _percentile(times,0.5) * 1000.0,
+		'p99Ms': _percentile(times,0.99) * 1000.0,'peakKb': peak / 1024.0}
+
+def compare(results,baseline,tolerance):
+	'''
+	Сцены, где шагов в секунду или p99 стало хуже базовых больше чем на tolerance.
+	'''
+	worse = []
+	for name, res in sorted(results.items()):
+		base = baseline.get(name)
+		if base is None:
+			print('no baseline for scene {}, not compared'.format(name))
+			continue
+		if res['ticksPerSec'] < base['ticksPerSec'] * (1.0 - tolerance):
+			worse.append('{}: {:.0f} ticks/s, baseline {:.0f}'.format(name,res['ticksPerSec'],base['ticksPerSec']))
+		if res['p99Ms'] > base['p99Ms'] * (1.0 + tolerance):
+			worse.append('{}: p99 {:.3f} ms, baseline {:.3f}'.format(name,res['p99Ms'],base['p99Ms']))
+	return worse
+
+def main():
+	parser = argparse.ArgumentParser(description='Headless stress scenes for the game loop.')
+	parser.add_argument('--ticks',type=int,default=TICKS)
+	parser.add_argument('--scene',action='append',choices=sorted(SCENES),help='run only these scenes')
+	parser.add_argument('--out',default='bench-results.json')
+	parser.add_argument('--baseline',help='baseline file (default {}); a missing one given here is an error'.format(BASELINE))
+	parser.add_argument('--save-baseline',action='store_true',help='store results as the new baseline')
+	parser.add_argument('--tolerance',type=float,default=0.15)
+	args = parser.parse_args()
+	explicit = args.baseline is not None
+	if not explicit:
+		args.baseline = BASELINE
+
+	results = {}
+	print('{:>14} {:>10} {:>9} {:>9} {:>10}'.format('scene','ticks/s','p50 ms','p99 ms','peak KiB'))
+	for name in args.scene or sorted(SCENES):
+		res = results[name] = measure(SCENES[name],args.ticks)
+		print('{:>14} {ticksPerSec:>10.0f} {p50Ms:>9.3f} {p99Ms:>9.3f} {peakKb:>10.0f}'.format(name,**res))
+
+	report = {'python': platform.python_version(),'machine': platform.machine(),'ticks': args.ticks,'scenes': results}
+	with open(args.save_baseline and args.baseline or args.out,'w') as f:
+		json.dump(report,f,indent=1,sort_keys=True)
+	if args.save_baseline:
+		return 0
+	if not os.path.exists(args.baseline):
+		print('No baseline {}, comparison skipped (create it with --save-baseline)'.format(args.baseline))
+		return 2 if explicit else 0
+
+	with open(args.baseline) as f:
+		baseline = json.load(f)['scenes']
+	worse = compare(results,baseline,args.tolerance)
+	for line in worse:
+		print('REGRESSION '+line)
+	return 1 if worse else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Сборка ресурсов: кадры всех анимаций из rc/ani/*.json упаковываются в атласы
+rc/atlas/atlas-N.png, описания анимаций компилируются в rc/ani.bundle.
+Прозрачные поля картинок обрезаются: в атлас идёт только непрозрачная часть.
+
+	$ python build_assets.py
+
+Работает без pyglet: PNG (8 бит на канал, без чересстрочности) читается и
+пишется здесь же.
+'''
+
+import glob
+import json
+import os
+import struct
+import zlib
+
+import bundle
+
+ATLAS_DIR = 'rc/atlas'
+ATLAS_SIZE = 2048
+# Прозрачная рамка вокруг кадра, чтобы при фильтрации не подмешивались соседи.
+PADDING = 1
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_CHANNELS = {0: 1,2: 3,4: 2,6: 4}
+
+def _paeth(a,b,c):
+	p = a + b - c
+	pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+	if pa <= pb and pa <= pc:
+		return a
+	if pb <= pc:
+		return b
+	return c
+
+def readPNG(filename):
+	'''
+	Возвращает (ширина, высота, строки RGBA сверху вниз).
+	'''
+	with open(filename,'rb') as f:
+		data = f.read()
+	if data[:8] != _PNG_SIGNATURE:
+		raise ValueError('Not a PNG file: '+filename)
+	pos = 8
+	idat = []
+	while pos < len(data):
+		size, kind = struct.unpack_from('>I4s',data,pos)
+		chunk = data[pos+8:pos+8+size]
+		if kind == b'IHDR':
+			w, h, depth, ctype, comp, filt, interlace = struct.unpack('>IIBBBBB',chunk)
+		elif kind == b'IDAT':
+			idat.append(chunk)
+		pos += 12 + size
+	if depth != 8 or interlace or ctype not in _CHANNELS:
+		raise ValueError('Unsupported PNG format: '+filename)
+
+	bpp = _CHANNELS[ctype]
+	stride = w * bpp
+	raw = zlib.decompress(b''.join(idat))
+	rows = []
+	prev = bytearray(stride)
+	for y in range(h):
+		start = y * (stride + 1)
+		ft = raw[start]
+		line = bytearray(raw[start+1:start+1+stride])
+		if ft == 1:
+			for i in range(bpp,stride):
+				line[i] = (line[i] + line[i-bpp]) & 0xff
+		elif ft == 2:
+			for i in range(stride):
+				line[i] = (line[i] + prev[i]) & 0xff
+		elif ft == 3:
+			for i in range(stride):
+				left = line[i-bpp] if i >= bpp else 0
+				line[i] = (line[i] + ((left + prev[i]) >> 1)) & 0xff
+		elif ft == 4:
+			for i in range(stride):
+				left = line[i-bpp] if i >= bpp else 0
+				upleft = prev[i-bpp] if i >= bpp else 0
+				line[i] = (line[i] + _paeth(left,prev[i],upleft)) & 0xff
+		rows.append(line)
+		prev = line
+
+	if ctype != 6:
+		rows = [_toRGBA(line,ctype) for line in rows]
+	return w, h, rows
+
+def _toRGBA(line,ctype):
+	out = bytearray()
+	if ctype == 2:
+		for i in range(0,len(line),3):
+			out += line[i:i+3] + b'\xff'
+	elif ctype == 0:
+		for v in line:
+			out += bytearray((v,v,v,255))
+	elif ctype == 4:
+		for i in range(0,len(line),2):
+			out += bytearray((line[i],line[i],line[i],line[i+1]))
+	return out
+
+def writePNG(filename,w,h,rows):
+	def chunk(kind,payload):
+		return struct.pack('>I',len(payload)) + kind + payload + struct.pack('>I',zlib.crc32(kind + payload) & 0xffffffff)
+	raw = b''.join(b'\x00' + bytes(line) for line in rows)
+	with open(filename,'wb') as f:
+		f.write(_PNG_SIGNATURE)
+		f.write(chunk(b'IHDR',struct.pack('>IIBBBBB',w,h,8,6,0,0,0)))
+		f.write(chunk(b'IDAT',zlib.compress(raw,9)))
+		f.write(chunk(b'IEND',b''))
+
+def pack(sizes,pageSize,padding):
+	'''
+	Полочная упаковка: сначала высокие. sizes - {ключ: (ширина, высота)}.
+	Возвращает {ключ: (страница, x, y сверху)} и список фактических размеров страниц.
+	'''
+	order = sorted(sizes,key=lambda k: (-sizes[k][1],-sizes[k][0],k))
+	places = {}
+	pages = []
+	page = x = y = shelf = 0
+	for k in order:
+		w, h = sizes[k][0] + 2*padding, sizes[k][1] + 2*padding
+		if w > pageSize or h > pageSize:
+			raise ValueError('Frame {} does not fit into {}px atlas'.format(k,pageSize))
+		if x + w > pageSize:
+			x, y, shelf = 0, y + shelf, 0
+		if y + h > pageSize:
+			pages.append(None)
+			page, x, y, shelf = page + 1, 0, 0, 0
+		if len(pages) <= page:
+			pages.append(None)
+		places[k] = (page,x + padding,y + padding)
+		x += w
+		shelf = max(shelf,h)
+	# Каждая страница обрезается до занятой части: степень двойки pyglet не нужна,
+	# а лишние пиксели пришлось бы декодировать и загружать в видеопамять.
+	used = [[0,0] for p in pages]
+	for k, (p, px, py) in places.items():
+		used[p][0] = max(used[p][0],px + sizes[k][0] + padding)
+		used[p][1] = max(used[p][1],py + sizes[k][1] + padding)
+	return places, [tuple(u) for u in used]
+
+def opaqueBounds(w,h,rows):
+	'''
+	(x, y сверху, ширина, высота) непрозрачной части картинки; вся картинка, если она пустая.
+	'''
+	ys = [y for y in range(h) if any(rows[y][3::4])]
+	if not ys:
+		return 0, 0, w, h
+	top, bottom = ys[0], ys[-1]
+	xs = [x for x in range(w) if any(rows[y][x*4+3] for y in range(top,bottom+1))]
+	return xs[0], top, xs[-1] - xs[0] + 1, bottom - top + 1
+
+def build(aniGlob='rc/ani/*.json',atlasDir=ATLAS_DIR,bundlePath=bundle.BUNDLE_PATH):
+	descriptions = {}
+	for path in sorted(glob.glob(aniGlob)):
+		with open(path) as f:
+			descriptions[path.replace(os.sep,'/')] = json.load(f)
+
+	images = {}
+	# Картинки, у кадров которых есть "rect", не обрезаются: rect задан от всей картинки.
+	whole = set()
+	for desc in descriptions.values():
+		for frames in desc.values():
+			for frame in frames:
+				if frame['img'] not in images:
+					images[frame['img']] = readPNG(frame['img'])
+				if 'rect' in frame:
+					whole.add(frame['img'])
+
+	# {картинка: (x, y сверху, ширина, высота)} - часть, которая идёт в атлас.
+	trims = {}
+	for k, (w, h, rows) in images.items():
+		trims[k] = (0,0,w,h) if k in whole else opaqueBounds(w,h,rows)
+	places, pages = pack({k: (tw,th) for k, (tx,ty,tw,th) in trims.items()},ATLAS_SIZE,PADDING)
+
+	if not os.path.isdir(atlasDir):
+		os.makedirs(atlasDir)
+	atlases = []
+	for p, (pw, ph) in enumerate(pages):
+		canvas = [bytearray(pw*4) for y in range(ph)]
+		for k, (page, x, y) in places.items():
+			if page != p:
+				continue
+			w, h, rows = images[k]
+			tx, ty, tw, th = trims[k]
+			for i in range(th):
+				canvas[y+i][x*4:(x+tw)*4] = rows[ty+i][tx*4:(tx+tw)*4]
+		path = '{}/atlas-{}.png'.format(atlasDir,p)
+		writePNG(path,pw,ph,canvas)
+		atlases.append((path,(pw,ph)))
+	# Страницы прошлой сборки, которых теперь нет.
+	for path in glob.glob('{}/atlas-*.png'.format(atlasDir)):
+		if path.replace(os.sep,'/') not in [a[0] for a in atlases]:
+			os.remove(path)
+
+	animations = {}
+	for path, desc in descriptions.items():
+		seqs = animations[path] = {}
+		for name, frames in desc.items():
+			seqs[name] = []
+			for frame in frames:
+				page, x, y = places[frame['img']]
+				w, h, rows = images[frame['img']]
+				tx, ty, tw, th = trims[frame['img']]
+				left, bottom, fw, fh = x, atlases[page][1][1] - y - th, tw, th
+				# Смещение обрезанной части от левого нижнего угла картинки.
+				trim = (tx,h - ty - th,w,h)
+				if 'rect' in frame:
+					r = frame['rect']
+					left, bottom, fw, fh = left + r['left'], bottom + r['bottom'], r['width'], r['height']
+					trim = (0,0,0,0)
+				seqs[name].append(bundle.Frame(page,left,bottom,fw,fh,frame['t'],frame.get('anchor','center'),
+					bundle.frameFlags(frame),trim))
+
+	bundle.write(bundlePath,atlases,animations)
+	return atlases, animations
+
+if __name__ == '__main__':
+	atlases, animations = build()
+	for path, (w, h) in atlases:
+		print('{} {}x{}'.format(path,w,h))
+	print('{} animations -> {}'.format(len(animations),bundle.BUNDLE_PATH))
@@ -0,0 +1,279 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Скомпилированные анимации: все rc/ani/*.json в одном двоичном файле, кадры
+которых ссылаются на области атласов (собирается build_assets.py). Играет их
+animated.Animated; без собранного файла те же последовательности читаются из
+json (loadJSON) и так же общие для всех бойцов.
+
+Формат (little-endian):
+	'A33B' u16 версия
+	u16 число строк, строки (u16 длина + utf-8)
+	u16 число атласов, атлас: u16 строка-путь, u16 ширина, u16 высота
+	u16 число анимаций, анимация: u16 строка-путь json, u16 строка-оригинал или 0xFFFF,
+		u16 число последовательностей, последовательность: u16 строка-имя, u16 число кадров, кадры
+	кадр: u16 атлас, u16 left, bottom, width, height, u16 trimX, trimY, fullW, fullH,
+		f32 t, u16 строка-якорь, u8 флаги
+
+Прямоугольник кадра - в пикселях атласа с началом в левом нижнем углу, как "rect"
+в описании анимации. Прозрачные поля исходной картинки в атлас не попадают:
+кадр - её часть со смещением (trimX, trimY) от левого нижнего угла картинки
+размера fullW x fullH, якорь считается от всей картинки.
+
+Анимация, которая отличается от уже записанной только transform.flip_x во всех
+кадрах (fighter-*-player-left и -player-right), записывается ссылкой на
+оригинал без последовательностей. При чтении её последовательности - те же
+кадры с отражением (Sequence.mirrored), кадры не копируются.
+'''
+
+import bisect
+import json
+import os
+import struct
+
+BUNDLE_PATH = 'rc/ani.bundle'
+
+_MAGIC = b'A33B'
+_VERSION = 3
+_NO_MIRROR = 0xFFFF
+_FRAME = struct.Struct('<9HfHB')
+
+FLAG_FLIP_X = 1
+FLAG_FLIP_Y = 2
+# В исходном кадре был "transform" (даже если без отражений).
+FLAG_TRANSFORM = 4
+
+def frameFlags(frame):
+	'''
+	Флаги кадра из описания анимации (его "transform").
+	'''
+	transform = frame.get('transform')
+	flags = 0
+	if transform is not None:
+		flags |= FLAG_TRANSFORM
+		if transform.get('flip_x'):
+			flags |= FLAG_FLIP_X
+		if transform.get('flip_y'):
+			flags |= FLAG_FLIP_Y
+	return flags
+
+class Frame(object):
+	'''
+	Кадр: область картинки img (атласа или исходной, из json). Нулевые width и
+	height - вся картинка; нулевые fullW и fullH - картинка не обрезана.
+	'''
+	__slots__ = ('atlas','left','bottom','width','height','trimX','trimY','fullW','fullH','t','anchor','flags','img')
+
+	def __init__(self,atlas,left,bottom,width,height,t,anchor,flags,trim=(0,0,0,0),img=None):
+		self.atlas = atlas
+		self.left = left
+		self.bottom = bottom
+		self.width = width
+		self.height = height
+		self.trimX, self.trimY, self.fullW, self.fullH = trim
+		self.t = t
+		self.anchor = anchor
+		self.flags = flags
+		self.img = img
+
+	def key(self):
+		return (self.atlas,self.img,self.left,self.bottom,self.width,self.height,
+			self.trimX,self.trimY,self.fullW,self.fullH,self.t,self.anchor,self.flags)
+
+class Sequence(object):
+	'''
+	Неизменяемая последовательность кадров. Отражённая (mirrored) делит кадры
+	и их времена с оригиналом, у её кадров инвертирован FLAG_FLIP_X.
+
+	cumulative - время конца каждого кадра от начала: кадр на момент t ищется
+	двоичным поиском, а не проходом по кадрам.
+	'''
+	__slots__ = ('frames','mirrored','cumulative','duration')
+
+	def __init__(self,frames,mirrored=False,cumulative=None):
+		self.frames = tuple(frames)
+		self.mirrored = mirrored
+		if cumulative is None:
+			ends = []
+			t = 0.0
+			for f in self.frames:
+				t += f.t
+				ends.append(t)
+			cumulative = tuple(ends)
+		self.cumulative = cumulative
+		self.duration = cumulative[-1] if cumulative else 0.0
+
+	def __len__(self):
+		return len(self.frames)
+
+	def mirror(self):
+		return Sequence(self.frames,not self.mirrored,self.cumulative)
+
+	def indexAt(self,t):
+		'''
+		Номер кадра через t секунд от начала; последовательность повторяется.
+		'''
+		return bisect.bisect_right(self.cumulative,t % self.duration)
+
+	def frameAt(self,t):
+		return self.frames[self.indexAt(t)]
+
+	def flags(self,frame):
+		if self.mirrored:
+			return (frame.flags ^ FLAG_FLIP_X) | FLAG_TRANSFORM
+		return frame.flags
+
+def _keys(seq,flip=False):
+	'''
+	Кадры последовательности (Sequence или список Frame) как кортежи; flip - с отражением.
+	'''
+	if isinstance(seq,Sequence):
+		frames = [(f,seq.flags(f)) for f in seq.frames]
+	else:
+		frames = [(f,f.flags) for f in seq]
+	return tuple(f.key()[:-1] + (((flags ^ FLAG_FLIP_X) | FLAG_TRANSFORM) if flip else flags,) for f, flags in frames)
+
+def findMirrors(animations):
+	'''
+	{путь: путь оригинала} для анимаций, отличающихся от более ранней (по
+	сортировке путей) только отражением по горизонтали.
+	'''
+	mirrors = {}
+	known = {}
+	for path in sorted(animations):
+		seqs = animations[path]
+		key = tuple(sorted((name,_keys(seq)) for name, seq in seqs.items()))
+		if key in known:
+			mirrors[path] = known[key]
+			continue
+		known.setdefault(tuple(sorted((name,_keys(seq,True)) for name, seq in seqs.items())),path)
+	return mirrors
+
+class Bundle(object):
+	def __init__(self,atlases,animations):
+		# [(путь, (ширина, высота))]
+		self.atlases = atlases
+		# {путь json: {имя последовательности: Sequence}}
+		self.animations = animations
+
+def write(filename,atlases,animations):
+	strings = []
+	index = {}
+	def s(value):
+		if value not in index:
+			index[value] = len(strings)
+			strings.append(value)
+		return index[value]
+
+	body = [struct.pack('<H',len(atlases))]
+	for path, (w, h) in atlases:
+		body.append(struct.pack('<3H',s(path),w,h))
+	mirrors = findMirrors(animations)
+	body.append(struct.pack('<H',len(animations)))
+	for path in sorted(animations):
+		if path in mirrors:
+			body.append(struct.pack('<3H',s(path),s(mirrors[path]),0))
+			continue
+		seqs = animations[path]
+		body.append(struct.pack('<3H',s(path),_NO_MIRROR,len(seqs)))
+		for name in sorted(seqs):
+			seq = seqs[name]
+			frames = seq.frames if isinstance(seq,Sequence) else seq
+			body.append(struct.pack('<2H',s(name),len(frames)))
+			for f in frames:
+				body.append(_FRAME.pack(f.atlas,f.left,f.bottom,f.width,f.height,
+					f.trimX,f.trimY,f.fullW,f.fullH,f.t,s(f.anchor),f.flags))
+
+	head = [_MAGIC,struct.pack('<HH',_VERSION,len(strings))]
+	for value in strings:
+		data = value.encode('utf-8')
+		head.append(struct.pack('<H',len(data)))
+		head.append(data)
+
+	with open(filename,'wb') as f:
+		f.write(b''.join(head + body))
+
+def read(filename):
+	with open(filename,'rb') as f:
+		data = f.read()
+	if data[:4] != _MAGIC:
+		raise ValueError('Not an animation bundle: '+filename)
+	version, n = struct.unpack_from('<HH',data,4)
+	if version != _VERSION:
+		raise ValueError('Unsupported animation bundle version {}: {}'.format(version,filename))
+	pos = 8
+
+	strings = []
+	for i in range(n):
+		size, = struct.unpack_from('<H',data,pos)
+		strings.append(data[pos+2:pos+2+size].decode('utf-8'))
+		pos += 2 + size
+
+	n, = struct.unpack_from('<H',data,pos)
+	pos += 2
+	atlases = []
+	for i in range(n):
+		si, w, h = struct.unpack_from('<3H',data,pos)
+		atlases.append((strings[si],(w,h)))
+		pos += 6
+
+	n, = struct.unpack_from('<H',data,pos)
+	pos += 2
+	animations = {}
+	for i in range(n):
+		si, mi, nseq = struct.unpack_from('<3H',data,pos)
+		pos += 6
+		if mi != _NO_MIRROR:
+			# Оригинал записан раньше (пути отсортированы).
+			animations[strings[si]] = {name: seq.mirror() for name, seq in animations[strings[mi]].items()}
+			continue
+		seqs = animations[strings[si]] = {}
+		for j in range(nseq):
+			ni, nframes = struct.unpack_from('<2H',data,pos)
+			pos += 4
+			frames = []
+			for k in range(nframes):
+				atlas, left, bottom, width, height, tx, ty, fw, fh, t, anchor, flags = _FRAME.unpack_from(data,pos)
+				frames.append(Frame(atlas,left,bottom,width,height,t,strings[anchor],flags,
+					(tx,ty,fw,fh),atlases[atlas][0]))
+				pos += _FRAME.size
+			seqs[strings[ni]] = Sequence(frames)
+	return Bundle(atlases,animations)
+
+def loadJSON(path):
+	'''
+	{имя: Sequence} из описания анимации rc/ani/*.json, кадры - исходные картинки.
+	'''
+	with open(path) as f:
+		desc = json.load(f)
+	seqs = {}
+	for name, frames in desc.items():
+		seq = []
+		for frame in frames:
+			r = frame.get('rect',{})
+			seq.append(Frame(0,r.get('left',0),r.get('bottom',0),r.get('width',0),r.get('height',0),
+				frame['t'],frame.get('anchor','center'),frameFlags(frame),img=frame['img']))
+		seqs[name] = Sequence(seq)
+	return seqs
+
+_BUNDLE = []
+_JSON = {}
+
+def _bundle():
+	if not _BUNDLE:
+		_BUNDLE.append(read(BUNDLE_PATH) if os.path.exists(BUNDLE_PATH) else None)
+	return _BUNDLE[0]
+
+def sequences(path):
+	'''
+	{имя: Sequence} анимации path: из собранного файла, иначе из json. Читается
+	один раз, общее для всех бойцов - менять нельзя.
+	'''
+	bundle = _bundle()
+	if bundle is not None and path in bundle.animations:
+		return bundle.animations[path]
+	seqs = _JSON.get(path)
+	if seqs is None:
+		seqs = _JSON[path] = loadJSON(path)
+	return seqs
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Пакетная проверка столкновений причинятелей ущерба (круги) с бойцами
+(прямоугольники). Условие то же, что в Hurter.intersectsPlayer.
+
+NumPy необязателен: без него и на маленьких наборах работает обычный цикл.
+Положения берутся из хранилища движения (movement.values) одним чтением, а не
+свойством каждой сущности.
+'''
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import movement
+
+# Меньше стольких пар (причинятель, боец) цикл на питоне быстрее numpy.
+VECTORIZE_MIN_PAIRS = 32
+
+def _stored(entities):
+	return all('_mslot' in e.__dict__ for e in entities)
+
+def _positions(entities):
+	if _stored(entities):
+		return movement.values(entities)
+	return [e.position for e in entities]
+
+def _hitsLoop(hurters,players):
+	hits = []
+	ppos = _positions(players)
+	for h, (x, y) in zip(hurters,_positions(hurters)):
+		r = h.radius
+		for p, (px, py) in zip(players,ppos):
+			if p is h.owner:
+				continue
+			hw, hh = p.width/2.0, p.height/2.0
+			if (x-r < px+hw) and (x+r > px-hw) and (y-r < py+hh) and (y+r > py-hh):
+				hits.append((h,p))
+	return hits
+
+def _hitsNumpy(hurters,players):
+	hpos = movement.array(hurters) if _stored(hurters) else numpy.array([h.position for h in hurters],dtype=float)
+	r = numpy.array([h.radius for h in hurters],dtype=float)[:,None]
+	ppos = movement.array(players) if _stored(players) else numpy.array([p.position for p in players],dtype=float)
+	hw = numpy.array([p.width/2.0 for p in players],dtype=float)[None,:]
+	hh = numpy.array([p.height/2.0 for p in players],dtype=float)[None,:]
+
+	pindex = {id(p): i for i, p in enumerate(players)}
+	owner = numpy.array([pindex.get(id(h.owner),-1) for h in hurters])[:,None]
+
+	x, y = hpos[:,0:1], hpos[:,1:2]
+	px, py = ppos[None,:,0], ppos[None,:,1]
+
+	mask = (x-r < px+hw) & (x+r > px-hw) & (y-r < py+hh) & (y+r > py-hh) & \
+		   (owner != numpy.arange(len(players))[None,:])
+
+	return [(hurters[i],players[j]) for i, j in zip(*numpy.nonzero(mask))]
+
+def hurterHits(hurters,players):
+	'''
+	Возвращает пары (причинятель, боец), которые пересекаются, в порядке
+	причинятелей, а для каждого - в порядке бойцов. Владелец не задевается.
+	'''
+	hurters = list(hurters)
+	players = list(players)
+	if not hurters or not players:
+		return []
+	if numpy is None or len(hurters)*len(players) < VECTORIZE_MIN_PAIRS:
+		return _hitsLoop(hurters,players)
+	return _hitsNumpy(hurters,players)
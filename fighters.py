@@ -0,0 +1,640 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Игровая логика боя: бойцы, причинятели ущерба, камера и сущности уровня.
+
+Модуль не открывает окон и не трогает звук с консолью напрямую, поэтому его
+можно использовать как из GameScreen, так и из безголовой симуляции (sim.py).
+'''
+
+import functools
+import math
+import json
+
+from fwk.game.entity import GameEntity
+
+from fwk.util.all import *
+
+from pool import Pooled
+from particles import ParticleEmitter
+from animated import Animated
+from fightgame import dormant, _setSpriteVisible
+from spatial import updateNearView
+from movement import movable
+import gamelog
+
+# Связь логики боя с окружением. GameScreen подставляет сюда настоящий звук,
+# безголовая симуляция оставляет заглушку.
+def _silence(*args):
+	pass
+
+playSound = _silence
+# Журнал событий бойцов (gamelog.py). На время служебных симуляций - gamelog.SILENT.
+LOG = gamelog.GameLog()
+
+# В безголовом режиме не загружаются спрайты, анимации и чисто визуальные сущности.
+HEADLESS = False
+
+LEVEL_CLASSES = {}
+
+def levelClass(name):
+	'''
+	GameEntity.defineClass, дополнительно запоминающий класс для loadLevel.
+	'''
+	def decorator(cls):
+		LEVEL_CLASSES[name] = cls
+		return GameEntity.defineClass(name)(cls)
+	return decorator
+
+@levelClass('test-entity')
+@dormant
+@updateNearView
+class TestEntity(*movable(Animated,GameEntity,GameEntity.mixin.Sprite,GameEntity.mixin.Movement)):
+	def spawn(self):
+		self.angularVelocity = 100
+		self.i = 0
+		self.think()
+		self.addTags('camera-target')
+
+	def think(self):
+		# if self.i > 10:
+		# 	return self.destroy()
+		self.game.scheduleAfter(1.0,self.think)
+		self.position = (self.i*10 % 40,-self.i*20 % 50)
+		# self.velocity = (self.i*2353 % 200 - 100,-self.i*5423 % 350 - 175)
+		self.velocity = (100*(-1 if self.i % 2 == 0 else 1),0)
+		self.i += 1
+
+@levelClass('camera-controller')
+class FightingCameraController(GameEntity,GameEntity.mixin.CameraTarget):
+	SNAPSHOT_FIELDS = ('position','_interp','_target_size','_pad','_offset')
+
+	def spawn(self):
+		self._target_focus = 0,0
+		self._target_size = 100, 100
+		self._pad = 600,600
+		self._interp = 1.0
+		self._offset = 0, 0
+		self.id = 'camera-controller'
+
+	def update(self,dt):
+		targets = self.game.getEntitiesByTag('camera-target')
+
+		p = self.position
+		bl = self.position # min
+		tr = self.position # max
+
+		for target in targets:
+			p = p[0] + target.position[0], p[1] + target.position[1]
+			bl = min(bl[0], target.position[0]), min(bl[1], target.position[1])
+			tr = max(tr[0], target.position[0]), max(tr[1], target.position[1])
+		p = p[0] / float(len(targets)+1), p[1] / float(len(targets)+1)
+
+		self.position = self._offset[0] + p[0] * self._interp + self.position[0] * (1.0 - self._interp), \
+						self._offset[1] + p[1] * self._interp + self.position[1] * (1.0 - self._interp)
+
+		self._target_size = 2*max(p[0]-bl[0],tr[0]-p[0]) + self._pad[0], 2*max(p[1]-bl[1],tr[1]-p[1]) + self._pad[1]
+		self._interp = math.pow(2.0,dt-1.0) / 2.0
+
+	def initCamera(self,camera):
+		self._interp = 1
+		self.updateCamera(camera)
+
+	def updateCamera(self,camera):
+		GameEntity.mixin.CameraTarget.updateCamera(self,camera)
+		iscale = 1.0/camera.scale
+		itarget_scale = max(self._target_size[0]/camera.size[0],self._target_size[1]/camera.size[1])
+		camera.scale = 1.0/(self._interp * itarget_scale + (1.0-self._interp) * iscale)
+		# if self.game.currentTime > 0.5:
+		# 	GAME_CONSOLE.visible = False
+
+class PlayerBase(*movable(Animated,GameEntity,GameEntity.mixin.Movement,GameEntity.mixin.Sprite)):
+	_MOVEMENT_LIMIT_BOTTOM = -100
+	_MOVEMENT_LIMIT_LEFT = -1000
+	_MOVEMENT_LIMIT_RIGHT = 1000
+
+	FIGHTER_NAME = 'Anonymous'
+
+	# Состояние, которое сохраняет и восстанавливает snapshot.py.
+	SNAPSHOT_FIELDS = ('position','velocity','state','health','_action_timeout','defence_level','animation','move')
+
+	events = [
+		('state-change','on_state_change'),
+		('jump','on_jump'),
+		('hit','on_hit'),
+		('block','on_block'),
+		('smash','on_smash'),
+		('throw','on_throw'),
+		('special','on_special'),
+		('hurt','on_hurt')
+	]
+
+	def spawn(self):
+		self.addTags('camera-target','player')
+
+		self.state = 'standing'
+		self.animation = 'stand'
+
+		self.width = 100
+		self.height = 200
+
+		self.defence_level = 0
+
+		self.health = 100.0
+
+		self._action_timeout = self.game.currentTime
+
+		self.move = {}
+
+	def actionTimeoutAtLeast(self,timeout):
+		self._action_timeout = max(self._action_timeout,self.game.currentTime+timeout)
+
+	def checkActionTimeout(self):
+		return self._action_timeout < self.game.currentTime
+
+	def update(self,dt):
+		self.velocity = self.velocity[0], self.velocity[1] - 2000 * dt
+		if self.position[1] <= PlayerBase._MOVEMENT_LIMIT_BOTTOM \
+			and self.state not in ('block','lying'):
+			self.changeState('standing')
+		self.position = min(PlayerBase._MOVEMENT_LIMIT_RIGHT,max(PlayerBase._MOVEMENT_LIMIT_LEFT,self.position[0])), \
+						max(PlayerBase._MOVEMENT_LIMIT_BOTTOM,self.position[1])
+		if self.id == 'player-right':
+			left = self.opponent.get()
+			if (self.position[0]-self.width/2) <= (left.position[0]+left.width/2):
+				self.velocity = 0, self.velocity[1]
+				# if self.state == 'standing':
+				# 	self.animation = 'stand'
+				self.position = left.position[0]+(left.width+self.width)/2, self.position[1]
+		elif self.id == 'player-left':
+			right = self.opponent.get()
+			if (self.position[0]+self.width/2) >= (right.position[0]-right.width/2):
+				self.velocity = 0, self.velocity[1]
+				# if self.state == 'standing':
+				# 	self.animation = 'stand'
+				self.position = right.position[0] - (self.width + right.width)/2, self.position[1]
+		self.update_go()
+
+	def changeState(self,to,fromState=None):
+		if fromState is None or fromState == self.state:
+			if self.state != to:
+				self.state = to
+				self.trigger('state-change')
+
+	def on_state_change(self):
+		self.defence_level = 0
+		self.logEvent('state-change',self.state)
+		if self.state == 'jump':
+			self.animation = 'jump'
+		elif self.state == 'block':
+			self.defence_level = 10
+		elif self.state == 'lying':
+			self.animation = 'lying'
+		else:
+			self.animation = 'stand'
+
+	def hurt(self,hurter):
+		if self.defence_level < hurter.level:
+			self.health -= hurter.damage
+			self.trigger('hurt',hurter.damage)
+			idst = distance(self.position,hurter.position)
+			self.velocity = self.velocity[0], self.velocity[1] + 1000*(self.position[1] - hurter.position[1])/idst
+		else:
+			k = hurter.level / self.defence_level
+
+		if self.health <= 0:
+			self.health = 0
+			# TODO: player defeat
+			self.game.unsetEntityTags(self,'camera-target')
+			self.changeState('lying')
+			self.game.trigger('win',hurter.owner)
+			return
+
+	def specialAvailiable(self):
+		return False
+
+	def update_go(self):
+		vx = 0
+		if self.checkActionTimeout() and self.state != 'lying':
+			for d,t in self.move.items():
+				if t:
+					vx += d
+			vx *= 1000
+		self.velocity = vx, self.velocity[1]
+
+	def do_go(self,direction):
+		if self.state != 'lying':
+			self.move[direction] = True
+
+	def stop_go(self,direction):
+		self.move[direction] = False
+
+	def do_hit(self):
+		if (not self.checkActionTimeout()) or self.health <= 0:
+			return
+		self.animation = 'hit'
+		if self.state == 'standing':
+			self.actionTimeoutAtLeast(0.3)
+			self.game.scheduleAfter(0.2, functools.partial(self.trigger,'hit'), owner=self)
+		elif self.state == 'jump':
+			self.actionTimeoutAtLeast(0.7)
+			self.game.scheduleAfter(0.2, functools.partial(self.trigger,'smash'), owner=self)
+
+	def do_block(self):
+		if not self.checkActionTimeout():
+			return
+		if self.state == 'standing':
+			self.changeState('block')
+			self.logEvent('block-start')
+			self.trigger('block')
+			self.animation = 'block'
+
+	def stop_block(self):
+		self.logEvent('block-end')
+		self.changeState(to='standing',fromState='block')
+
+	def do_throw(self):
+		if not self.checkActionTimeout():
+			return
+		if self.state in ('standing','block'):
+			self.changeState('standing')
+			self.animation = 'throw'
+			self.actionTimeoutAtLeast(2.4)
+			self.game.scheduleAfter(0.2, functools.partial(self.trigger,'throw'), owner=self)
+
+	def do_special(self):
+		if not self.checkActionTimeout():
+			return
+		if self.specialAvailiable():
+			self.trigger('special')
+
+	def do_jump(self):
+		if not self.checkActionTimeout():
+			return
+		if self.state in ('standing','block'):
+			self.velocity = self.velocity[0], 1000
+			self.changeState('jump')
+			self.trigger('jump')
+
+	def faceToTarget(self, x):
+		return x if (self.id == 'player-left') else -x
+
+	def returnGuitar(self,ttl):
+		'''
+		Брошенная гитара на обратном пути (вызывается через ttl после броска).
+		Отложенные вызовы - методы и functools.partial, чтобы снимок их сохранял.
+		'''
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(self.position[0]+self.faceToTarget(100+2500),self.position[1]-100),
+			velocity=(-self.faceToTarget(2000),0),
+			ttl=ttl,damage=12,radius=100,level=11,type_='guitar')
+
+	def logEvent(self,event,*args):
+		LOG.write(gamelog.INFO,self.game.ticks,self.id,event,*args)
+
+
+class Hurter(*movable(Pooled,GameEntity,GameEntity.mixin.Movement)):
+	'''
+	Причинятор ущерба.
+	'''
+	__slots__ = ('_pool','active','owner','damage','radius','level','type_')
+
+	SNAPSHOT_FIELDS = ('active','position','velocity','owner','damage','radius','level','type_')
+
+	_FX_PICS = {'hit':['rc/img/star-hit-0.png'],'smash':['rc/img/star-smash-0.png'],'guitar':['rc/img/star-guitar-0.png']}
+
+	@staticmethod
+	def static_init(game,owner,position,velocity,ttl,damage,radius,level,type_='hit'):
+		self = game.pool(Hurter).acquire()
+
+		self.position = position
+		self.velocity = velocity
+		self.owner = owner
+		self.damage = damage
+		self.radius = radius
+		self.level = level
+		self.type_ = type_
+		self.releaseAfter(ttl)
+		self.sprite = "rc/img/32x32fg.png"
+		self.scale = (self.radius/16.0)
+		return self
+
+	def activate(self):
+		self.addTags('hurter')
+
+	def deactivate(self):
+		self.game.unsetEntityTags(self,'hurter')
+		self.velocity = 0, 0
+		self.owner = None
+
+	def intersectsPlayer(self,player):
+		px,py = player.position
+		x,y = self.position
+		return (x-self.radius < px+player.width/2) and\
+			   (x+self.radius > px-player.width/2) and\
+			   (y-self.radius < py+player.height/2) and\
+			   (y+self.radius > py-player.height/2)
+
+	def spawnFx(self,player):
+		if HEADLESS:
+			return
+		p = (self.position[0] + player.position[0]) / 2.0, (self.position[1] + player.position[1]) / 2.0
+		SparksEntity.get(self.game).burst(self._FX_PICS[self.type_],p)
+
+	def hit(self,player):
+		self.spawnFx(player)
+		player.hurt(self)
+		self._sprite = None
+
+@levelClass('static-entity')
+@dormant
+class StaticEntity(GameEntity,GameEntity.mixin.Sprite):
+	'''
+	Просто статическая спрайтовая сущность с нестандартным z-индексом.
+	'''
+	z_index = -1
+	decorative = True
+	CULL = True
+
+@levelClass('background-entity')
+@dormant
+class BGEntity(GameEntity,GameEntity.mixin.Sprite):
+	z_index = -2
+	decorative = True
+	CULL = True
+	CULL_MOVES = True
+
+	def on_configured(self):
+		self._base_pos = self.position
+		self._ctl = self.game.handle('camera-controller')
+		# Параллакс пересчитывается, только когда камера сдвинулась.
+		self.game.watch(self,self._ctl)
+
+	def update(self,dt):
+		ctl = self._ctl.get()
+		if ctl is not None:
+			self.position = 0.5*(self._base_pos[0] + ctl.position[0]), \
+							0.5*(self._base_pos[1] + ctl.position[1])
+
+
+class SparksEntity(GameEntity):
+	'''
+	Все искры от ударов: по эмиттеру частиц на картинку, без сущности на искру.
+	Рисует их GameLayer (game.py), каждый эмиттер - одним вызовом.
+	'''
+	z_index = 1000
+	# Большая звезда, как раньше, и столько мелких искр на удар.
+	SPARKS_PER_HIT = 24
+
+	@staticmethod
+	def get(game):
+		sparks = game.handle('sparks').get()
+		if sparks is None:
+			sparks = SparksEntity()
+			game.addEntity(sparks)
+		return sparks
+
+	def spawn(self):
+		self.id = 'sparks'
+		self.emitters = {}
+
+	def emitter(self,path):
+		e = self.emitters.get(path)
+		if e is None:
+			e = self.emitters[path] = ParticleEmitter(seed=len(self.emitters))
+		return e
+
+	def burst(self,pics,position):
+		# Из генератора игры: повтор и откат выбирают ту же картинку.
+		e = self.emitter(pics[0] if len(pics) == 1 else self.game.random.choice(pics))
+		x, y = position
+		e.emit(x,y,1,spin=(10.0,10.0),size=0.5,grow=2.0)
+		e.emit(x,y,self.SPARKS_PER_HIT,speed=(120.0,360.0),spin=(-400.0,400.0),life=(0.25,0.5),size=0.3,grow=-0.25)
+
+	def update(self,dt):
+		for e in self.emitters.values():
+			e.step(dt)
+
+	def count(self):
+		return sum(e.count for e in self.emitters.values())
+
+class NaotaFighter(PlayerBase):
+	FIGHTER_NAME = 'Naota'
+	ICON_IMAGE = 'rc/img/fg-boy-st.png'
+	ICON_IMAGE_L = 'rc/img/fg-boy-st-l.png'
+	z_index = 134
+
+	def on_configured(self):
+		if not HEADLESS:
+			self.animations = 'rc/ani/fighter-naota-'+self.id+'.json'
+
+	# def on_block(self):
+	# 	self.defence_level = 10
+
+	def on_hit(self):
+		px,py=self.position
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(px+self.faceToTarget(50),py),
+			velocity=(self.faceToTarget(1000),0),
+			ttl=0.150,damage=5,radius=16,level=1,type_='hit')
+		playSound('rc/snd/hit.wav')
+		self.logEvent('strike')
+
+	def on_hurt(self, damage):
+		self.logEvent('damaged',damage)
+
+	def on_smash(self):
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(self.position[0]+self.faceToTarget(0),self.position[1]+200),
+			velocity=(self.faceToTarget(1000),-2000),
+			ttl=0.3,damage=15,radius=100,level=1,type_='smash')
+		playSound('rc/snd/smash.wav')
+		self.logEvent('smashing')
+
+	def on_throw(self):
+		# время полёта в одну сторону подобрано в ручную
+		local_ttl = 1.2
+		FlyingGuitar.static_init(
+			game=self.game,
+			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
+			velocity=(self.faceToTarget(2000),0),
+			angularVelocity=(self.faceToTarget(720)),
+			sprite="rc/img/fg-boy-guitar.png",
+			ttl=local_ttl
+		)
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
+			velocity=(self.faceToTarget(2000),0),
+			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar')
+		self.game.scheduleAfter(local_ttl,functools.partial(self.returnGuitar,local_ttl),owner=self)
+		playSound('rc/snd/chainsaw.wav')
+		self.logEvent('throw')
+
+	def on_jump(self):
+		playSound('rc/snd/hop.wav')
+
+class HarukoFighter(PlayerBase):
+	FIGHTER_NAME = 'Haruko'
+	ICON_IMAGE = 'rc/img/fg-girl-st.png'
+	ICON_IMAGE_L = 'rc/img/fg-girl-st-l.png'
+	z_index=100
+
+	def on_configured(self):
+		if not HEADLESS:
+			self.animations = 'rc/ani/fighter-haruko-'+self.id+'.json'
+
+	# def on_block(self):
+	# 	self.defence_level = 10
+
+	def on_hit(self):
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=self.position,
+			velocity=(self.faceToTarget(2000),0),
+			ttl=0.150,damage=5,radius=16,level=1,type_='hit')
+		playSound('rc/snd/hit.wav')
+		self.logEvent('strike')
+
+	def on_hurt(self, damage):
+		self.logEvent('damaged',damage)
+
+	def on_smash(self):
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(self.position[0]+self.faceToTarget(100),self.position[1]+200),
+			velocity=(self.faceToTarget(1000),-2000),
+			ttl=0.3,damage=15,radius=100,level=1,type_='smash')
+		playSound('rc/snd/smash.wav')
+		self.logEvent('smashing')
+
+	def on_throw(self):
+		# время полёта в одну сторону подобрано в ручную
+		local_ttl = 1.2
+		FlyingGuitar.static_init(
+			game=self.game,
+			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
+			velocity=(self.faceToTarget(2000),0),
+			angularVelocity=(self.faceToTarget(720)),
+			sprite="rc/img/fg-girl-guitar.png",
+			ttl=local_ttl
+		)
+		Hurter.static_init(
+			game=self.game,
+			owner=self,
+			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
+			velocity=(self.faceToTarget(2000),0),
+			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar')
+		self.game.scheduleAfter(local_ttl,functools.partial(self.returnGuitar,local_ttl),owner=self)
+		playSound('rc/snd/chainsaw.wav')
+		self.logEvent('throw')
+
+	def on_jump(self):
+		playSound('rc/snd/hu.wav')
+
+class AtomskFighter(PlayerBase):
+	FIGHTER_NAME = 'Atomsk'
+	pass
+
+class FlyingGuitar(*movable(Pooled,GameEntity,GameEntity.mixin.Movement,GameEntity.mixin.Sprite)):
+	__slots__ = ('_pool','active','ttl','_spritePath')
+
+	SNAPSHOT_FIELDS = ('active','position','velocity','angularVelocity','rotation','ttl')
+
+	@staticmethod
+	def static_init(game,position,velocity,angularVelocity,sprite,ttl):
+		self = game.pool(FlyingGuitar).acquire()
+
+		self.ttl = ttl
+		self.position = position
+		self.velocity = velocity
+		self.angularVelocity = angularVelocity
+		self.after(self.ttl, self.changeDirection)
+		if not HEADLESS:
+			# Текстура меняется, только если гитару бросает другой боец.
+			if getattr(self,'_spritePath',None) != sprite:
+				self.sprite = sprite
+				self.spriteAnchor = 'center'
+				self._spritePath = sprite
+		# self.scale = (self.radius/16.0)
+		return self
+
+	def activate(self):
+		_setSpriteVisible(self,True)
+
+	def deactivate(self):
+		self.velocity = 0, 0
+		self.angularVelocity = 0
+		_setSpriteVisible(self,False)
+
+	def changeDirection(self):
+		vx,vy =  self.velocity
+		self.velocity = (-vx,vy)
+		self.angularVelocity = - self.angularVelocity
+		self.releaseAfter(self.ttl)
+
+ROUND_TIME = 60
+
+PLAYER_VARIANTS = [HarukoFighter,NaotaFighter]
+PLAYER_DEFAULTS = {'player-left': NaotaFighter, 'player-right': HarukoFighter}
+PLAYER_CHOICES = {'player-left': NaotaFighter, 'player-right': HarukoFighter}
+PLAYER_NEXT = {NaotaFighter: HarukoFighter, HarukoFighter: NaotaFighter}
+
+def spawnPlayers(game,choices=None):
+	'''
+	Создаёт бойцов на стартовых позициях, как в начале раунда.
+	'''
+	choices = PLAYER_CHOICES if choices is None else choices
+	for pid, pcl in choices.items():
+		p = pcl()
+		game.addEntity(p)
+		# p.animations = 'rc/ani/player-test-'+pid+'.json'
+		p.position = 500 if pid == 'player-right' else -500, 0
+		p.id = pid
+		p.opponent = game.handle('player-left' if pid == 'player-right' else 'player-right')
+		p.trigger('configured')
+
+def loadLevel(game,filename):
+	'''
+	Загружает уровень. В безголовом режиме пропускает декоративные сущности.
+	'''
+	if not HEADLESS:
+		return game.loadFromJSON(filename)
+	with open(filename) as f:
+		desc = json.load(f)
+	for ed in desc['entities']:
+		cls = LEVEL_CLASSES[ed['_class']]
+		if getattr(cls,'decorative',False):
+			continue
+		e = cls()
+		game.addEntity(e)
+		for k, v in ed.items():
+			if k != '_class':
+				setattr(e,k,tuple(v) if isinstance(v,list) else v)
+		e.trigger('configured')
+
+def roundWinner(game):
+	'''
+	Победитель раунда по истечении времени: у кого больше здоровья. None - ничья.
+	'''
+	pl = game.getEntityById('player-left')
+	pr = game.getEntityById('player-right')
+
+	if pl.health > pr.health:
+		return pl
+	elif pr.health > pl.health:
+		return pr
+	return None
+
+def isGameOver(state):
+	return (state['round'] > 2) and (state['player-left'] != state['player-right'])
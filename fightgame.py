@@ -0,0 +1,469 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Игра, в которой идёт бой: расширение Game из fwk.
+'''
+
+import collections
+import functools
+import random
+import time
+
+from fwk.game.game import Game
+from fwk.game.entity import GameEntity
+
+from animated import Animated
+from collision import hurterHits
+from inputqueue import InputQueue
+import movement
+from pool import EntityPool
+from scheduler import Scheduler
+from spatial import SpatialGrid
+
+class EntityHandle(object):
+	'''
+	Ссылка на сущность по id: найденная сущность запоминается, пока её не удалят
+	из игры и не сменят ей id. Промах не запоминается: id часто задаётся уже
+	после addEntity, и сущность должна найтись сразу.
+	'''
+	__slots__ = ('game','id','_entity')
+
+	def __init__(self,game,eid):
+		self.game = game
+		self.id = eid
+		self._entity = None
+
+	def get(self):
+		e = self._entity
+		if e is not None and e.id == self.id:
+			return e
+		e = self._entity = Game.getEntityById(self.game,self.id)
+		return e
+
+def resolveAction(player,action,pressed):
+	'''
+	Метод бойца для действия из словаря GameLayer._KEYMAP: do_* при нажатии,
+	stop_* (или None, если его нет) при отпускании.
+	'''
+	if pressed:
+		return getattr(player,'do_'+action)
+	return getattr(player,'stop_'+action,None)
+
+def applyAction(player,action,pressed,kw=None):
+	fn = resolveAction(player,action,pressed)
+	if fn is not None:
+		fn(**(kw or {}))
+
+def isMoving(entity):
+	v = getattr(entity,'velocity',None)
+	return bool(v and (v[0] or v[1]) or getattr(entity,'angularVelocity',0))
+
+def dormant(cls):
+	'''
+	Декоратор класса: сущность засыпает после update, если не движется, и не
+	обновляется, пока её не разбудят событие (trigger), её отложенный вызов
+	или изменение того, за чем она следит (FightGame.watch).
+	'''
+	update = cls.update
+	trigger = cls.trigger
+
+	def dormantUpdate(self,dt):
+		active = self.game.active
+		if self in active:
+			update(self,dt)
+			if not isMoving(self):
+				active.discard(self)
+
+	def wakingTrigger(self,*args,**kwargs):
+		active = getattr(getattr(self,'game',None),'active',None)
+		if active is not None:
+			active.add(self)
+		return trigger(self,*args,**kwargs)
+
+	dormantUpdate.__doc__ = update.__doc__
+	# Снимок (snapshot.py) записывает методы по имени.
+	dormantUpdate.__name__ = update.__name__
+	wakingTrigger.__name__ = trigger.__name__
+	cls.update = dormantUpdate
+	cls.trigger = wakingTrigger
+	cls.DORMANT = True
+	return cls
+
+def _setSpriteVisible(entity,visible):
+	sprite = getattr(entity,'_sprite',None)
+	if sprite is not None:
+		sprite.visible = visible
+
+class FightGame(Game):
+	'''
+	Игра с общим для всех причинятелей ущерба шагом столкновений, пулами
+	короткоживущих сущностей, отменяемыми отложенными вызовами и индексами
+	сущностей по тегу и id.
+
+	Время идёт шагами по TICK секунд, поэтому при одинаковых зерне и вводе бой
+	повторяется точно. Если задано roundTime, по его истечении игра сама
+	вызывает событие 'round-end'.
+	'''
+	TICK = 1.0 / 60
+	# Запас вокруг видимой области: рядом с ней сущности с updateNearView ещё
+	# обновляются, а спрайты CULL-сущностей ещё показываются.
+	NEAR_MARGIN = 600
+	DRAW_MARGIN = 100
+	# Размер окна в пикселях для видимой области без камеры (как в main.py).
+	VIEW_SIZE = (1024,600)
+
+	def __init__(self,seed=None,*args,**kwargs):
+		self._tagIndex = {}
+		self._handles = {}
+		Game.__init__(self,*args,**kwargs)
+		self._pools = {}
+		self.timers = Scheduler()
+		self.seed = random.randrange(1 << 32) if seed is None else seed
+		self.random = random.Random(self.seed)
+		self.ticks = 0
+		self._lag = 0.0
+		# Ввод по расписанию в порядке (tick, порядок добавления).
+		self._script = collections.deque()
+		self.recorder = None
+		# Нажатия из окна с отметками времени и заранее найденные методы бойцов.
+		self.inputs = InputQueue(self)
+		self._inputMethods = {}
+		# Компьютерные бойцы: {'left' или 'right': controller(game, side)}, см. ai.py.
+		self.controllers = {}
+		# Если задан, update отдаёт ему шаги вместо step (см. netplay.py).
+		self.driver = None
+		self.roundTime = None
+		self.roundOver = False
+		# Отсечение по видимой области (spatial.py). Без камеры не отсекается ничего.
+		self.culling = True
+		self.grid = SpatialGrid()
+		self.awake = set()
+		self._visible = set()
+		self._cullPending = []
+		self._cullMovers = set()
+		# Положение сущности в сетке на прошлом шаге: стоящие не перекладываются.
+		self._cullPositions = {}
+		# Камера окна (fwk Camera), её ставит GameLayer. Без неё видимая область
+		# считается по camera-controller и VIEW_SIZE.
+		self.camera = None
+		# Не спящие сущности классов с @dormant и то, за чем они следят.
+		self.active = set()
+		self._watches = {}
+		# Положения и скорости движущихся сущностей (movement.py): массивы NumPy или списки.
+		self.movers = movement.createStore()
+		# Сущности с анимацией (animated.py): кадр выбирается раз за кадр окна.
+		self.animated = {}
+
+	def handle(self,eid):
+		'''
+		EntityHandle для сущности с данным id. Его можно хранить вместо поиска в каждом кадре.
+		'''
+		h = self._handles.get(eid)
+		if h is None:
+			h = self._handles[eid] = EntityHandle(self,eid)
+		return h
+
+	def getEntityById(self,eid):
+		return self.handle(eid).get()
+
+	def setEntityTags(self,entity,*tags):
+		Game.setEntityTags(self,entity,*tags)
+		for tag in tags:
+			self._tagIndex.setdefault(tag,{})[entity] = None
+
+	def unsetEntityTags(self,entity,*tags):
+		Game.unsetEntityTags(self,entity,*tags)
+		for tag in tags:
+			self._tagIndex.get(tag,{}).pop(entity,None)
+
+	def getEntitiesByTag(self,tag):
+		# Словарь хранит порядок добавления, как и список тегов в Game.
+		return list(self._tagIndex.get(tag,()))
+
+	def addEntity(self,entity):
+		Game.addEntity(self,entity)
+		if isinstance(entity,movement.StoredMovement):
+			self.movers.attach(entity)
+		if isinstance(entity,Animated):
+			self.animated[entity] = None
+		if getattr(entity,'DORMANT',False):
+			self.active.add(entity)
+		if getattr(entity,'CULL',False):
+			# Положение из уровня задаётся после addEntity: в сетку - на следующем шаге.
+			self._cullPending.append(entity)
+
+	def removeEntity(self,entity):
+		Game.removeEntity(self,entity)
+		if '_mslot' in entity.__dict__:
+			self.movers.detach(entity)
+		self.grid.remove(entity)
+		self.awake.discard(entity)
+		self._visible.discard(entity)
+		self._cullMovers.discard(entity)
+		self._cullPositions.pop(entity,None)
+		self.active.discard(entity)
+		self.animated.pop(entity,None)
+		for watch in self._watches.values():
+			watch[1].discard(entity)
+		for tagged in self._tagIndex.values():
+			tagged.pop(entity,None)
+		# Ссылка на удалённую сущность больше не нужна; у кого она осталась,
+		# тот найдёт новую сущность с этим id через get().
+		eid = getattr(entity,'id',None)
+		h = self._handles.get(eid)
+		if h is not None and (h._entity is entity or h._entity is None):
+			h._entity = None
+			del self._handles[eid]
+
+	def scheduleAfter(self,delay,callback,owner=None):
+		'''
+		Возвращает TimerHandle. Владелец по умолчанию - сущность, чей метод вызывается.
+		'''
+		if owner is None:
+			owner = getattr(callback,'__self__',None)
+			if not isinstance(owner,GameEntity):
+				owner = None
+		if getattr(owner,'DORMANT',False):
+			callback = functools.partial(self._waking,owner,callback)
+		return self.timers.schedule(self.currentTime+delay,callback,owner)
+
+	def _waking(self,entity,callback):
+		self.active.add(entity)
+		callback()
+
+	def watch(self,entity,handle,attr='position'):
+		'''
+		Будит спящую сущность entity, когда меняется attr сущности по EntityHandle handle.
+		'''
+		watch = self._watches.get((handle,attr))
+		if watch is None:
+			watch = self._watches[(handle,attr)] = [None,set()]
+		watch[1].add(entity)
+
+	def wakeWatchers(self):
+		for (handle, attr), watch in self._watches.items():
+			source = handle.get()
+			value = getattr(source,attr,None) if source is not None else None
+			if value != watch[0]:
+				watch[0] = value
+				self.active.update(watch[1])
+
+	def resetTo(self,state,seed=None):
+		'''
+		Возвращает игру на месте к снимку state (snapshot.py), не пересоздавая ни
+		уровень, ни бойцов: так начинается следующий раунд. Генератор случайных
+		чисел получает новое зерно, как у новой игры.
+		'''
+		state.restore(self)
+		self.inputs.clear()
+		self._lag = 0.0
+		self._script.clear()
+		self.roundOver = False
+		self.seed = random.randrange(1 << 32) if seed is None else seed
+		self.random.seed(self.seed)
+		for controller in self.controllers.values():
+			reset = getattr(controller,'reset',None)
+			if reset is not None:
+				reset()
+
+	def cancelTimers(self,owner):
+		self.timers.cancelOwner(owner)
+
+	def stopAttacks(self):
+		'''
+		Отменяет отложенные удары бойцов и убирает все летящие причинятели ущерба.
+		'''
+		for player in self.getEntitiesByTag('player'):
+			self.cancelTimers(player)
+		for hurter in list(self.getEntitiesByTag('hurter')):
+			hurter.release()
+
+	def pool(self,cls):
+		if cls not in self._pools:
+			self._pools[cls] = EntityPool(self,cls)
+		return self._pools[cls]
+
+	def poolStats(self):
+		'''
+		Счётчики пулов: created должен перестать расти после разогрева.
+		'''
+		return {cls.__name__: p.stats() for cls, p in self._pools.items()}
+
+	def input(self,side,action,pressed=True,kw=None):
+		'''
+		Действие бойца 'left' или 'right'. Применяется до следующего шага и записывается в recorder.
+		'''
+		if self.recorder is not None:
+			self.recorder.record(self.ticks,side,action,pressed,kw)
+		player = self.handle('player-'+side).get()
+		key = side, action, pressed
+		cached = self._inputMethods.get(key)
+		if cached is None or cached[0] is not player:
+			cached = self._inputMethods[key] = player, resolveAction(player,action,pressed)
+		fn = cached[1]
+		if fn is not None:
+			if kw:
+				fn(**kw)
+			else:
+				fn()
+
+	def queueInput(self,side,action,pressed=True,kw=None):
+		'''
+		Нажатие из обработчика окна: применится в шаге, на который пришлось по времени.
+		'''
+		self.inputs.push(side,action,pressed,kw)
+
+	def schedule(self,script):
+		'''
+		Добавляет ввод (tick, side, action, pressed, kw). Событие с tick <= ticks
+		выполняется перед ближайшим шагом; события одного шага - в порядке добавления.
+		'''
+		events = list(self._script)
+		events.extend(script)
+		# Сортировка устойчивая: отпускание и нажатие в одном шаге не меняются местами.
+		events.sort(key=lambda ev: ev[0])
+		self._script = collections.deque(events)
+
+	def startFrame(self):
+		'''
+		Начало кадра: контроллеры с бюджетом времени на кадр (ai.py) начинают его
+		заново. update вызывает сам, безголовая симуляция - перед каждым шагом.
+		'''
+		for controller in self.controllers.values():
+			start = getattr(controller,'startFrame',None)
+			if start is not None:
+				start()
+
+	def update(self,dt):
+		self.startFrame()
+		self._lag += dt
+		now = time.perf_counter()
+		while self._lag >= self.TICK:
+			self._lag -= self.TICK
+			# Шаг доводит игру до момента now - _lag по настенным часам.
+			self.inputs.apply(now - self._lag)
+			if self.driver is not None:
+				self.driver.advance()
+			else:
+				self.step()
+		self.animate()
+
+	def animate(self):
+		'''
+		Кадры анимаций - раз за кадр окна, а не на каждом шаге; безголовой симуляции не нужны.
+		'''
+		now = self.currentTime
+		for entity in self.animated:
+			entity.animate(now)
+
+	def timeLeft(self):
+		if self.roundTime is None:
+			return None
+		return max(0.0,self.roundTime - self.ticks * self.TICK)
+
+	def step(self):
+		for side, controller in self.controllers.items():
+			controller(self,side)
+		script = self._script
+		while script and script[0][0] <= self.ticks:
+			tick, side, action, pressed, kw = script.popleft()
+			self.input(side,action,pressed,kw)
+
+		self.cull()
+		self.wakeWatchers()
+		Game.update(self,self.TICK)
+		self.movers.integrate(self.TICK)
+		self.timers.run(self.currentTime)
+		self.collide()
+		self.ticks += 1
+
+		if not self.roundOver and self.roundTime is not None and int(self.timeLeft()) <= 0:
+			self.roundOver = True
+			self.trigger('round-end')
+
+	def viewRect(self,margin=0):
+		'''
+		(left, bottom, right, top) области, которую показывает камера, или None без камеры.
+		'''
+		camera = self.camera
+		if camera is not None:
+			x, y = camera.focus
+			w, h = camera.size
+			scale = camera.scale
+		else:
+			ctl = self.handle('camera-controller').get()
+			if ctl is None:
+				return None
+			x, y = ctl.position
+			w, h = self.VIEW_SIZE
+			# Так камера вписывает _target_size в окно (FightingCameraController.updateCamera).
+			scale = 1.0 / max(ctl._target_size[0] / float(w),ctl._target_size[1] / float(h))
+		rx = w / (2.0 * scale) + margin
+		ry = h / (2.0 * scale) + margin
+		return x - rx,y - ry,x + rx,y + ry
+
+	def visibleEntities(self,margin=0):
+		view = self.viewRect(margin)
+		if view is None:
+			return set(self.grid._ranges)
+		return self.grid.query(*view)
+
+	def cull(self):
+		'''
+		Обновляет сетку и множество awake для updateNearView, прячет спрайты
+		CULL-сущностей вне видимой области и показывает вернувшиеся.
+		'''
+		grid = self.grid
+		positions = self._cullPositions
+		for e in self._cullPending:
+			grid.insert(e)
+			positions[e] = e.position
+			if getattr(e,'CULL_MOVES',False):
+				self._cullMovers.add(e)
+		self._cullPending = []
+		# Сущности, которые обновляются всегда и двигаются (параллакс фона).
+		for e in self._cullMovers:
+			self._cullMove(e)
+
+		view = self.viewRect() if self.culling else None
+		if view is None:
+			self.awake = set(grid._ranges)
+			visible = self.awake
+		else:
+			m = self.NEAR_MARGIN
+			self.awake = grid.query(view[0] - m,view[1] - m,view[2] + m,view[3] + m)
+			m = self.DRAW_MARGIN
+			visible = grid.query(view[0] - m,view[1] - m,view[2] + m,view[3] + m)
+		# Сдвинутые из хранилища движения - одним сравнением его массивов.
+		for e in self.movers.moved():
+			if e in grid:
+				grid.move(e)
+		# Остальные двигаться могли, только если обновлялись.
+		for e in self.awake:
+			if '_mslot' not in e.__dict__:
+				self._cullMove(e)
+
+		for e in self._visible.difference(visible):
+			_setSpriteVisible(e,False)
+		for e in visible.difference(self._visible):
+			_setSpriteVisible(e,True)
+		self._visible = visible
+
+	def _cullMove(self,entity):
+		position = entity.position
+		if self._cullPositions.get(entity) != position:
+			self._cullPositions[entity] = position
+			self.grid.move(entity)
+
+	def collide(self):
+		hit = []
+		for hurter, player in hurterHits(self.getEntitiesByTag('hurter'),self.getEntitiesByTag('player')):
+			# Раунд мог закончиться на предыдущем попадании этого шага.
+			if not hurter.active:
+				continue
+			hurter.hit(player)
+			if not hit or hit[-1] is not hurter:
+				hit.append(hurter)
+		for hurter in hit:
+			hurter.release()
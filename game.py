@@ -1,7 +1,11 @@
 #!/usr/bin/python
 # coding=UTF-8
 
+import atexit
 import math
+import os
+import random
+import time
 
 from pyglet import gl
 
@@ -14,332 +18,102 @@ from fwk.ui.layers.guitextitem import GUITextItem
 from fwk.ui.layers.gameLayer import GameLayer as GameLayer_
 from fwk.ui.layers.texture9TileItem import *
 
-from fwk.game.game import Game
 from fwk.game.entity import GameEntity
 from fwk.game.camera import Camera
 
-import fwk.sound.static as ssound
 import fwk.sound.music as music
 
 from fwk.util.all import *
 
-@GameEntity.defineClass('test-entity')
-class TestEntity(GameEntity,GameEntity.mixin.Animation,GameEntity.mixin.Movement):
-	def spawn(self):
-		self.angularVelocity = 100
-		self.i = 0
-		self.think()
-		self.addTags('camera-target')
-
-	def think(self):
-		# if self.i > 10:
-		# 	return self.destroy()
-		self.game.scheduleAfter(1.0,self.think)
-		self.position = (self.i*10 % 40,-self.i*20 % 50)
-		# self.velocity = (self.i*2353 % 200 - 100,-self.i*5423 % 350 - 175)
-		self.velocity = (100*(-1 if self.i % 2 == 0 else 1),0)
-		self.i += 1
-
-@GameEntity.defineClass('camera-controller')
-class FightingCameraController(GameEntity,GameEntity.mixin.CameraTarget):
-	def spawn(self):
-		self._target_focus = 0,0
-		self._target_size = 100, 100
-		self._pad = 600,600
-		self._interp = 1.0
-		self._offset = 0, 0
-		self.id = 'camera-controller'
-
-	def update(self,dt):
-		targets = self.game.getEntitiesByTag('camera-target')
-
-		p = self.position
-		bl = self.position # min
-		tr = self.position # max
-
-		for target in targets:
-			p = p[0] + target.position[0], p[1] + target.position[1]
-			bl = min(bl[0], target.position[0]), min(bl[1], target.position[1])
-			tr = max(tr[0], target.position[0]), max(tr[1], target.position[1])
-		p = p[0] / float(len(targets)+1), p[1] / float(len(targets)+1)
-
-		self.position = self._offset[0] + p[0] * self._interp + self.position[0] * (1.0 - self._interp), \
-						self._offset[1] + p[1] * self._interp + self.position[1] * (1.0 - self._interp)
-
-		self._target_size = 2*max(p[0]-bl[0],tr[0]-p[0]) + self._pad[0], 2*max(p[1]-bl[1],tr[1]-p[1]) + self._pad[1]
-		self._interp = math.pow(2.0,dt-1.0) / 2.0
-
-	def initCamera(self,camera):
-		self._interp = 1
-		self.updateCamera(camera)
-
-	def updateCamera(self,camera):
-		GameEntity.mixin.CameraTarget.updateCamera(self,camera)
-		iscale = 1.0/camera.scale
-		itarget_scale = max(self._target_size[0]/camera.size[0],self._target_size[1]/camera.size[1])
-		camera.scale = 1.0/(self._interp * itarget_scale + (1.0-self._interp) * iscale)
-		# if self.game.currentTime > 0.5:
-		# 	GAME_CONSOLE.visible = False
-
-class PlayerBase(GameEntity,GameEntity.mixin.Movement,GameEntity.mixin.Animation):
-	_MOVEMENT_LIMIT_BOTTOM = -100
-	_MOVEMENT_LIMIT_LEFT = -1000
-	_MOVEMENT_LIMIT_RIGHT = 1000
-
-	FIGHTER_NAME = 'Anonymous'
-
-	events = [
-		('state-change','on_state_change'),
-		('jump','on_jump'),
-		('hit','on_hit'),
-		('block','on_block'),
-		('smash','on_smash'),
-		('throw','on_throw'),
-		('special','on_special'),
-		('hurt','on_hurt')
-	]
-
-	def spawn(self):
-		self.addTags('camera-target','player')
-
-		self.state = 'standing'
-		self.animation = 'stand'
-
-		self.width = 100
-		self.height = 200
-
-		self.defence_level = 0
-
-		self.health = 100.0
-
-		self._action_timeout = self.game.currentTime
-
-		self.move = {}
-
-	def actionTimeoutAtLeast(self,timeout):
-		self._action_timeout = max(self._action_timeout,self.game.currentTime+timeout)
-
-	def checkActionTimeout(self):
-		return self._action_timeout < self.game.currentTime
-
-	def update(self,dt):
-		self.velocity = self.velocity[0], self.velocity[1] - 2000 * dt
-		if self.position[1] <= PlayerBase._MOVEMENT_LIMIT_BOTTOM \
-			and self.state not in ('block','lying'):
-			self.changeState('standing')
-		self.position = min(PlayerBase._MOVEMENT_LIMIT_RIGHT,max(PlayerBase._MOVEMENT_LIMIT_LEFT,self.position[0])), \
-						max(PlayerBase._MOVEMENT_LIMIT_BOTTOM,self.position[1])
-		if self.id == 'player-right':
-			left = self.game.getEntityById('player-left')
-			if (self.position[0]-self.width/2) <= (left.position[0]+left.width/2):
-				self.velocity = 0, self.velocity[1]
-				# if self.state == 'standing':
-				# 	self.animation = 'stand'
-				self.position = left.position[0]+(left.width+self.width)/2, self.position[1]
-		elif self.id == 'player-left':
-			right = self.game.getEntityById('player-right')
-			if (self.position[0]+self.width/2) >= (right.position[0]-right.width/2):
-				self.velocity = 0, self.velocity[1]
-				# if self.state == 'standing':
-				# 	self.animation = 'stand'
-				self.position = right.position[0] - (self.width + right.width)/2, self.position[1]
-		self.update_go()
-
-	def changeState(self,to,fromState=None):
-		if fromState is None or fromState == self.state:
-			if self.state != to:
-				self.state = to
-				self.trigger('state-change')
-
-	def on_state_change(self):
-		self.defence_level = 0
-		self.consoleInfo('state <- ',self.state)
-		if self.state == 'jump':
-			self.animation = 'jump'
-		elif self.state == 'block':
-			self.defence_level = 10
-		elif self.state == 'lying':
-			self.animation = 'lying'
-		else:
-			self.animation = 'stand'
-
-	def hurt(self,hurter):
-		if self.defence_level < hurter.level:
-			self.health -= hurter.damage
-			self.trigger('hurt',hurter.damage)
-			idst = distance(self.position,hurter.position)
-			self.velocity = self.velocity[0], self.velocity[1] + 1000*(self.position[1] - hurter.position[1])/idst
-		else:
-			k = hurter.level / self.defence_level
-
-		if self.health <= 0:
-			self.health = 0
-			# TODO: player defeat
-			self.game.unsetEntityTags(self,'camera-target')
-			self.changeState('lying')
-			self.game.trigger('win',hurter.owner)
-			return
-
-	def specialAvailiable(self):
-		return False
-
-	def update_go(self):
-		vx = 0
-		if self.checkActionTimeout() and self.state != 'lying':
-			for d,t in self.move.items():
-				if t:
-					vx += d
-			vx *= 1000
-		self.velocity = vx, self.velocity[1]
-
-	def do_go(self,direction):
-		if self.state != 'lying':
-			self.move[direction] = True
-
-	def stop_go(self,direction):
-		self.move[direction] = False
-
-	def do_hit(self):
-		if (not self.checkActionTimeout()) or self.health <= 0:
-			return
-		self.animation = 'hit'
-		if self.state == 'standing':
-			self.actionTimeoutAtLeast(0.3)
-			self.game.scheduleAfter(0.2, self.event('hit'))
-		elif self.state == 'jump':
-			self.actionTimeoutAtLeast(0.7)
-			self.game.scheduleAfter(0.2, self.event('smash'))
-
-	def do_block(self):
-		if not self.checkActionTimeout():
-			return
-		if self.state == 'standing':
-			self.changeState('block')
-			self.consoleInfo('block start')
-			self.trigger('block')
-			self.animation = 'block'
-
-	def stop_block(self):
-		self.consoleInfo('block end')
-		self.changeState(to='standing',fromState='block')
-
-	def do_throw(self):
-		if not self.checkActionTimeout():
-			return
-		if self.state in ('standing','block'):
-			self.changeState('standing')
-			self.animation = 'throw'
-			self.actionTimeoutAtLeast(2.4)
-			self.game.scheduleAfter(0.2, self.event('throw'))
-
-	def do_special(self):
-		if not self.checkActionTimeout():
-			return
-		if self.specialAvailiable():
-			self.trigger('special')
-
-	def do_jump(self):
-		if not self.checkActionTimeout():
-			return
-		if self.state in ('standing','block'):
-			self.velocity = self.velocity[0], 1000
-			self.changeState('jump')
-			self.trigger('jump')
-
-	def faceToTarget(self, x):
-		return x if (self.id == 'player-left') else -x
-
-	def consoleInfo(self,*args):
-		GAME_CONSOLE.write("{} ({}) ".format(self.FIGHTER_NAME,self.id),*args)
-
-
-class Hurter(GameEntity,GameEntity.mixin.Movement):
-	'''
-	Причинятор ущерба.
-	'''
-	_FX_PICS = {'hit':['rc/img/star-hit-0.png'],'smash':['rc/img/star-smash-0.png'],'guitar':['rc/img/star-guitar-0.png']}
-
-	@staticmethod
-	def static_init(game,owner,position,velocity,ttl,damage,radius,level,type_='hit'):
-		self = Hurter()
-		game.addEntity(self)
-
-		self.position = position
-		self.velocity = velocity
-		self.owner = owner
-		self.damage = damage
-		self.radius = radius
-		self.level = level
-		self.type_ = type_
-		game.scheduleAfter(ttl,self.destroy)
-		self.sprite = "rc/img/32x32fg.png"
-		self.scale = (self.radius/16.0)
-		return self
-
-	def spawn(self):
-		self.addTags('hurter')
-
-	def intersectsPlayer(self,player):
-		px,py = player.position
-		x,y = self.position
-		return (x-self.radius < px+player.width/2) and\
-			   (x+self.radius > px-player.width/2) and\
-			   (y-self.radius < py+player.height/2) and\
-			   (y+self.radius > py-player.height/2)
-
-	def spawnFx(self,player):
-		p = (self.position[0] + player.position[0]) / 2.0, (self.position[1] + player.position[1]) / 2.0
-		e = HitFxEntity()
-		self.game.addEntity(e)
-		e.position = p
-		e.sprite = random.choice(self._FX_PICS[self.type_])
-		e.spriteAnchor = 'center'
-		e.rotation = random.randrange(start=-50,stop=50)
-		e.trigger('configured')
-
-	def update(self,dt):
-		for player in self.game.getEntitiesByTag('player'):
-			if player != self.owner:
-				if self.intersectsPlayer(player):
-					self.spawnFx(player)
-					player.hurt(self)
-					self._sprite = None
-					self.destroy()
-
-@GameEntity.defineClass('static-entity')
-class StaticEntity(GameEntity,GameEntity.mixin.Sprite):
+import pyglet
+
+from assets import ASSETS
+from soundbank import SoundBank
+from replay import startRecording
+from particles import drawEmitter
+from hud import HudBatch
+from snapshot import capture
+from gamelog import CompressedFileSink, formatRecord
+
+# Необязательные части (netplay, ai, spectate, profiler) импортируются там,
+# где включаются, чтобы не замедлять запуск до первого кадра.
+
+# Сюда сохраняется ввод каждого раунда, см. replay.py.
+REPLAY_DIR = 'replays'
+
+# Сетевая игра: {'side': 'left' или 'right', 'transport': UdpTransport}, см. main.py.
+NETPLAY = None
+
+# Компьютерный боец (ai.py): сторона или None, бюджет на обдумывание за кадр,
+# поиск в отдельном процессе. Переключается клавишей TAB на экране выбора.
+CPU_SIDE = None
+CPU_BUDGET = 0.002
+CPU_WORKER = False
+_CPU = None
+
+def cpuController():
+	global _CPU
+	if _CPU is None:
+		from ai import CpuController
+		_CPU = CpuController(CPU_BUDGET,worker=CPU_WORKER)
+	return _CPU
+
+# Порт трансляции зрителям (spectate.py) или None, см. main.py --spectate.
+SPECTATE_PORT = None
+_SPECTATORS = None
+
+def spectatorServer():
+	global _SPECTATORS
+	if _SPECTATORS is None and SPECTATE_PORT is not None:
+		from spectate import SpectatorServer
+		_SPECTATORS = SpectatorServer('0.0.0.0',SPECTATE_PORT).start()
+		atexit.register(_SPECTATORS.close)
+	return _SPECTATORS
+
+# Каталог для сжатых журналов раундов или None, см. main.py --log.
+LOG_DIR = None
+_LOG_SINK = None
+
+def logSink():
+	global _LOG_SINK
+	if _LOG_SINK is None and LOG_DIR is not None:
+		_LOG_SINK = CompressedFileSink(LOG_DIR)
+		fighters.LOG.sinks.append(_LOG_SINK)
+		# Иначе последний файл останется недописанным.
+		atexit.register(_LOG_SINK.close)
+	return _LOG_SINK
+
+import fighters
+from fighters import *
+from fightgame import FightGame
+
+# Банк звуков (8 голосов pyglet и декодирование всех звуков) создаётся после
+# первого кадра; до этого бойцы звуков не издают.
+SOUNDS = None
+
+def startSounds(dt):
+	global SOUNDS
+	SOUNDS = SoundBank()
+	SOUNDS.preload()
+	pyglet.clock.schedule(SOUNDS.flush)
+	fighters.playSound = SOUNDS.play
+
+pyglet.clock.schedule_once(startSounds,0)
+
+_shownLog = [0]
+
+def showLog(dt):
 	'''
-	Просто статическая спрайтовая сущность с нестандартным z-индексом.
+	Переносит в игровую консоль новые записи журнала бойцов, пока консоль видна:
+	скрытая консоль строки не получает и записи не форматируются.
 	'''
-	z_index = -1
+	log = fighters.LOG
+	if GAME_CONSOLE.visible:
+		for record in log.since(_shownLog[0]):
+			GAME_CONSOLE.write(formatRecord(record))
+	_shownLog[0] = log.count
 
-@GameEntity.defineClass('background-entity')
-class BGEntity(GameEntity,GameEntity.mixin.Sprite):
-	z_index = -2
-
-	def on_configured(self):
-		self._base_pos = self.position
-
-	def update(self,dt):
-		ctl = self.game.getEntityById('camera-controller')
-		if ctl is not None:
-			self.position = 0.5*(self._base_pos[0] + ctl.position[0]), \
-							0.5*(self._base_pos[1] + ctl.position[1])
-
-import random
-
-class HitFxEntity(GameEntity,GameEntity.mixin.Sprite):
-	z_index = 1000
-	def spawn(self):
-		self.angularVelocity = 10
-		self.game.scheduleAfter(0.6,self.destroy)
-		self._lt = 0.0
-
-	def update(self,dt):
-		self._lt += dt
-		lt = self._lt / 0.6
-		self.scale = lt * 2.0 + 0.5
-		self._sprite.opacity = int((1.0 - lt) * 255)
+pyglet.clock.schedule(showLog)
 
 class GameLayer(GameLayer_):
 	'''
@@ -370,194 +144,413 @@ class GameLayer(GameLayer_):
 			}
 		self._camera_controller = self._game.getEntityById('camera-controller')
 		self._camera.setController(self._camera_controller)
+		# Отсечение (FightGame.viewRect) берёт видимую область у самой камеры.
+		self._game.camera = self._camera
+
+	def draw(self):
+		GameLayer_.draw(self)
+		sparks = self._game.handle('sparks').get()
+		if sparks is None or not sparks.count():
+			return
+		# Искры рисуются поверх сущностей в мировых координатах камеры.
+		camera = self._camera
+		gl.glPushMatrix()
+		gl.glTranslatef(camera.size[0] / 2.0,camera.size[1] / 2.0,0)
+		gl.glScalef(camera.scale,camera.scale,1)
+		gl.glTranslatef(-camera.focus[0],-camera.focus[1],0)
+		for path, emitter in sparks.emitters.items():
+			texture = ASSETS.image(path).get().get_texture()
+			emitter.width, emitter.height = texture.width, texture.height
+			drawEmitter(emitter,texture)
+		gl.glPopMatrix()
 
 	def on_key_press(self,key,mod):
 		'''
 		Здесь происходит управление с клавиатуры.
 		'''
-		if key in GameLayer._KEYMAP:
-			k = GameLayer._KEYMAP[key]
-			kwa = k.get('kw',{})
-			getattr(self._players[k['player']],'do_'+k['action'])(**kwa);
+		self._key(key,True)
 
 	def on_key_release(self,key,mod):
+		self._key(key,False)
+
+	def _key(self,key,pressed):
 		if key in GameLayer._KEYMAP:
 			k = GameLayer._KEYMAP[key]
-			kwa = k.get('kw',{})
-			fn = getattr(self._players[k['player']],'stop_'+k['action'],None)
-			if fn is not None:
-				fn(**kwa)
+			if k['player'] in self._game.controllers or self._game.roundOver:
+				return
+			if self._game.driver is not None:
+				# В сетевой игре любые клавиши управляют своим бойцом.
+				from netplay import button
+				self._game.driver.setButton(button(k['action'],k.get('kw')),pressed)
+			else:
+				self._game.queueInput(k['player'],k['action'],pressed,k.get('kw'))
 
 class ProgressBar(GUIItemLayer):
+	'''
+	Полоска в общем HUD экрана (HudBatch): сама ничего не рисует, только
+	сообщает HUD своё положение и значение.
+	'''
 	LEFT_LAYOUT  = {'height': 30,'width': 100}
 	RIGHT_LAYOUT = {'height': 30,'width': 100}
+	# Области рамки и заливки в rc/img/ui-frames.png.
+	BACK = (0,0,12,12)
+	FRONT = (12,0,12,12)
+
 	def init(self,grow_origin,expression,*args,**kwargs):
 		self._expression = expression
 		self._grow_origin = grow_origin
-		self.back = _9Tiles(LoadTexture('rc/img/ui-frames.png'),Rect(left=0,bottom=0,width=12,height=12))
-		self.front = _9Tiles(LoadTexture('rc/img/ui-frames.png'),Rect(left=12,bottom=0,width=12,height=12))
-		self._inrect = None
-		self._expRes = 65595
+		self._bar = None
 
-	def draw(self):
-		self.back.draw(self.rect)
-		k = self._expression()
-		if self._inrect is None or k != self._expRes:
-			self._inrect = self.rect.clone().inset(5).scale(scaleX=k,scaleY=1,origin=self._grow_origin)
-			self._expRes = k
-
-		if k > 0:
-			if k < 0.4:
-				gl.glColor3ub(255,0,0)
-			elif k < 0.7:
-				gl.glColor3ub(255,255,0)
-			else:
-				gl.glColor3ub(0,255,0)
-			self.front.draw(self._inrect)
-			gl.glColor3ub(255,255,255)
+	def on_add_to_screen(self,screen):
+		self._bar = screen.hud.bar(self.BACK,self.FRONT,self._grow_origin)
 
-	def on_layout_updated(self):
-		self._inrect = None
+	def draw(self):
+		r = self.rect
+		self._bar.set((r.left,r.bottom,r.width,r.height),self._expression())
 
 class HpProgressBar(ProgressBar):
 	def init(self,player,*args,**kwargs):
 		self.player = player
+		self._pos = None
 
 	def draw(self):
 		cam = self.screen.camera
 		pt = self.player.position
-		pt = pt[0], pt[1] + 250
-		pt = cam.project(pt)
-		lay = self.layout
-		lay['bottom'] = int(pt[1])
-		lay['left'] = int(pt[0] - 50)
-		self.layout = lay
+		pt = cam.project((pt[0],pt[1] + 250))
+		pos = int(pt[0] - 50), int(pt[1])
+		if pos != self._pos:
+			self._pos = pos
+			lay = self.layout
+			lay['left'], lay['bottom'] = pos
+			self.layout = lay
 		ProgressBar.draw(self)
 
 class GUITextItem_(GUITextItem):
+	'''
+	Жёлтая надпись. На экранах с HUD (GameScreen.hud) рисуется в его пакете.
+	'''
+	COLOR = (255,255,0,255)
+
+	def draw(self):
+		label = self._label
+		hud = getattr(self.screen,'hud',None)
+		if hud is None:
+			if not getattr(self,'_colored',False):
+				label.color = self.COLOR
+				self._colored = True
+			label.draw()
+			return
+		text = getattr(self,'_hudText',None)
+		if text is None:
+			text = self._hudText = hud.label()
+		text.set(label.text,label.x,label.y,label.font_size,self.COLOR,label.anchor_x,label.anchor_y,label.font_name)
+
+class HudLayer(GUIItemLayer):
+	'''
+	Рисует HUD экрана после всех полосок и надписей, которые его обновили.
+	Это последний слой кадра, поэтому здесь же отмечается показ применённого ввода
+	и зрителям отправляется кадр с новым шагом.
+	'''
+	_published = None
+
 	def draw(self):
-		self._label.color = (255,255,0,255)
-		self._label.draw()
+		self.screen.hud.draw()
+		game = self.screen.game
+		game.inputs.presented()
+		spectators = spectatorServer()
+		if spectators is not None and game.ticks != self._published:
+			from spectate import matchFrame
+			self._published = game.ticks
+			spectators.publish(matchFrame(game,GLOBAL_STATE))
+		started = GameScreen.roundRequested
+		if started is not None:
+			GameScreen.roundRequested = None
+			GameScreen.roundGap = (time.perf_counter() - started) * 1000.0
+			GAME_CONSOLE.write('Round #',str(self.screen.round),' first frame in {:.1f} ms'.format(GameScreen.roundGap))
 
 class Timer(GUITextItem_):
 	events = ['update']
 	def on_add_to_screen(self,screen):
-		self._time_left = 60
+		self._time_left = ROUND_TIME
 		self._time_left_int = None
 		self.subscribe(self.screen,'update')
 
 	def update(self,dt):
-		self._time_left -= dt
+		# Конец раунда по времени определяет сама игра (FightGame.roundTime),
+		# здесь время только показывается. После конца раунда время стоит.
+		if self.screen.freeze:
+			return
+		self._time_left = self.screen.game.timeLeft()
 		tli = int(self._time_left)
-		if tli <= 0:
-			self._time_left = 0
-			tli = 0
-			self.screen.trigger('round-end')
 		if tli != self._time_left_int:
+			self._time_left_int = tli
 			self.text = str(tli)
 			self.layout = self.layout
 
+class PeerWait(GUITextItem_):
+	'''
+	Надпись, пока сосед по сетевой игре не ответил: каждый кадр опрашивает его (GameScreen.pollPeer).
+	'''
+	events = ['update']
+	def on_add_to_screen(self,screen):
+		self.subscribe(self.screen,'update')
+
+	def update(self,dt):
+		if self.screen.game is None:
+			self.screen.pollPeer()
+
+class ProfilerOverlay(GUIItemLayer):
+	'''
+	Самые дорогие за кадр update/draw/вызовы по классам. Включается F3 (вместе
+	с профилировщиком), F4 сохраняет трассу для chrome://tracing.
+	'''
+	KEY_TOGGLE = KEY.F3
+	KEY_TRACE = KEY.F4
+	LINES = 12
+	PERIOD = 0.5
+
+	# Профилировщик (profiler.PROFILER), пока его ни разу не включали - None.
+	profiler = None
+
+	def init(self,*args,**kwargs):
+		self._labels = [pyglet.text.Label('',font_size=9,color=(255,255,255,255)) for i in range(self.LINES + 1)]
+		self._refreshed = 0.0
+
+	@staticmethod
+	def toggle():
+		from profiler import PROFILER
+		ProfilerOverlay.profiler = PROFILER
+		enabled = PROFILER.toggle(entities=[GameEntity],layers=[GUIItemLayer,GameLayer_],events=[FightGame,Screen])
+		PROFILER.reset()
+		GAME_CONSOLE.write('Profiler ',('on' if enabled else 'off'),'.')
+
+	@staticmethod
+	def saveTrace():
+		profiler = ProfilerOverlay.profiler
+		if profiler is None:
+			GAME_CONSOLE.write('Profiler is off, press F3 first.')
+			return
+		filename = time.strftime('profile-%Y%m%d-%H%M%S.trace.json')
+		profiler.saveTrace(filename)
+		GAME_CONSOLE.write('Profiler trace saved to ',filename)
+
+	def draw(self):
+		profiler = self.profiler
+		if profiler is None or not profiler.enabled:
+			return
+		profiler.endFrame()
+		now = time.time()
+		if now - self._refreshed > self.PERIOD:
+			self._refreshed = now
+			lines = profiler.report(self.LINES - 1).split('\n')
+			lines.append(self.screen.game.inputs.report())
+			if GameScreen.roundGap is not None:
+				lines.append('ENTER -> first frame of round {:.1f} ms'.format(GameScreen.roundGap))
+			for i, label in enumerate(self._labels):
+				label.text = lines[i] if i < len(lines) else ''
+		for i, label in enumerate(self._labels):
+			label.x = self.rect.left + 4
+			label.y = self.rect.top - 14 * (i + 1)
+			label.draw()
+
 @Screen.ScreenClass('GAME')
 class GameScreen(Screen):
 	events = [('win','on_player_win'),('round-end','on_round_end')]
 
+	# Когда нажат ENTER перед раундом (perf_counter) и через сколько миллисекунд
+	# после этого показан первый кадр раунда (см. HudLayer.draw).
+	roundRequested = None
+	roundGap = None
+
 	def init(self,*args,**kwargs):
 		self.winner = None
 		self.freeze = False
+		self.game = None
 		gl.glClearColor(0x1d/255.0,0x5b/255.0,0x70/255.0,1)
 
 		# self.pushLayerFront(StaticBackgroundLauer('rc/img/256x256bg.png','fill'))
 
-		game = Game()
-		self.camera = Camera()
-
-		self.game = game
-
-		self.game.listen('win')
-		self.game.on('win',self.event('win'))
+		self.choices = dict(PLAYER_CHOICES)
+		if NETPLAY is not None:
+			# Бой начнётся, когда ответит сосед (pollPeer), а пока экран ждёт его.
+			side = NETPLAY['side']
+			mine = 'player-left' if side == 'left' else 'player-right'
+			from netplay import Handshake
+			self.peer = Handshake(NETPLAY['transport'],side,self.choices[mine].__name__,random.getrandbits(32),GLOBAL_STATE['round'])
+			self.waitText = PeerWait(layout={'width':10,'height':10,'bottom':50},text='Waiting for the other player...')
+			self.pushLayerFront(self.waitText)
+			return
 
-		game.loadFromJSON('rc/lvl/level0.json')
+		game = FightGame()
+		game.listen('win')
+		game.on('win',self.event('win'))
+		game.listen('round-end')
+		game.on('round-end',self.event('round-end'))
+		self.startGame(game)
 
-		for pid, pcl in PLAYER_CHOICES.items():
-			p = pcl()
-			game.addEntity(p)
-			# p.animations = 'rc/ani/player-test-'+pid+'.json'
-			p.position = 500 if pid == 'player-right' else -500, 0
-			p.id = pid
-			p.trigger('configured')
+	def startGame(self,game):
+		self.game = game
+		choices = self.choices
+		self.camera = Camera()
+		self.hud = HudBatch(ASSETS.image('rc/img/ui-frames.png').get().get_texture())
+		self.game.roundTime = ROUND_TIME
+
+		loadLevel(game,'rc/lvl/level0.json')
+		spawnPlayers(game,choices)
+		# Искры создаются сразу: GameLayer.draw ищет их в каждом кадре, и до
+		# первого удара это был бы промах с полным поиском.
+		SparksEntity.get(game)
+		if CPU_SIDE is not None and NETPLAY is None:
+			# Контроллер один на процесс: решение и нажатия прошлой игры забываются.
+			cpu = game.controllers[CPU_SIDE] = cpuController()
+			cpu.reset()
+			cpu.prepare(game)
+		# Начало раунда: следующий раунд начинается с него же на этом экране (nextRound).
+		# Сетевая игра начинает раунд заново вместе с соседом, через новый экран.
+		self.initial = capture(game) if NETPLAY is None else None
+		# Предсказанный ввод в сетевой игре переигрывается, такой раунд не записываем.
+		self.recording = startRecording(game,choices) if NETPLAY is None else None
+		self.round = GLOBAL_STATE['round']
+		self.startLog()
 
 		self.gameLayer = GameLayer(game=game,camera=self.camera)
 		self.pushLayerFront(self.gameLayer)
 
+		left, right = game.handle('player-left'), game.handle('player-right')
 		self.pushLayerFront(HpProgressBar(grow_origin='top-left',
-			expression=lambda: game.getEntityById('player-left').health / 100.0,
-			layout=ProgressBar.LEFT_LAYOUT,player=game.getEntityById('player-left')))
+			expression=lambda: left.get().health / 100.0,
+			layout=ProgressBar.LEFT_LAYOUT,player=left.get()))
 		self.pushLayerFront(HpProgressBar(grow_origin='top-right',
-			expression=lambda: game.getEntityById('player-right').health / 100.0,
-			layout=ProgressBar.RIGHT_LAYOUT,player=game.getEntityById('player-right')))
+			expression=lambda: right.get().health / 100.0,
+			layout=ProgressBar.RIGHT_LAYOUT,player=right.get()))
 
 		self.timer = Timer(layout={'top':70,'width':100,'height':20,'force-size':True})
 		self.pushLayerFront(self.timer)
 
-		self.pushLayerFront(GUITextItem_(layout={'top':20,'width':100,'height':20},text=('ROUND #'+str(GLOBAL_STATE['round']))))
+		self.roundText = GUITextItem_(layout={'top':20,'width':100,'height':20},text=('ROUND #'+str(GLOBAL_STATE['round'])))
+		self.pushLayerFront(self.roundText)
+		self.pushLayerFront(ProfilerOverlay(layout={'top':100,'left':10,'width':520,'height':200}))
 		self.counters = {pid : GUITextItem_(layout={'top':40,pid[7:]:40,'width':0,'height':0},text=str(GLOBAL_STATE['player-left'])) for pid in ['player-left','player-right']}
 		for z,x in self.counters.items():
 			self.pushLayerFront(x)
+		# Надписи конца раунда пусты, пока раунд идёт.
+		self.winText = GUITextItem_(layout={'width':10,'height':10,'bottom':100},text='')
+		self.pushLayerFront(self.winText)
+		self.promptText = GUITextItem_(layout={'width':10,'height':10,'bottom':50},text='',fontSize=17)
+		self.pushLayerFront(self.promptText)
+		self.pushLayerFront(HudLayer(layout={'left':0,'bottom':0,'width':0,'height':0}))
 
 		GAME_CONSOLE.write('Startup screen created.')
 
+	def pollPeer(self):
+		'''
+		Вызывается каждый кадр, пока бой не начался: когда сосед ответил, начинает сетевой бой.
+		'''
+		result = self.peer.poll()
+		if result is None:
+			return
+		self.setText(self.waitText,'')
+		self.startGame(self.startNetplay(*result))
+
+	def startNetplay(self,name,seed):
+		'''
+		FightGame с бойцом соседа name, зерном seed и RollbackSession.
+		'''
+		side = NETPLAY['side']
+		other = 'player-right' if side == 'left' else 'player-left'
+		self.choices[other] = getattr(fighters,name)
+
+		from netplay import RollbackSession
+		game = FightGame(seed=seed)
+		session = RollbackSession(game,side,NETPLAY['transport'],self.peer.hello)
+		session.onEvent = lambda name,*args: self.trigger(name,*args)
+		game.driver = session
+		for name in ('win','round-end'):
+			game.listen(name)
+			game.on(name,lambda *args,name=name: session.on_game_event(name,*args))
+		return game
+
 	def updateCounters(self):
 		for k in ['player-left','player-right']:
 			self.counters[k].text = str(GLOBAL_STATE[k])
 
+	@staticmethod
+	def setText(item,text):
+		item.text = text
+		item.layout = item.layout
+
 	def on_key_press(self,key,mod):
+		if key == ProfilerOverlay.KEY_TOGGLE:
+			ProfilerOverlay.toggle()
+		elif key == ProfilerOverlay.KEY_TRACE:
+			ProfilerOverlay.saveTrace()
 		if key == KEY.ENTER and self.freeze:
 			if self.isGameOver():
 				self.next = ChoiceScreen()
+				return
+			GameScreen.roundRequested = time.perf_counter()
+			if self.initial is not None:
+				self.nextRound()
 			else:
 				self.next = GameScreen()
 		pass#GAME_CONSOLE.write('SSC:Key down:',KEY.symbol_string(key),'(',key,') [+',KEY.modifiers_string(mod),']')
 
+	def nextRound(self):
+		'''
+		Следующий раунд на этом же экране: игра возвращается к снимку начала
+		раунда, уровень, бойцы, слои и камера остаются прежними.
+		'''
+		game = self.game
+		game.resetTo(self.initial)
+		sparks = game.handle('sparks').get()
+		if sparks is not None:
+			for emitter in sparks.emitters.values():
+				emitter.clear()
+		self.winner = None
+		self.freeze = False
+		self.round = GLOBAL_STATE['round']
+		self.recording = startRecording(game,self.choices)
+		self.startLog()
+		self.setText(self.roundText,'ROUND #'+str(self.round))
+		self.setText(self.winText,'')
+		self.setText(self.promptText,'')
+
+	def startLog(self):
+		sink = logSink()
+		if sink is not None:
+			sink.startRound('{}-round{}'.format(time.strftime('%Y%m%d-%H%M%S'),self.round))
+
 	def isGameOver(self):
-		return (GLOBAL_STATE['round'] > 2) and (GLOBAL_STATE['player-left'] != GLOBAL_STATE['player-right'])
+		return isGameOver(GLOBAL_STATE)
 
 	def freezeGame(self):
-		self.pushLayerFront(GUITextItem_(
-			layout = {
-				'width': 10,
-				'height': 10,
-				'bottom': 50
-			},
-			text='Press ENTER to play again' if self.isGameOver() else 'Press ENTER for next round!',
-			fontSize=17))
-
-		for e in self.game.getEntitiesByTag('hurter'):
-			e.damage = 0
+		self.setText(self.promptText,'Press ENTER to play again' if self.isGameOver() else 'Press ENTER for next round!')
 
-		for e in self.game.getEntitiesByTag('player'):
-			e.hurt = lambda *a: None
+		self.game.stopAttacks()
+		# Пока раунд окончен, GameLayer не передаёт клавиши бойцам, а Timer стоит.
+		self.game.roundOver = True
 
-		self.gameLayer.ignore('in:key:press')
-		self.gameLayer.ignore('in:key:release')
-
-		self.timer.ignore('update')
+		self.saveRecording()
 
 		self.freeze = True
 
 		self.updateCounters()
 
+	def saveRecording(self):
+		self.game.recorder = None
+		if self.recording is None:
+			return
+		if not os.path.isdir(REPLAY_DIR):
+			os.makedirs(REPLAY_DIR)
+		self.recording.save(os.path.join(REPLAY_DIR,'{}-round{}.rpl'.format(
+			time.strftime('%Y%m%d-%H%M%S'),self.round)))
+
 	def on_player_win(self,player):
 		GAME_CONSOLE.write('Player #',player.id if player else 'NONE',' wins.')
 		self.winner = player
-		self.pushLayerFront(GUITextItem_(
-			layout = {
-				'width': 10,
-				'height': 10,
-				'bottom': 100
-			},
-			text=((player.FIGHTER_NAME+
-				{'player-left':' (Player #1)', 'player-right':' (Player #2)'}[player.id])
-					if player else 'Nobody')+' wins!'))
+		self.setText(self.winText,((player.FIGHTER_NAME+
+			{'player-left':' (Player #1)', 'player-right':' (Player #2)'}[player.id])
+				if player else 'Nobody')+' wins!')
 
 		GLOBAL_STATE['round'] += 1
 
@@ -568,20 +561,16 @@ class GameScreen(Screen):
 		self.freezeGame()
 
 	def on_round_end(self):
-		pl = self.game.getEntityById('player-left')
-		pr = self.game.getEntityById('player-right')
-
-		if pl.health > pr.health:
-			return self.trigger('win',pl)
-		elif pr.health > pl.health:
-			return self.trigger('win',pr)
-		else:
-			return self.trigger('win',None)
+		return self.trigger('win',roundWinner(self.game))
 
 class PlayerIcon(GUIItemLayer):
-	ARROWS_IMG = LoadTexture('rc/img/ui-arrows.png')
+	ARROWS_IMG = ASSETS.image('rc/img/ui-arrows.png')
 	KEYZ = {'player-left':[KEY.A,KEY.D],'player-right':[KEY.LEFT,KEY.RIGHT]}
 
+	@staticmethod
+	def icon(path):
+		return ASSETS.image(path).get()
+
 	def init(self,playerId,**kwargs):
 		self.playerId = playerId
 
@@ -592,16 +581,22 @@ class PlayerIcon(GUIItemLayer):
 		self.screen.pushLayerFront(self.text)
 		self.updateText()
 		lay['offset_y'] = 150
-		self.screen.pushLayerFront(GUITextItem_(layout=lay,text={'player-left':'Player #1','player-right':'Player #2'}[self.playerId]))
+		self.title = GUITextItem_(layout=lay)
+		self.screen.pushLayerFront(self.title)
+		self.updateText()
 
 	def updateText(self):
 		self.text.text = PLAYER_CHOICES[self.playerId].FIGHTER_NAME
 		self.text.layout = self.text.layout
+		title = getattr(self,'title',None)
+		if title is not None:
+			title.text = 'CPU' if CPU_SIDE == self.playerId[7:] else {'player-left':'Player #1','player-right':'Player #2'}[self.playerId]
+			title.layout = title.layout
 
 	def draw(self):
-		BlitTextureToRect((PLAYER_CHOICES[self.playerId].ICON_IMAGE
+		BlitTextureToRect(PlayerIcon.icon(PLAYER_CHOICES[self.playerId].ICON_IMAGE
 			if self.playerId == 'player-right' else PLAYER_CHOICES[self.playerId].ICON_IMAGE_L),self.rect)
-		BlitTextureToRect(PlayerIcon.ARROWS_IMG,self.rect)
+		BlitTextureToRect(PlayerIcon.ARROWS_IMG.get(),self.rect)
 
 	def on_click(self,*args):
 		PLAYER_CHOICES[self.playerId] = PLAYER_NEXT[PLAYER_CHOICES[self.playerId]]
@@ -616,8 +611,10 @@ class ChoiceScreen(Screen):
 	def init(self):
 		self.pushLayerFront(StaticBackgroundLauer('rc/img/bg-2.jpg',mode='fill'))
 
-		self.pushLayerFront(PlayerIcon(layout={'width':256,'height':256,'left':50},playerId='player-left'))
-		self.pushLayerFront(PlayerIcon(layout={'width':256,'height':256,'right':50},playerId='player-right'))
+		self.icons = [PlayerIcon(layout={'width':256,'height':256,'left':50},playerId='player-left'),
+			PlayerIcon(layout={'width':256,'height':256,'right':50},playerId='player-right')]
+		for icon in self.icons:
+			self.pushLayerFront(icon)
 
 		self.pushLayerFront(GUITextItem_(
 			layout = {
@@ -628,173 +625,28 @@ class ChoiceScreen(Screen):
 			text='Press ENTER to FIGHT!'))
 
 	def on_key_press(self,key,mod):
-		global GLOBAL_STATE
+		global GLOBAL_STATE, CPU_SIDE
+		if key == KEY.TAB:
+			CPU_SIDE = None if CPU_SIDE else 'right'
+			for icon in self.icons:
+				icon.updateText()
 		if key == KEY.ENTER:
 			GLOBAL_STATE = {'player-left':0,'player-right':0,'round':1}
+			GameScreen.roundRequested = time.perf_counter()
 			self.next = GameScreen()
 
-class NaotaFighter(PlayerBase):
-	FIGHTER_NAME = 'Naota'
-	ICON_IMAGE = LoadTexture('rc/img/fg-boy-st.png')
-	ICON_IMAGE_L = LoadTexture('rc/img/fg-boy-st-l.png')
-	z_index = 134
-
-	def on_configured(self):
-		self.animations = 'rc/ani/fighter-naota-'+self.id+'.json'
-
-	# def on_block(self):
-	# 	self.defence_level = 10
-
-	def on_hit(self):
-		px,py=self.position
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(px+self.faceToTarget(50),py),
-			velocity=(self.faceToTarget(1000),0),
-			ttl=0.150,damage=5,radius=16,level=1,type_='hit')
-		ssound.Play('rc/snd/hit.wav')
-		self.consoleInfo('strike')
-
-	def on_hurt(self, damage):
-		self.consoleInfo('damaged',damage)
-
-	def on_smash(self):
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(0),self.position[1]+200),
-			velocity=(self.faceToTarget(1000),-2000),
-			ttl=0.3,damage=15,radius=100,level=1,type_='smash')
-		ssound.Play('rc/snd/smash.wav')
-		self.consoleInfo('smashing')
-
-	def on_throw(self):
-		# время полёта в одну сторону подобрано в ручную
-		local_ttl = 1.2
-		FlyingGuitar.static_init(
-			game=self.game,
-			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
-			velocity=(self.faceToTarget(2000),0),
-			angularVelocity=(self.faceToTarget(720)),
-			sprite="rc/img/fg-boy-guitar.png",
-			ttl=local_ttl
-		)
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
-			velocity=(self.faceToTarget(2000),0),
-			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar')
-		self.game.scheduleAfter(local_ttl,lambda : Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(100+2500),self.position[1]-100),
-			velocity=(-self.faceToTarget(2000),0),
-			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar'))
-		ssound.Play('rc/snd/chainsaw.wav')
-		self.consoleInfo('throw')
-
-	def on_jump(self):
-		ssound.Play('rc/snd/hop.wav')
-
-class HarukoFighter(PlayerBase):
-	FIGHTER_NAME = 'Haruko'
-	ICON_IMAGE = LoadTexture('rc/img/fg-girl-st.png')
-	ICON_IMAGE_L = LoadTexture('rc/img/fg-girl-st-l.png')
-	z_index=100
-
-	def on_configured(self):
-		self.animations = 'rc/ani/fighter-haruko-'+self.id+'.json'
-
-	# def on_block(self):
-	# 	self.defence_level = 10
-
-	def on_hit(self):
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=self.position,
-			velocity=(self.faceToTarget(2000),0),
-			ttl=0.150,damage=5,radius=16,level=1,type_='hit')
-		ssound.Play('rc/snd/hit.wav')
-		self.consoleInfo('strike')
-
-	def on_hurt(self, damage):
-		self.consoleInfo('damaged',damage)
-
-	def on_smash(self):
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(100),self.position[1]+200),
-			velocity=(self.faceToTarget(1000),-2000),
-			ttl=0.3,damage=15,radius=100,level=1,type_='smash')
-		ssound.Play('rc/snd/smash.wav')
-		self.consoleInfo('smashing')
-
-	def on_throw(self):
-		# время полёта в одну сторону подобрано в ручную
-		local_ttl = 1.2
-		FlyingGuitar.static_init(
-			game=self.game,
-			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
-			velocity=(self.faceToTarget(2000),0),
-			angularVelocity=(self.faceToTarget(720)),
-			sprite="rc/img/fg-girl-guitar.png",
-			ttl=local_ttl
-		)
-		Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(100),self.position[1]-100),
-			velocity=(self.faceToTarget(2000),0),
-			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar')
-		self.game.scheduleAfter(local_ttl,lambda : Hurter.static_init(
-			game=self.game,
-			owner=self,
-			position=(self.position[0]+self.faceToTarget(100+2500),self.position[1]-100),
-			velocity=(-self.faceToTarget(2000),0),
-			ttl=local_ttl,damage=12,radius=100,level=11,type_='guitar'))
-		ssound.Play('rc/snd/chainsaw.wav')
-		self.consoleInfo('throw')
-
-	def on_jump(self):
-		ssound.Play('rc/snd/hu.wav')
-
-class AtomskFighter(PlayerBase):
-	FIGHTER_NAME = 'Atomsk'
-	pass
-
-class FlyingGuitar(GameEntity,GameEntity.mixin.Movement,GameEntity.mixin.Sprite):
-
-	@staticmethod
-	def static_init(game,position,velocity,angularVelocity,sprite,ttl):
-		self = FlyingGuitar()
-		game.addEntity(self)
-
-		self.ttl = ttl
-		self.position = position
-		self.velocity = velocity
-		self.angularVelocity = angularVelocity
-		game.scheduleAfter(self.ttl, self.changeDirection)
-		self.sprite = sprite
-		self.spriteAnchor = 'center'
-		# self.scale = (self.radius/16.0)
-		return self
-
-	def changeDirection(self):
-		vx,vy =  self.velocity
-		self.velocity = (-vx,vy)
-		self.angularVelocity = - self.angularVelocity
-		self.game.scheduleAfter(self.ttl, self.destroy)
-
 GLOBAL_STATE = {'player-left':0,'player-right':0,'round':1}
-PLAYER_VARIANTS = [HarukoFighter,NaotaFighter]
-PLAYER_DEFAULTS = {'player-left': NaotaFighter, 'player-right': HarukoFighter}
-PLAYER_CHOICES = {'player-left': NaotaFighter, 'player-right': HarukoFighter}
-PLAYER_NEXT = {NaotaFighter: HarukoFighter, HarukoFighter: NaotaFighter}
 
-music.Play("rc/snd/music/fourth.ogg")
+# Иконки бойцов и рамки полосок здоровья декодируются в фоне, пока открывается окно.
+for pcl in PLAYER_VARIANTS:
+	ASSETS.image(pcl.ICON_IMAGE)
+	ASSETS.image(pcl.ICON_IMAGE_L)
+ASSETS.image('rc/img/ui-frames.png')
+for pics in Hurter._FX_PICS.values():
+	for path in pics:
+		ASSETS.image(path)
+
+# Музыка запускается после первого кадра, а не при импорте.
+pyglet.clock.schedule_once(lambda dt: music.Play("rc/snd/music/fourth.ogg"),0)
 
 GAME_CONSOLE.visible = False
@@ -0,0 +1,168 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Журнал событий боя. Запись - кортеж (номер, шаг, уровень, id сущности,
+событие, аргументы) в кольцевом буфере фиксированного размера; строкой она
+становится, только когда её показывают (игровая консоль) или выгружают.
+
+Уровень задаётся для журнала и отдельно для событий (setLevel): запись ниже
+уровня отбрасывается одним сравнением, ещё до создания кортежа.
+
+CompressedFileSink пишет записи в сжатый файл на раунд в отдельном потоке:
+кадр только кладёт запись в очередь.
+
+	$ python gamelog.py
+'''
+
+import gzip
+import os
+import queue
+import threading
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+_NAMES = {DEBUG: 'debug',INFO: 'info',WARNING: 'warning'}
+
+def formatRecord(record):
+	seq, tick, level, entity, event, args = record
+	text = '{:>6} {} {}'.format(tick,entity,event)
+	if args:
+		text += ' ' + ' '.join(str(a) for a in args)
+	return text
+
+class GameLog(object):
+	def __init__(self,capacity=4096,level=INFO):
+		self.capacity = capacity
+		self.level = level
+		self._levels = {}
+		self._records = [None] * capacity
+		# Номер следующей записи; запись n лежит в _records[n % capacity].
+		self.count = 0
+		self.sinks = []
+
+	def setLevel(self,level,*events):
+		'''
+		Уровень журнала или, если перечислены события, уровень этих событий.
+		'''
+		if events:
+			for event in events:
+				self._levels[event] = level
+		else:
+			self.level = level
+
+	def enabled(self,level,event=None):
+		return level >= self._levels.get(event,self.level)
+
+	def write(self,level,tick,entity,event,*args):
+		if level < self._levels.get(event,self.level):
+			return
+		record = (self.count,tick,level,entity,event,args)
+		self._records[self.count % self.capacity] = record
+		self.count += 1
+		for sink in self.sinks:
+			sink.write(record)
+
+	def since(self,seq):
+		'''
+		Записи с номера seq, ещё оставшиеся в буфере.
+		'''
+		start = max(seq,self.count - self.capacity,0)
+		records = self._records
+		capacity = self.capacity
+		return [records[n % capacity] for n in range(start,self.count)]
+
+	def tail(self,n):
+		'''
+		Последние n записей строками.
+		'''
+		return [formatRecord(r) for r in self.since(self.count - n)]
+
+	def clear(self):
+		self._records = [None] * self.capacity
+		self.count = 0
+
+# Журнал, который ничего не пишет: подставляется на время служебных симуляций.
+SILENT = GameLog(capacity=1,level=OFF)
+
+class CompressedFileSink(object):
+	'''
+	Пишет записи журнала в directory/<раунд>.log.gz из фонового потока.
+	'''
+	def __init__(self,directory):
+		self.directory = directory
+		self._queue = queue.SimpleQueue()
+		self._thread = threading.Thread(target=self._run,name='gamelog-sink')
+		self._thread.daemon = True
+		self._thread.start()
+
+	def write(self,record):
+		self._queue.put(record)
+
+	def startRound(self,name):
+		'''
+		Следующие записи - в новый файл name.log.gz.
+		'''
+		self._queue.put(os.path.join(self.directory,name+'.log.gz'))
+
+	def close(self):
+		self._queue.put(None)
+		self._thread.join()
+
+	def _run(self):
+		out = None
+		try:
+			while True:
+				item = self._queue.get()
+				if item is None:
+					return
+				if isinstance(item,str):
+					if out is not None:
+						out.close()
+					if not os.path.isdir(self.directory):
+						os.makedirs(self.directory)
+					out = gzip.open(item,'wt',encoding='utf-8')
+				elif out is not None:
+					out.write('{} {}\n'.format(_NAMES.get(item[2],item[2]),formatRecord(item)))
+		finally:
+			if out is not None:
+				out.close()
+
+def _selfcheck():
+	import tempfile
+	import time
+
+	log = GameLog(capacity=8)
+	log.setLevel(OFF,'state-change')
+	for t in range(20):
+		log.write(INFO,t,'player-left','strike')
+		log.write(INFO,t,'player-left','state-change','standing')
+		log.write(DEBUG,t,'player-left','damaged',5)
+	assert log.count == 20, log.count
+	assert [r[1] for r in log.since(0)] == list(range(12,20))
+	assert log.tail(1) == ['    19 player-left strike'], log.tail(1)
+
+	started = time.perf_counter()
+	for t in range(100000):
+		log.write(DEBUG,t,'player-left','damaged',5)
+	filtered = (time.perf_counter() - started) / 100000 * 1e9
+	started = time.perf_counter()
+	for t in range(100000):
+		log.write(INFO,t,'player-left','strike')
+	stored = (time.perf_counter() - started) / 100000 * 1e9
+
+	directory = tempfile.mkdtemp()
+	sink = CompressedFileSink(directory)
+	log.sinks.append(sink)
+	sink.startRound('round-1')
+	log.write(INFO,1,'player-right','damaged',5)
+	sink.close()
+	with gzip.open(os.path.join(directory,'round-1.log.gz'),'rt') as f:
+		assert f.read() == 'info      1 player-right damaged 5\n'
+	print('ok: filtered record {:.0f} ns, stored record {:.0f} ns'.format(filtered,stored))
+
+if __name__ == '__main__':
+	_selfcheck()
@@ -0,0 +1,307 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Интерфейс поверх боя (полоски здоровья и надписи) одним пакетом.
+
+Вершины всех полосок лежат в одном массиве и пересобираются, только когда у
+какой-нибудь полоски поменялись значение или положение; цвет полоски - цвет
+вершин, а не glColor. Надписи - pyglet.text.Label в общем pyglet.graphics.Batch,
+свойства меняются, только если действительно изменились.
+
+HudBatch.stats - число вызовов отрисовки и смен состояния GL за последний кадр.
+Вместо модуля gl можно передать RecordingGL и проверять вызовы без видеокарты:
+
+	$ python hud.py
+'''
+
+import ctypes
+
+class CountingGL(object):
+	'''
+	Обёртка над модулем gl: glDraw* считаются вызовами отрисовки, остальные gl* - сменами состояния.
+	'''
+	def __init__(self,gl):
+		self._gl = gl
+		self.drawCalls = 0
+		self.stateChanges = 0
+
+	def __getattr__(self,name):
+		value = getattr(self._gl,name)
+		if not name.startswith('gl'):
+			return value
+		draw = name.startswith('glDraw')
+
+		def call(*args):
+			if draw:
+				self.drawCalls += 1
+			else:
+				self.stateChanges += 1
+			return value(*args)
+		setattr(self,name,call)
+		return call
+
+	def reset(self):
+		self.drawCalls = 0
+		self.stateChanges = 0
+
+class RecordingGL(object):
+	'''
+	Заглушка модуля gl: запоминает вызовы в calls, константы GL_* равны своим именам.
+	'''
+	def __init__(self):
+		self.calls = []
+
+	def __getattr__(self,name):
+		if name.startswith('GL_'):
+			return name
+		if not name.startswith('gl'):
+			raise AttributeError(name)
+
+		def call(*args):
+			self.calls.append((name,args))
+		return call
+
+class PygletText(object):
+	'''
+	Надписи в одном pyglet.graphics.Batch.
+	'''
+	def __init__(self):
+		import pyglet
+		self._pyglet = pyglet
+		self.batch = pyglet.graphics.Batch()
+
+	def label(self,**kwargs):
+		return self._pyglet.text.Label(batch=self.batch,**kwargs)
+
+	def draw(self):
+		self.batch.draw()
+
+class RecordingText(object):
+	'''
+	Заглушка PygletText для проверок без окна.
+	'''
+	class Label(object):
+		def __init__(self,**kwargs):
+			self.__dict__.update(kwargs)
+
+		def delete(self):
+			pass
+
+	def __init__(self):
+		self.draws = 0
+
+	def label(self,**kwargs):
+		return RecordingText.Label(**kwargs)
+
+	def draw(self):
+		self.draws += 1
+
+def nineSlice(dest,src,texture):
+	'''
+	Девять четырёхугольников картинки src (left, bottom, width, height в пикселях
+	текстуры), растянутой на dest: углы не растягиваются, края - вдоль, середина - в обе стороны.
+	Возвращает (вершины, текстурные координаты) для GL_QUADS.
+	'''
+	dx, dy, dw, dh = dest
+	sx, sy, sw, sh = src
+	bx, by = sw / 3.0, sh / 3.0
+	# Края не шире половины цели, иначе углы налезут друг на друга.
+	ex, ey = min(bx,dw / 2.0), min(by,dh / 2.0)
+	ku = texture.tex_coords[3] / texture.width
+	kv = texture.tex_coords[7] / texture.height
+
+	xs = (dx,dx + ex,dx + dw - ex,dx + dw)
+	ys = (dy,dy + ey,dy + dh - ey,dy + dh)
+	us = [u * ku for u in (sx,sx + bx,sx + sw - bx,sx + sw)]
+	vs = [v * kv for v in (sy,sy + by,sy + sh - by,sy + sh)]
+
+	vertices = []
+	texcoords = []
+	for j in range(3):
+		for i in range(3):
+			vertices.extend((xs[i],ys[j],xs[i+1],ys[j],xs[i+1],ys[j+1],xs[i],ys[j+1]))
+			texcoords.extend((us[i],vs[j],us[i+1],vs[j],us[i+1],vs[j+1],us[i],vs[j+1]))
+	return vertices, texcoords
+
+def barColor(value):
+	if value < 0.4:
+		return (255,0,0,255)
+	elif value < 0.7:
+		return (255,255,0,255)
+	return (0,255,0,255)
+
+class HudBar(object):
+	'''
+	Полоска: рамка back и заливка front (области текстуры HudBatch), заливка
+	растёт от левого или правого края (origin 'top-left' или 'top-right').
+	'''
+	__slots__ = ('hud','back','front','origin','rect','value')
+
+	def __init__(self,hud,back,front,origin):
+		self.hud = hud
+		self.back = back
+		self.front = front
+		self.origin = origin
+		self.rect = None
+		self.value = None
+
+	def set(self,rect,value):
+		if rect != self.rect or value != self.value:
+			self.rect = rect
+			self.value = value
+			self.hud._dirty = True
+
+	def quads(self,texture):
+		vertices, texcoords = nineSlice(self.rect,self.back,texture)
+		colors = [255] * (len(vertices) * 2)
+		k = max(0.0,min(1.0,self.value))
+		if k > 0:
+			left, bottom, width, height = self.rect
+			inner = (left + 5,bottom + 5,width - 10,height - 10)
+			fill = inner[2] * k
+			if self.origin == 'top-right':
+				inner = (inner[0] + inner[2] - fill,inner[1],fill,inner[3])
+			else:
+				inner = (inner[0],inner[1],fill,inner[3])
+			v, t = nineSlice(inner,self.front,texture)
+			vertices.extend(v)
+			texcoords.extend(t)
+			colors.extend(barColor(k) * (len(v) // 2))
+		return vertices, texcoords, colors
+
+class HudText(object):
+	'''
+	Надпись; свойства pyglet-надписи меняются, только когда изменились.
+	'''
+	__slots__ = ('hud','label','state')
+
+	_PROPS = ('text','x','y','font_size','color','anchor_x','anchor_y','font_name')
+
+	def __init__(self,hud):
+		self.hud = hud
+		self.label = None
+		self.state = None
+
+	def set(self,text,x,y,font_size=14,color=(255,255,0,255),anchor_x='center',anchor_y='center',font_name=None):
+		state = (text,x,y,font_size,color,anchor_x,anchor_y,font_name)
+		if state == self.state:
+			return
+		self.hud.stats['textUpdates'] += 1
+		if self.label is None:
+			self.label = self.hud.text.label(**dict(zip(self._PROPS,state)))
+		else:
+			for name, old, new in zip(self._PROPS,self.state,state):
+				if old != new:
+					setattr(self.label,name,new)
+		self.state = state
+
+	def delete(self):
+		if self.label is not None:
+			self.label.delete()
+			self.label = None
+		if self in self.hud.texts:
+			self.hud.texts.remove(self)
+
+class HudBatch(object):
+	def __init__(self,texture=None,gl=None,text=None):
+		if gl is None:
+			from pyglet import gl
+		self.gl = CountingGL(gl)
+		self.text = text if text is not None else PygletText()
+		self.texture = texture
+		self.bars = []
+		self.texts = []
+		self._dirty = True
+		self._count = 0
+		self._arrays = None
+		self.stats = {'drawCalls': 0,'stateChanges': 0,'rebuilds': 0,'textUpdates': 0}
+
+	def bar(self,back,front,origin='top-left'):
+		b = HudBar(self,back,front,origin)
+		self.bars.append(b)
+		self._dirty = True
+		return b
+
+	def label(self):
+		t = HudText(self)
+		self.texts.append(t)
+		return t
+
+	def _rebuild(self):
+		vertices, texcoords, colors = [], [], []
+		for b in self.bars:
+			if b.rect is None:
+				continue
+			v, t, c = b.quads(self.texture)
+			vertices.extend(v)
+			texcoords.extend(t)
+			colors.extend(c)
+		self._count = len(vertices) // 2
+		self._arrays = ((ctypes.c_float * len(vertices))(*vertices),
+			(ctypes.c_float * len(texcoords))(*texcoords),
+			(ctypes.c_ubyte * len(colors))(*colors))
+		self._dirty = False
+		self.stats['rebuilds'] += 1
+
+	def draw(self):
+		'''
+		Рисует все полоски одним glDrawArrays и все надписи одним Batch.draw.
+		'''
+		gl = self.gl
+		gl.reset()
+		if self._dirty:
+			self._rebuild()
+
+		if self._count:
+			texture = self.texture
+			vertices, texcoords, colors = self._arrays
+			gl.glEnable(texture.target)
+			gl.glBindTexture(texture.target,texture.id)
+			gl.glEnableClientState(gl.GL_VERTEX_ARRAY)
+			gl.glEnableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+			gl.glEnableClientState(gl.GL_COLOR_ARRAY)
+			gl.glVertexPointer(2,gl.GL_FLOAT,0,vertices)
+			gl.glTexCoordPointer(2,gl.GL_FLOAT,0,texcoords)
+			gl.glColorPointer(4,gl.GL_UNSIGNED_BYTE,0,colors)
+			gl.glDrawArrays(gl.GL_QUADS,0,self._count)
+			gl.glDisableClientState(gl.GL_COLOR_ARRAY)
+			gl.glDisableClientState(gl.GL_TEXTURE_COORD_ARRAY)
+			gl.glDisableClientState(gl.GL_VERTEX_ARRAY)
+			gl.glDisable(texture.target)
+
+		draws = gl.drawCalls
+		if self.texts:
+			self.text.draw()
+			draws += 1
+		self.stats['drawCalls'] = draws
+		self.stats['stateChanges'] = gl.stateChanges
+
+def _selfcheck():
+	class Texture(object):
+		id = 1
+		target = 'GL_TEXTURE_2D'
+		width = height = 32
+		tex_coords = (0,0,0,1,0,0,1,1,0,0,1,0)
+
+	gl = RecordingGL()
+	hud = HudBatch(Texture(),gl=gl,text=RecordingText())
+	left = hud.bar((0,0,12,12),(12,0,12,12))
+	right = hud.bar((0,0,12,12),(12,0,12,12),origin='top-right')
+	timer = hud.label()
+
+	for frame in range(10):
+		left.set((10,500,100,30),1.0 - frame * 0.01 if frame < 3 else 0.97)
+		right.set((900,500,100,30),1.0)
+		timer.set(str(60 - frame // 5),512,580)
+		hud.draw()
+		assert hud.stats['drawCalls'] == 2, hud.stats
+	draws = [args for name, args in gl.calls if name == 'glDrawArrays']
+	assert len(draws) == 10 and draws[0][2] == 4 * 9 * 4, draws[0]
+	# Полоска менялась на кадрах 0-3, таймер - на 0 и 5.
+	assert hud.stats['rebuilds'] == 4, hud.stats
+	assert hud.stats['textUpdates'] == 2, hud.stats
+	print('ok: {} GL calls in 10 frames, last frame {}'.format(len(gl.calls),hud.stats))
+
+if __name__ == '__main__':
+	_selfcheck()
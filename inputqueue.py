@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Очередь ввода с отметками времени.
+
+Нажатие из обработчика окна не применяется сразу, а ставится в очередь с
+time.perf_counter(). FightGame.update перед каждым шагом применяет нажатия,
+случившиеся до конца этого шага по настенным часам: нажатие между двумя
+шагами одного кадра попадает в нужный шаг, а не в первый шаг кадра.
+
+Для каждого нажатия считаются задержки: от нажатия до шага, в котором оно
+применено (input-to-tick), и до показа кадра с этим шагом (input-to-present).
+'''
+
+import collections
+import time
+
+_clock = time.perf_counter
+
+class LatencyStats(object):
+	'''
+	Последние SAMPLES задержек в секундах.
+	'''
+	SAMPLES = 512
+
+	def __init__(self):
+		self.samples = collections.deque(maxlen=self.SAMPLES)
+		self.count = 0
+
+	def add(self,seconds):
+		self.samples.append(seconds)
+		self.count += 1
+
+	def summary(self):
+		'''
+		{'count', 'mean', 'p50', 'p99', 'max'} в миллисекундах.
+		'''
+		values = sorted(self.samples)
+		if not values:
+			return {'count': self.count,'mean': 0.0,'p50': 0.0,'p99': 0.0,'max': 0.0}
+		n = len(values)
+		return {'count': self.count,'mean': sum(values) / n * 1000.0,'p50': values[n // 2] * 1000.0,
+			'p99': values[min(n - 1,int(n * 0.99))] * 1000.0,'max': values[-1] * 1000.0}
+
+class InputQueue(object):
+	def __init__(self,game):
+		self.game = game
+		self._queue = collections.deque()
+		self._applied = []
+		self.toTick = LatencyStats()
+		self.toPresent = LatencyStats()
+
+	def __len__(self):
+		return len(self._queue)
+
+	def push(self,side,action,pressed=True,kw=None,stamp=None):
+		self._queue.append((_clock() if stamp is None else stamp,side,action,pressed,kw))
+
+	def apply(self,until):
+		'''
+		Передаёт игре нажатия с отметкой не позже until (конец ближайшего шага).
+		'''
+		queue = self._queue
+		if not queue:
+			return
+		now = _clock()
+		game = self.game
+		while queue and queue[0][0] <= until:
+			stamp, side, action, pressed, kw = queue.popleft()
+			game.input(side,action,pressed,kw)
+			self.toTick.add(now - stamp)
+			self._applied.append(stamp)
+
+	def clear(self):
+		'''
+		Забывает ещё не применённые нажатия (новый раунд).
+		'''
+		self._queue.clear()
+		self._applied = []
+
+	def flush(self):
+		'''
+		Применяет всё, что накопилось (например, когда шаги делает не update).
+		'''
+		self.apply(float('inf'))
+
+	def presented(self,now=None):
+		'''
+		Вызывается после отрисовки кадра: применённые нажатия стали видны.
+		'''
+		if not self._applied:
+			return
+		now = _clock() if now is None else now
+		for stamp in self._applied:
+			self.toPresent.add(now - stamp)
+		self._applied = []
+
+	def report(self):
+		return 'input->tick {p50:.1f}/{p99:.1f} ms, input->present {0[p50]:.1f}/{0[p99]:.1f} ms (p50/p99, {count} inputs)'.format(
+			self.toPresent.summary(),**self.toTick.summary())
@@ -1,12 +1,53 @@
 #!/usr/bin/python
 # coding=UTF-8
 
+import sys
+import time
+
+STARTED = time.time()
+
 import pyglet
 
 from game import *
+from assets import ASSETS
 from fwk.ui.main_window import MainWindow
 
+def reportStartup(dt):
+	print('Startup to first frame: {:.3f}s'.format(time.time() - STARTED))
+	print(ASSETS.report())
+
+def startNetplay(args):
+	'''
+	--netplay left|right LOCALPORT HOST:PORT
+	'''
+	import game
+	from netplay import UdpTransport
+	i = args.index('--netplay')
+	side, port, peer = args[i+1], int(args[i+2]), args[i+3]
+	host, peerPort = peer.rsplit(':',1)
+	game.NETPLAY = {'side': side,'transport': UdpTransport(('0.0.0.0',port),(host,int(peerPort)))}
+
 if __name__ == '__main__':
+	if '--netplay' in sys.argv:
+		startNetplay(sys.argv)
+	if '--cpu-budget' in sys.argv:
+		# Бюджет компьютерного бойца на кадр, мс.
+		import game
+		game.CPU_BUDGET = float(sys.argv[sys.argv.index('--cpu-budget')+1]) / 1000.0
+	if '--cpu-worker' in sys.argv:
+		import game
+		game.CPU_WORKER = True
+	if '--spectate' in sys.argv:
+		# Порт трансляции боя зрителям.
+		import game
+		game.SPECTATE_PORT = int(sys.argv[sys.argv.index('--spectate')+1])
+	if '--log' in sys.argv:
+		# Каталог для сжатых журналов событий раундов.
+		import game
+		game.LOG_DIR = sys.argv[sys.argv.index('--log')+1]
 	window = MainWindow( )
 	window.set_size(1024,600)
+	if '--startup-time' in sys.argv:
+		# Первый вызов часов происходит после отрисовки первого кадра.
+		pyglet.clock.schedule_once(reportStartup,0)
 	pyglet.app.run( )
@@ -0,0 +1,315 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Хранилище движения в массивах NumPy вместо кортежей в каждой сущности.
+
+Положения, скорости, углы и угловые скорости всех движущихся сущностей
+лежат в хранилище игры (FightGame.movers), FightGame сдвигает их все одним
+шагом после update сущностей. Атрибуты self.position, self.velocity,
+self.rotation и self.angularVelocity остаются: это свойства, читающие и
+пишущие строку хранилища.
+
+Без NumPy (ENABLED = False) хранилище - списки (ListStore) с тем же порядком
+и теми же операциями над float, поэтому бой с NumPy и без него идёт
+одинаково: повтор и сетевая игра не расходятся.
+'''
+
+import operator
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+ENABLED = numpy is not None
+
+def createStore():
+	return MovementStore() if ENABLED else ListStore()
+
+class MovementStore(object):
+	def __init__(self,capacity=256):
+		self.size = 0
+		self._free = []
+		# Сущность в каждой строке (None - строка свободна).
+		self.owners = []
+		self._alloc(capacity)
+
+	def _alloc(self,capacity):
+		pos = numpy.zeros((capacity,2))
+		vel = numpy.zeros((capacity,2))
+		rot = numpy.zeros(capacity)
+		spin = numpy.zeros(capacity)
+		seen = numpy.zeros((capacity,2))
+		if self.size:
+			pos[:self.size] = self.pos[:self.size]
+			vel[:self.size] = self.vel[:self.size]
+			rot[:self.size] = self.rot[:self.size]
+			spin[:self.size] = self.spin[:self.size]
+			seen[:self.size] = self._seen[:self.size]
+		self.pos, self.vel, self.rot, self.spin, self._seen = pos, vel, rot, spin, seen
+		self.capacity = capacity
+
+	def __len__(self):
+		return self.size - len(self._free)
+
+	def allocate(self):
+		if self._free:
+			return self._free.pop()
+		if self.size == self.capacity:
+			self._alloc(self.capacity * 2)
+		self.size += 1
+		self.owners.append(None)
+		return self.size - 1
+
+	def free(self,slot):
+		self.pos[slot] = 0
+		self.vel[slot] = 0
+		self.rot[slot] = 0
+		self.spin[slot] = 0
+		self._free.append(slot)
+
+	def attach(self,entity):
+		'''
+		Переносит движение сущности в хранилище.
+		'''
+		values = entity.__dict__.pop('_movement',None) or {}
+		slot = self.allocate()
+		self.pos[slot] = values.get('position',(0.0,0.0))
+		self.vel[slot] = values.get('velocity',(0.0,0.0))
+		self.rot[slot] = values.get('rotation',0.0)
+		self.spin[slot] = values.get('angularVelocity',0.0)
+		self.owners[slot] = entity
+		entity.__dict__['_mstore'] = self
+		entity.__dict__['_mslot'] = slot
+
+	def detach(self,entity):
+		'''
+		Возвращает движение в саму сущность (например, когда её удаляют из игры).
+		'''
+		slot = entity.__dict__.pop('_mslot')
+		self.owners[slot] = None
+		del entity.__dict__['_mstore']
+		entity.__dict__['_movement'] = {'position': tuple(self.pos[slot].tolist()),
+			'velocity': tuple(self.vel[slot].tolist()),'rotation': float(self.rot[slot]),
+			'angularVelocity': float(self.spin[slot])}
+		self.free(slot)
+
+	def integrate(self,dt):
+		n = self.size
+		self.pos[:n] += self.vel[:n] * dt
+		self.rot[:n] += self.spin[:n] * dt
+
+	def moved(self):
+		'''
+		Сущности, положение которых изменилось с прошлого вызова: одно сравнение массивов.
+		'''
+		n = self.size
+		changed = numpy.nonzero((self.pos[:n] != self._seen[:n]).any(axis=1))[0].tolist()
+		self._seen[:n] = self.pos[:n]
+		owners = self.owners
+		return [owners[i] for i in changed if owners[i] is not None]
+
+	def values(self,array,slots):
+		'''
+		Значения столбца array для строк slots одним чтением: пары (x, y) или числа.
+		'''
+		column = getattr(self,array)[slots]
+		if column.ndim == 1:
+			return column.tolist()
+		# Плоский список и пары из него дешевле, чем tolist() со списком на строку.
+		flat = iter(column.ravel().tolist())
+		return list(zip(flat,flat))
+
+	def setVector(self,array,slot,value):
+		getattr(self,array)[slot] = value
+
+	def setScalar(self,array,slot,value):
+		getattr(self,array)[slot] = value
+
+	def view(self,array,slot):
+		return getattr(self,array)[slot]
+
+class ListStore(object):
+	'''
+	MovementStore без NumPy (createStore): векторы - кортежи float в списках.
+	'''
+	def __init__(self):
+		self.pos = []
+		self.vel = []
+		self.rot = []
+		self.spin = []
+		self._free = []
+		self.owners = []
+		self._seen = []
+
+	@property
+	def size(self):
+		return len(self.pos)
+
+	def __len__(self):
+		return len(self.pos) - len(self._free)
+
+	def allocate(self):
+		if self._free:
+			return self._free.pop()
+		self.pos.append((0.0,0.0))
+		self.vel.append((0.0,0.0))
+		self.rot.append(0.0)
+		self.spin.append(0.0)
+		self.owners.append(None)
+		self._seen.append((0.0,0.0))
+		return len(self.pos) - 1
+
+	def free(self,slot):
+		self.pos[slot] = self.vel[slot] = (0.0,0.0)
+		self.rot[slot] = self.spin[slot] = 0.0
+		self._free.append(slot)
+
+	def attach(self,entity):
+		values = entity.__dict__.pop('_movement',None) or {}
+		slot = self.allocate()
+		self.setVector('pos',slot,values.get('position',(0.0,0.0)))
+		self.setVector('vel',slot,values.get('velocity',(0.0,0.0)))
+		self.rot[slot] = float(values.get('rotation',0.0))
+		self.spin[slot] = float(values.get('angularVelocity',0.0))
+		self.owners[slot] = entity
+		entity.__dict__['_mstore'] = self
+		entity.__dict__['_mslot'] = slot
+
+	def detach(self,entity):
+		slot = entity.__dict__.pop('_mslot')
+		self.owners[slot] = None
+		del entity.__dict__['_mstore']
+		entity.__dict__['_movement'] = {'position': self.pos[slot],'velocity': self.vel[slot],
+			'rotation': self.rot[slot],'angularVelocity': self.spin[slot]}
+		self.free(slot)
+
+	def integrate(self,dt):
+		# Те же действия, что и у MovementStore: p + v * dt для каждой координаты.
+		pos, vel, rot, spin = self.pos, self.vel, self.rot, self.spin
+		for i in range(len(pos)):
+			p, v = pos[i], vel[i]
+			pos[i] = p[0] + v[0] * dt, p[1] + v[1] * dt
+			rot[i] += spin[i] * dt
+
+	def moved(self):
+		pos, seen, owners = self.pos, self._seen, self.owners
+		moved = []
+		for i in range(len(pos)):
+			if pos[i] != seen[i]:
+				seen[i] = pos[i]
+				if owners[i] is not None:
+					moved.append(owners[i])
+		return moved
+
+	def values(self,array,slots):
+		column = getattr(self,array)
+		return [column[slot] for slot in slots]
+
+	def setVector(self,array,slot,value):
+		getattr(self,array)[slot] = float(value[0]), float(value[1])
+
+	def setScalar(self,array,slot,value):
+		getattr(self,array)[slot] = float(value)
+
+	def view(self,array,slot):
+		raise TypeError('Movement views need NumPy')
+
+_SLOT = operator.attrgetter('_mslot')
+
+def values(entities,array='pos'):
+	'''
+	Столбец array ('pos', 'vel', 'rot', 'spin') сущностей entities одним чтением
+	хранилища, без свойства на каждую: для тех, кто за шаг читает многих
+	(столкновения, трансляция). Пары - кортежи, как у свойств.
+	Все сущности должны быть в одном хранилище.
+	'''
+	if not entities:
+		return []
+	return entities[0]._mstore.values(array,list(map(_SLOT,entities)))
+
+def array(entities,array='pos'):
+	'''
+	То же, что values, но массивом NumPy (копией строк); только с NumPy.
+	'''
+	store = entities[0]._mstore
+	return getattr(store,array)[list(map(_SLOT,entities))]
+
+# Чтение одной сущности - самое частое действие, поэтому оно без вызова метода
+# хранилища: свойства читают массивы того хранилища, которое даёт createStore.
+
+def _vector(name,array):
+	def get(self):
+		store = self.__dict__.get('_mstore')
+		if store is None:
+			return self.__dict__.get('_movement',{}).get(name,(0.0,0.0))
+		if ENABLED:
+			values, slot = getattr(store,array), self._mslot
+			return values.item(slot,0), values.item(slot,1)
+		return getattr(store,array)[self._mslot]
+
+	def set(self,value):
+		store = self.__dict__.get('_mstore')
+		if store is None:
+			self.__dict__.setdefault('_movement',{})[name] = tuple(value)
+		else:
+			store.setVector(array,self._mslot,value)
+	return property(get,set)
+
+def _scalar(name,array):
+	def get(self):
+		store = self.__dict__.get('_mstore')
+		if store is None:
+			return self.__dict__.get('_movement',{}).get(name,0.0)
+		if ENABLED:
+			return getattr(store,array).item(self._mslot)
+		return getattr(store,array)[self._mslot]
+
+	def set(self,value):
+		store = self.__dict__.get('_mstore')
+		if store is None:
+			self.__dict__.setdefault('_movement',{})[name] = value
+		else:
+			store.setScalar(array,self._mslot,value)
+	return property(get,set)
+
+def _view(array):
+	def get(self):
+		return self._mstore.view(array,self._mslot)
+	return property(get)
+
+class StoredMovement(object):
+	'''
+	Замена GameEntity.mixin.Movement: движение лежит в FightGame.movers.
+
+	От миксина fwk остаются атрибуты position, velocity, rotation и
+	angularVelocity. Его шаг (position += velocity * dt, rotation +=
+	angularVelocity * dt после update сущности) делает FightGame.movers.integrate
+	для всех сразу. Сам миксин из баз убирается (movable), иначе положение
+	сдвигалось бы дважды; проверки isinstance(e, GameEntity.mixin.Movement)
+	на таких сущностях не срабатывают - в этом проекте их нет.
+
+	positionView и velocityView (только с NumPy) - сами строки массивов,
+	изменяемые numpy-виды. Вид годен до следующего добавления сущности в игру:
+	когда хранилище растёт, массивы заменяются новыми и старый вид больше не
+	связан с сущностью. Его нужно брать заново, а не хранить.
+	'''
+	__slots__ = ()
+
+	position = _vector('position','pos')
+	velocity = _vector('velocity','vel')
+	rotation = _scalar('rotation','rot')
+	angularVelocity = _scalar('angularVelocity','spin')
+
+	positionView = _view('pos')
+	velocityView = _view('vel')
+
+def movable(*bases):
+	'''
+	Базы класса движущейся сущности: GameEntity.mixin.Movement заменяется на
+	StoredMovement (первым, чтобы его свойства не перекрывались); что именно
+	заменяется - в описании StoredMovement.
+	'''
+	from fwk.game.entity import GameEntity
+	return (StoredMovement,) + tuple(b for b in bases if b is not GameEntity.mixin.Movement)
@@ -0,0 +1,396 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Сетевая игра вдвоём по UDP с откатом (как в GGPO).
+
+Ввод каждого игрока на шаге - маска зажатых кнопок. Ввод соседа, который ещё
+не пришёл, предсказывается (повторяется последний известный), шаг считается
+сразу, без задержки ввода. Когда приходит ввод, не совпавший с предсказанием,
+игра откатывается к снимку (snapshot.py) этого шага и пересчитывается заново.
+
+Проверка на localhost через прокси с задержкой и потерями:
+
+	$ python netplay.py --latency 0.1 --loss 0.05 --ticks 600
+'''
+
+import heapq
+import random
+import select
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import fighters
+import gamelog
+from snapshot import capture
+
+BUTTONS = ('jump','left','right','hit','special','throw','block')
+_BIT = {b: 1 << i for i, b in enumerate(BUTTONS)}
+
+# Сколько шагов можно уйти вперёд от последнего подтверждённого ввода соседа.
+MAX_ROLLBACK = 10
+# Сколько последних масок повторяется в каждом пакете на случай потерь.
+_RESEND = 32
+
+_HELLO = 0
+_INPUT = 1
+_HELLO_HEAD = struct.Struct('<BHBI')
+_INPUT_HEAD = struct.Struct('<BiiB')
+
+def button(action,kw=None):
+	'''
+	Кнопка из словаря BUTTONS для действия из GameLayer._KEYMAP.
+	'''
+	if action == 'go':
+		return 'left' if (kw or {}).get('direction',0) < 0 else 'right'
+	return action
+
+def applyMask(game,side,prev,mask):
+	'''
+	Передаёт игре нажатия и отпускания, которыми маска mask отличается от prev.
+	'''
+	changed = prev ^ mask
+	if not changed:
+		return
+	for name in BUTTONS:
+		bit = _BIT[name]
+		if changed & bit:
+			if name in ('left','right'):
+				game.input(side,'go',bool(mask & bit),{'direction': -1 if name == 'left' else 1})
+			else:
+				game.input(side,name,bool(mask & bit))
+
+class UdpTransport(object):
+	def __init__(self,bind,remote):
+		self.remote = remote
+		self.sock = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+		self.sock.bind(bind)
+		self.sock.setblocking(False)
+
+	def send(self,data):
+		try:
+			self.sock.sendto(data,self.remote)
+		except socket.error:
+			pass
+
+	def receive(self):
+		packets = []
+		while True:
+			try:
+				data, addr = self.sock.recvfrom(2048)
+			except socket.error:
+				return packets
+			packets.append(data)
+
+	def close(self):
+		self.sock.close()
+
+class Handshake(object):
+	'''
+	Обмен классами бойцов и зерном (берётся у левого игрока) без ожидания:
+	poll() вызывается каждый кадр, повторяет привет, пока сосед не ответил,
+	и возвращает None, а после ответа - (класс бойца соседа, зерно раунда).
+	Приветы другого раунда (round) не принимаются.
+	'''
+	RESEND = 0.1
+
+	def __init__(self,transport,localSide,fighter,seed,round=0):
+		mine = fighter.encode('ascii')
+		self.transport = transport
+		self.localSide = localSide
+		self.seed = seed
+		self.round = round & 0xffff
+		self.hello = _HELLO_HEAD.pack(_HELLO,self.round,len(mine),seed) + mine
+		self.result = None
+		self._sent = None
+
+	def poll(self):
+		if self.result is not None:
+			return self.result
+		now = time.time()
+		if self._sent is None or now - self._sent >= self.RESEND:
+			self._sent = now
+			self.transport.send(self.hello)
+		for data in self.transport.receive():
+			if data[0] != _HELLO or self.result is not None:
+				continue
+			kind, peerRound, size, peerSeed = _HELLO_HEAD.unpack_from(data)
+			if peerRound != self.round:
+				continue
+			name = data[_HELLO_HEAD.size:_HELLO_HEAD.size+size].decode('ascii')
+			# Сосед мог ещё не получить наш привет; дальше на его приветы отвечает RollbackSession.
+			self.transport.send(self.hello)
+			self.result = name, (self.seed if self.localSide == 'left' else peerSeed)
+		return self.result
+
+class RollbackSession(object):
+	'''
+	Ведёт FightGame одного из игроков. Ставится в game.driver, и тогда
+	game.update отдаёт каждый шаг в advance().
+	'''
+	def __init__(self,game,localSide,transport,hello=None):
+		self.game = game
+		self.localSide = localSide
+		self.remoteSide = 'right' if localSide == 'left' else 'left'
+		self.transport = transport
+		# Привет из Handshake: повторяется соседу, который ещё ждёт ответа.
+		self.hello = hello
+
+		self.localMask = 0
+		self.local = {}
+		self.remote = {}
+		self.used = {}
+		self.snapshots = {}
+		self.checksums = {}
+		self.remoteConfirmed = -1
+		self.peerAck = -1
+		self._rollbackTo = None
+		# Ввод ниже _trimmed уже удалён; сводки хранятся за последние checksumHistory шагов.
+		self._trimmed = 0
+		self.checksumHistory = 600
+
+		# События игры ('win', 'round-end') отдаются дальше, только когда ввод
+		# на их шаге подтверждён; после отката они считаются заново.
+		self.onEvent = None
+		self._events = []
+		self._delivered = False
+		self._stepping = None
+
+		self.stats = {'ticks': 0,'stalls': 0,'rollbacks': 0,'resimulated': 0,'resimTime': 0.0}
+
+	def setButton(self,name,pressed):
+		if pressed:
+			self.localMask |= _BIT[name]
+		else:
+			self.localMask &= ~_BIT[name]
+
+	def on_game_event(self,name,*args):
+		self._events.append((self._stepping,name,args))
+
+	def advance(self):
+		self.poll()
+		t = self.game.ticks
+		if t - self.remoteConfirmed > MAX_ROLLBACK:
+			# Сосед слишком отстал: ждём его, не уходя за пределы отката.
+			self.stats['stalls'] += 1
+			self.send()
+			return False
+		self.local[t] = self.localMask
+		self.send()
+		if self._rollbackTo is not None:
+			self._rollback(self._rollbackTo)
+			self._rollbackTo = None
+		self._simulate(t)
+		self.stats['ticks'] += 1
+		self._deliver()
+		self._trim()
+		return True
+
+	def _trim(self):
+		# Вызывается после отката: следующий откат не уйдёт ниже подтверждённого
+		# шага, а повтор ввода - ниже подтверждённого соседом. Более старые маски не нужны.
+		end = min(self.remoteConfirmed,self.peerAck + 1)
+		local, remote, used = self.local, self.remote, self.used
+		for t in range(self._trimmed,end):
+			local.pop(t,None)
+			remote.pop(t,None)
+			used.pop(t,None)
+		self._trimmed = max(self._trimmed,end)
+		for t in range(len(self.checksums) - self.checksumHistory):
+			self.checksums.pop(next(iter(self.checksums)))
+
+	def predict(self,t):
+		if t in self.remote:
+			return self.remote[t]
+		return self.remote.get(self.remoteConfirmed,0)
+
+	def _simulate(self,t):
+		game = self.game
+		# Неизменившиеся поля сущностей - общие с прошлым снимком.
+		state = capture(game,self.snapshots.get(t - 1))
+		self.snapshots[t] = state
+		self.snapshots.pop(t - MAX_ROLLBACK - 2,None)
+		self.checksums[t] = checksum(game)
+
+		remote = self.predict(t)
+		self.used[t] = remote
+		applyMask(game,self.localSide,self.local.get(t-1,0),self.local[t])
+		applyMask(game,self.remoteSide,self.used.get(t-1,0),remote)
+
+		self._stepping = t
+		game.step()
+		self._stepping = None
+
+	def _rollback(self,r):
+		if r not in self.snapshots:
+			return
+		started = time.time()
+		now = self.game.ticks
+		self.snapshots[r].restore(self.game)
+		self._events = [ev for ev in self._events if ev[0] < r]
+
+		sound, log, recorder = fighters.playSound, fighters.LOG, self.game.recorder
+		fighters.playSound = fighters._silence
+		fighters.LOG = gamelog.SILENT
+		self.game.recorder = None
+		try:
+			for t in range(r,now):
+				self._simulate(t)
+		finally:
+			fighters.playSound, fighters.LOG, self.game.recorder = sound, log, recorder
+
+		self.stats['rollbacks'] += 1
+		self.stats['resimulated'] += now - r
+		self.stats['resimTime'] += time.time() - started
+
+	def _deliver(self):
+		while self._events and self._events[0][0] <= self.remoteConfirmed:
+			t, name, args = self._events.pop(0)
+			if not self._delivered and self.onEvent is not None:
+				self._delivered = True
+				self.onEvent(name,*args)
+
+	def send(self):
+		end = self.game.ticks if self.game.ticks in self.local else self.game.ticks - 1
+		start = max(self.peerAck + 1,end - _RESEND + 1,0)
+		masks = [self.local[i] for i in range(start,end+1)]
+		self.transport.send(_INPUT_HEAD.pack(_INPUT,self.remoteConfirmed,start,len(masks)) + bytes(bytearray(masks)))
+
+	def poll(self):
+		for data in self.transport.receive():
+			if data[0] == _HELLO:
+				if self.hello is not None:
+					self.transport.send(self.hello)
+				continue
+			if data[0] != _INPUT:
+				continue
+			kind, ack, start, count = _INPUT_HEAD.unpack_from(data)
+			self.peerAck = max(self.peerAck,ack)
+			masks = bytearray(data[_INPUT_HEAD.size:_INPUT_HEAD.size+count])
+			for i, mask in enumerate(masks):
+				t = start + i
+				if t <= self.remoteConfirmed or t in self.remote:
+					continue
+				self.remote[t] = mask
+				if t < self.game.ticks and self.used.get(t) != mask:
+					if self._rollbackTo is None or t < self._rollbackTo:
+						self._rollbackTo = t
+			while self.remoteConfirmed + 1 in self.remote:
+				self.remoteConfirmed += 1
+
+	def report(self):
+		st = self.stats
+		perFrame = st['resimTime'] / st['resimulated'] * 1e6 if st['resimulated'] else 0.0
+		return 'ticks {ticks} stalls {stalls} rollbacks {rollbacks} resimulated {resimulated} frames'.format(**st) + \
+			', {:.1f} us per resimulated frame'.format(perFrame)
+
+def checksum(game):
+	'''
+	Короткая сводка состояния бойцов для сравнения двух машин.
+	'''
+	players = sorted(game.getEntitiesByTag('player'),key=lambda p: p.id)
+	return zlib.crc32(repr([(round(p.position[0],3),round(p.position[1],3),p.health,p.state) for p in players]).encode('utf-8'))
+
+class LatencyProxy(object):
+	'''
+	UDP-посредник между двумя адресами с задержкой (в одну сторону), разбросом и потерями.
+	'''
+	def __init__(self,portA,peerA,portB,peerB,latency=0.05,jitter=0.01,loss=0.0,seed=0):
+		self.sockA = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+		self.sockA.bind(('127.0.0.1',portA))
+		self.sockB = socket.socket(socket.AF_INET,socket.SOCK_DGRAM)
+		self.sockB.bind(('127.0.0.1',portB))
+		self.routes = {self.sockA: (self.sockB,peerB),self.sockB: (self.sockA,peerA)}
+		self.latency = latency
+		self.jitter = jitter
+		self.loss = loss
+		self.random = random.Random(seed)
+		self._queue = []
+		self._seq = 0
+		self._running = True
+		self._thread = threading.Thread(target=self._run)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def _run(self):
+		while self._running:
+			timeout = 0.005
+			if self._queue:
+				timeout = max(0.0,min(timeout,self._queue[0][0] - time.time()))
+			ready, w, x = select.select([self.sockA,self.sockB],[],[],timeout)
+			for sock in ready:
+				data = sock.recv(2048)
+				if self.random.random() < self.loss:
+					continue
+				delay = max(0.0,self.latency + self.random.uniform(-self.jitter,self.jitter))
+				self._seq += 1
+				heapq.heappush(self._queue,(time.time() + delay,self._seq,sock,data))
+			now = time.time()
+			while self._queue and self._queue[0][0] <= now:
+				when, seq, sock, data = heapq.heappop(self._queue)
+				out, addr = self.routes[sock]
+				out.sendto(data,addr)
+
+	def close(self):
+		self._running = False
+		self._thread.join()
+		self.sockA.close()
+		self.sockB.close()
+
+def _selftest(args):
+	from sim import Match
+
+	portA, portB, proxyA, proxyB = args.port, args.port + 1, args.port + 2, args.port + 3
+	proxy = LatencyProxy(proxyA,('127.0.0.1',portA),proxyB,('127.0.0.1',portB),
+		latency=args.latency,jitter=args.jitter,loss=args.loss)
+
+	peers = []
+	for side, bind, via in (('left',portA,proxyA),('right',portB,proxyB)):
+		match = Match(seed=1)
+		session = RollbackSession(match.game,side,UdpTransport(('127.0.0.1',bind),('127.0.0.1',via)))
+		session.checksumHistory = args.ticks
+		peers.append((session,random.Random(side)))
+
+	started = time.time()
+	frame = 0
+	while min(s.game.ticks for s, r in peers) < args.ticks:
+		for session, rnd in peers:
+			if frame % 8 == 0:
+				session.setButton(rnd.choice(BUTTONS),rnd.random() < 0.6)
+			session.advance()
+		frame += 1
+		ahead = started + frame / 60.0 - time.time()
+		if ahead > 0:
+			time.sleep(ahead)
+
+	# Дожидаемся подтверждения всего ввода, не делая новых шагов.
+	deadline = time.time() + 2.0
+	while time.time() < deadline and min(s.remoteConfirmed for s, r in peers) < args.ticks - 1:
+		for session, rnd in peers:
+			session.send()
+			session.poll()
+			if session._rollbackTo is not None:
+				session._rollback(session._rollbackTo)
+				session._rollbackTo = None
+		time.sleep(0.01)
+
+	confirmed = min(s.remoteConfirmed for s, r in peers)
+	a, b = peers[0][0], peers[1][0]
+	mismatches = [t for t in range(confirmed + 1) if t in a.checksums and t in b.checksums and a.checksums[t] != b.checksums[t]]
+	for session, rnd in peers:
+		print(session.localSide,session.report())
+	print('confirmed ticks {}, desynced ticks {}'.format(confirmed + 1,len(mismatches)))
+	proxy.close()
+
+if __name__ == '__main__':
+	import argparse
+	parser = argparse.ArgumentParser(description='Rollback netplay self-test over a lossy localhost proxy.')
+	parser.add_argument('--ticks',type=int,default=600)
+	parser.add_argument('--latency',type=float,default=0.05,help='one-way delay, seconds')
+	parser.add_argument('--jitter',type=float,default=0.01)
+	parser.add_argument('--loss',type=float,default=0.02)
+	parser.add_argument('--port',type=int,default=47300)
+	_selftest(parser.parse_args())
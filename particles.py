@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Частицы (искры от ударов) в сплошных массивах вместо сущности на каждую искру.
+
+Каждое поле частиц - строка массива: живые частицы лежат подряд в первых count
+столбцах. step() старит, двигает и удаляет отжившие частицы сразу для всех,
+quads() отдаёт вершины четырёхугольников для отрисовки одним вызовом.
+
+NumPy необязателен: без него те же массивы обходятся циклом на питоне.
+'''
+
+import math
+import random
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+FIELDS = ('x','y','vx','vy','rotation','spin','age','life','size','grow','scale','opacity')
+X, Y, VX, VY, ROTATION, SPIN, AGE, LIFE, SIZE, GROW, SCALE, OPACITY = range(len(FIELDS))
+
+# Углы четырёхугольника частицы против часовой стрелки, начиная с левого нижнего.
+_CORNERS = ((-1.0,-1.0),(1.0,-1.0),(1.0,1.0),(-1.0,1.0))
+
+class ParticleEmitter(object):
+	'''
+	До capacity частиц одной картинки размером width x height.
+	Масштаб частицы - size + grow * (возраст / время жизни), прозрачность
+	падает от 255 до 0 к концу жизни.
+	'''
+	def __init__(self,capacity=2048,width=64,height=64,seed=None):
+		self.capacity = capacity
+		self.width = width
+		self.height = height
+		self.count = 0
+		self.dropped = 0
+		# Свой генератор: искры не должны менять ход боя (FightGame.random).
+		self.random = random.Random(seed)
+		if numpy is not None:
+			self.data = numpy.zeros((len(FIELDS),capacity),dtype=numpy.float32)
+		else:
+			self.data = [[0.0] * capacity for f in FIELDS]
+
+	def emit(self,x,y,count,speed=(0.0,0.0),spin=(-200.0,200.0),life=(0.6,0.6),size=0.5,grow=2.0):
+		'''
+		Выпускает count частиц из точки (x, y) во все стороны со скоростью из
+		диапазона speed. Если места нет, лишние частицы не появляются.
+		'''
+		n = min(count,self.capacity - self.count)
+		self.dropped += count - n
+		if n <= 0:
+			return 0
+		rnd = self.random
+		columns = [[] for f in FIELDS]
+		for i in range(n):
+			angle = rnd.uniform(0.0,2.0 * math.pi)
+			v = rnd.uniform(*speed)
+			columns[VX].append(math.cos(angle) * v)
+			columns[VY].append(math.sin(angle) * v)
+			columns[ROTATION].append(rnd.uniform(-50.0,50.0))
+			columns[SPIN].append(rnd.uniform(*spin))
+			columns[LIFE].append(rnd.uniform(*life))
+		columns[X] = [x] * n
+		columns[Y] = [y] * n
+		columns[AGE] = [0.0] * n
+		columns[SIZE] = [size] * n
+		columns[GROW] = [grow] * n
+		columns[SCALE] = [size] * n
+		columns[OPACITY] = [255.0] * n
+
+		a, b = self.count, self.count + n
+		for field, values in enumerate(columns):
+			self.data[field][a:b] = values
+		self.count = b
+		return n
+
+	def clear(self):
+		self.count = 0
+
+	def step(self,dt):
+		if not self.count:
+			return
+		if numpy is not None:
+			self._stepNumpy(dt)
+		else:
+			self._stepLoop(dt)
+
+	def _stepNumpy(self,dt):
+		d = self.data[:,:self.count]
+		d[AGE] += dt
+		d[X] += d[VX] * dt
+		d[Y] += d[VY] * dt
+		d[ROTATION] += d[SPIN] * dt
+		t = d[AGE] / d[LIFE]
+		d[SCALE] = d[SIZE] + d[GROW] * t
+		d[OPACITY] = (1.0 - t) * 255.0
+		alive = d[AGE] < d[LIFE]
+		n = int(numpy.count_nonzero(alive))
+		if n != self.count:
+			self.data[:,:n] = d[:,alive]
+			self.count = n
+
+	def _stepLoop(self,dt):
+		d = self.data
+		x, y, vx, vy = d[X], d[Y], d[VX], d[VY]
+		rotation, spin, age, life = d[ROTATION], d[SPIN], d[AGE], d[LIFE]
+		size, grow, scale, opacity = d[SIZE], d[GROW], d[SCALE], d[OPACITY]
+		n = 0
+		for i in range(self.count):
+			a = age[i] + dt
+			if a >= life[i]:
+				continue
+			if n != i:
+				for row in d:
+					row[n] = row[i]
+			t = a / life[n]
+			age[n] = a
+			x[n] += vx[n] * dt
+			y[n] += vy[n] * dt
+			rotation[n] += spin[n] * dt
+			scale[n] = size[n] + grow[n] * t
+			opacity[n] = (1.0 - t) * 255.0
+			n += 1
+		self.count = n
+
+	def quads(self):
+		'''
+		Вершины (x, y по 4 на частицу) и цвета (RGBA по 4 на частицу) живых частиц.
+		'''
+		n = self.count
+		hw, hh = self.width / 2.0, self.height / 2.0
+		if numpy is not None:
+			d = self.data[:,:n]
+			# Поворот в pyglet - по часовой стрелке в градусах.
+			a = numpy.radians(-d[ROTATION])
+			c, s = numpy.cos(a) * d[SCALE], numpy.sin(a) * d[SCALE]
+			corners = numpy.array(_CORNERS,dtype=numpy.float32) * (hw,hh)
+			cx, cy = corners[:,0][None,:], corners[:,1][None,:]
+			vx = d[X][:,None] + cx * c[:,None] - cy * s[:,None]
+			vy = d[Y][:,None] + cx * s[:,None] + cy * c[:,None]
+			vertices = numpy.stack((vx,vy),axis=2).ravel()
+			colors = numpy.full((n,4,4),255,dtype=numpy.uint8)
+			colors[:,:,3] = d[OPACITY].astype(numpy.uint8)[:,None]
+			return vertices, colors.ravel()
+
+		d = self.data
+		vertices = []
+		colors = []
+		for i in range(n):
+			a = math.radians(-d[ROTATION][i])
+			k = d[SCALE][i]
+			c, s = math.cos(a) * k, math.sin(a) * k
+			x, y = d[X][i], d[Y][i]
+			for cx, cy in _CORNERS:
+				cx, cy = cx * hw, cy * hh
+				vertices.append(x + cx * c - cy * s)
+				vertices.append(y + cx * s + cy * c)
+			alpha = int(d[OPACITY][i])
+			colors.extend((255,255,255,alpha) * 4)
+		return vertices, colors
+
+def drawEmitter(emitter,texture):
+	'''
+	Рисует все частицы эмиттера одним вызовом glDrawArrays (pyglet 1.x).
+	'''
+	n = emitter.count
+	if not n:
+		return
+	import pyglet
+	from pyglet import gl
+
+	vertices, colors = emitter.quads()
+	if numpy is not None:
+		vertices, colors = vertices.tolist(), colors.tolist()
+	tu, tv = texture.tex_coords[3], texture.tex_coords[7]
+	texcoords = (0.0,0.0,tu,0.0,tu,tv,0.0,tv) * n
+
+	gl.glEnable(texture.target)
+	gl.glBindTexture(texture.target,texture.id)
+	gl.glEnable(gl.GL_BLEND)
+	gl.glBlendFunc(gl.GL_SRC_ALPHA,gl.GL_ONE_MINUS_SRC_ALPHA)
+	pyglet.graphics.draw(n * 4,gl.GL_QUADS,
+		('v2f',vertices),('c4B',colors),('t2f',texcoords))
+	gl.glDisable(texture.target)
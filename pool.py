@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Пулы короткоживущих сущностей (причинятели ущерба, гитары, вспышки попаданий).
+
+Сущность из пула не уничтожается, а остаётся в игре выключенной до следующего
+acquire, поэтому после разогрева удары не создают новых объектов.
+'''
+
+class Pooled(object):
+	'''
+	Примесь для сущностей, которые берутся из EntityPool.
+
+	Наследник переопределяет activate/deactivate: включить и выключить сущность
+	без пересоздания, и перечисляет в __slots__ поля '_pool' и 'active'.
+	'''
+	__slots__ = ()
+
+	def activate(self):
+		pass
+
+	def deactivate(self):
+		pass
+
+	def after(self,delay,fn):
+		'''
+		scheduleAfter, который отменяется, когда сущность возвращают в пул.
+		'''
+		return self.game.scheduleAfter(delay,fn,owner=self)
+
+	def release(self):
+		self._pool.release(self)
+
+	def releaseAfter(self,delay):
+		self.after(delay,self.release)
+
+class EntityPool(object):
+	'''
+	Пул сущностей одного класса в одной игре.
+	'''
+	def __init__(self,game,cls):
+		self.game = game
+		self.cls = cls
+		self._free = []
+		self.entities = []
+		self.created = 0
+		self.acquired = 0
+		self.released = 0
+
+	def _create(self):
+		e = self.cls()
+		e._pool = self
+		e.active = False
+		self.game.addEntity(e)
+		self.entities.append(e)
+		self.created += 1
+		return e
+
+	def acquire(self):
+		if self._free:
+			e = self._free.pop()
+		else:
+			e = self._create()
+		e.active = True
+		e.activate()
+		self.acquired += 1
+		return e
+
+	def reserve(self,count):
+		'''
+		Создаёт выключенные сущности, пока их не станет count (для восстановления снимка).
+		'''
+		while len(self.entities) < count:
+			self._free.append(self._create())
+
+	def release(self,e):
+		if not e.active:
+			return
+		e.active = False
+		self.game.cancelTimers(e)
+		e.deactivate()
+		self._free.append(e)
+		self.released += 1
+
+	def stats(self):
+		return {'created': self.created,'acquired': self.acquired,'released': self.released,'free': len(self._free)}
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Профилировщик кадра: время update каждой сущности, draw и update каждого слоя,
+отложенных вызовов и trigger, с суммами по классам.
+
+Пока профилировщик выключен, методы не обёрнуты и ничего не стоят. enable()
+подменяет методы классов обёртками, disable() возвращает исходные. Замеры
+выгружаются в формат Chrome trace (chrome://tracing, ui.perfetto.dev):
+
+	PROFILER.saveTrace('frame.trace.json')
+'''
+
+import collections
+import json
+import os
+import threading
+import time
+
+from scheduler import Scheduler
+
+_clock = time.perf_counter
+
+class Stat(object):
+	__slots__ = ('count','total','max')
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+class Profiler(object):
+	# Сколько последних событий хранится для выгрузки трассы.
+	TRACE_LIMIT = 200000
+
+	def __init__(self):
+		self.enabled = False
+		self.stats = {}
+		self.frames = 0
+		self.trace = collections.deque(maxlen=self.TRACE_LIMIT)
+		self._patched = []
+		self._inside = set()
+		self._started = _clock()
+		self._pid = os.getpid()
+
+	def _record(self,category,name,start,end):
+		key = (category,name)
+		st = self.stats.get(key)
+		if st is None:
+			st = self.stats[key] = Stat()
+		duration = end - start
+		st.count += 1
+		st.total += duration
+		if duration > st.max:
+			st.max = duration
+		self.trace.append((category,name,start,duration,threading.get_ident()))
+
+	def _wrap(self,cls,method,category):
+		original = cls.__dict__[method]
+		record = self._record
+		inside = self._inside
+
+		def wrapper(obj,*args,**kwargs):
+			# Вызов метода предка из переопределённого метода уже измеряется снаружи.
+			key = (id(obj),method)
+			if key in inside:
+				return original(obj,*args,**kwargs)
+			inside.add(key)
+			start = _clock()
+			try:
+				return original(obj,*args,**kwargs)
+			finally:
+				record(category,type(obj).__name__,start,_clock())
+				inside.discard(key)
+		wrapper.__name__ = original.__name__
+		wrapper.__doc__ = original.__doc__
+		setattr(cls,method,wrapper)
+		self._patched.append((cls,method,original))
+
+	def _wrapTree(self,roots,methods,category):
+		seen = set()
+		stack = list(roots)
+		while stack:
+			cls = stack.pop()
+			if cls in seen:
+				continue
+			seen.add(cls)
+			stack.extend(cls.__subclasses__())
+			for method in methods:
+				if method in cls.__dict__:
+					self._wrap(cls,method,category)
+
+	def _wrapTrigger(self,cls):
+		original = cls.__dict__['trigger'] if 'trigger' in cls.__dict__ else None
+		inherited = getattr(cls,'trigger')
+		record = self._record
+
+		def trigger(obj,event,*args,**kwargs):
+			start = _clock()
+			try:
+				return inherited(obj,event,*args,**kwargs)
+			finally:
+				record('event',event,start,_clock())
+		cls.trigger = trigger
+		self._patched.append((cls,'trigger',original))
+
+	def enable(self,entities=(),layers=(),events=()):
+		'''
+		Оборачивает update у entities и их наследников, draw и update у layers
+		и их наследников, trigger у классов events и все отложенные вызовы Scheduler.
+		'''
+		if self.enabled:
+			return
+		self.enabled = True
+		self._wrapTree(entities,('update',),'update')
+		self._wrapTree(layers,('draw','update'),'layer')
+		for cls in events:
+			self._wrapTrigger(cls)
+
+		record = self._record
+
+		def call(scheduler,callback):
+			start = _clock()
+			try:
+				callback()
+			finally:
+				record('timer',_callbackName(callback),start,_clock())
+		self._patched.append((Scheduler,'_call',Scheduler.__dict__['_call']))
+		Scheduler._call = call
+
+	def disable(self):
+		for cls, method, original in reversed(self._patched):
+			if original is None:
+				delattr(cls,method)
+			else:
+				setattr(cls,method,original)
+		self._patched = []
+		self.enabled = False
+
+	def toggle(self,*args,**kwargs):
+		if self.enabled:
+			self.disable()
+		else:
+			self.enable(*args,**kwargs)
+		return self.enabled
+
+	def endFrame(self):
+		if self.enabled:
+			self.frames += 1
+
+	def reset(self):
+		self.stats = {}
+		self.frames = 0
+		self.trace.clear()
+
+	def top(self,count=12):
+		'''
+		Самые дорогие строки: [(категория, имя, мс за кадр, вызовов за кадр, макс. мс)].
+		'''
+		frames = max(self.frames,1)
+		rows = [(cat,name,st.total * 1000.0 / frames,st.count / float(frames),st.max * 1000.0)
+			for (cat, name), st in self.stats.items()]
+		rows.sort(key=lambda row: -row[2])
+		return rows[:count]
+
+	def report(self,count=12):
+		lines = ['{} frames'.format(self.frames)]
+		for cat, name, ms, calls, peak in self.top(count):
+			lines.append('{:>6} {:<24} {:7.3f} ms/frame {:6.1f} calls max {:6.3f} ms'.format(cat,name,ms,calls,peak))
+		return '\n'.join(lines)
+
+	def traceEvents(self):
+		'''
+		Замеры как события Chrome trace (фаза 'X', время в микросекундах).
+		'''
+		base = self._started
+		return [{'name': name,'cat': cat,'ph': 'X','ts': (start - base) * 1e6,'dur': duration * 1e6,
+			'pid': self._pid,'tid': tid} for cat, name, start, duration, tid in self.trace]
+
+	def saveTrace(self,filename):
+		with open(filename,'w') as f:
+			json.dump({'traceEvents': self.traceEvents(),'displayTimeUnit': 'ms'},f)
+
+def _callbackName(callback):
+	owner = getattr(callback,'__self__',None)
+	name = getattr(callback,'__name__',None) or type(callback).__name__
+	if owner is not None:
+		return type(owner).__name__ + '.' + name
+	return name
+
+PROFILER = Profiler()
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Запись ввода раунда и её точное воспроизведение.
+
+Формат файла:
+	'R33P' u8 версия, u32 зерно FightGame.random, u16 шагов в секунду,
+	классы левого и правого бойца (u8 длина + ascii),
+	затем события: номер шага (varint, разница с предыдущим событием) и байт
+	действия: бит 0 - игрок (0 левый, 1 правый), бит 1 - нажатие,
+	биты 2-4 - номер в ACTIONS, биты 5-6 - направление (0 нет, 1 влево, 2 вправо).
+
+	$ python replay.py replays/round.rpl [--realtime]
+'''
+
+import struct
+import sys
+
+_MAGIC = b'R33P'
+_VERSION = 1
+
+ACTIONS = ('jump','go','hit','special','throw','block')
+_ACTION_CODES = {a: i for i, a in enumerate(ACTIONS)}
+_DIRECTIONS = {None: 0,-1: 1,1: 2}
+_DIRECTION_VALUES = {v: k for k, v in _DIRECTIONS.items()}
+
+def _varint(value):
+	out = bytearray()
+	while True:
+		byte = value & 0x7f
+		value >>= 7
+		if value:
+			out.append(byte | 0x80)
+		else:
+			out.append(byte)
+			return bytes(out)
+
+class Recording(object):
+	'''
+	Ввод одного раунда. choices - {'player-left': класс, 'player-right': класс},
+	events - [(tick, side, action, pressed, kw)], как для FightGame.schedule.
+	'''
+	def __init__(self,choices,seed,tickRate,events=None):
+		self.choices = dict(choices)
+		self.seed = seed
+		self.tickRate = tickRate
+		self.events = events if events is not None else []
+
+	def record(self,tick,side,action,pressed,kw=None):
+		self.events.append((tick,side,action,pressed,dict(kw) if kw else {}))
+
+	def encode(self):
+		out = [_MAGIC,struct.pack('<BIH',_VERSION,self.seed,self.tickRate)]
+		for pid in ('player-left','player-right'):
+			name = self.choices[pid].__name__.encode('ascii')
+			out.append(struct.pack('<B',len(name)) + name)
+		last = 0
+		for tick, side, action, pressed, kw in self.events:
+			code = (1 if side == 'right' else 0) | (2 if pressed else 0) | \
+				   (_ACTION_CODES[action] << 2) | (_DIRECTIONS[kw.get('direction')] << 5)
+			out.append(_varint(tick - last) + struct.pack('<B',code))
+			last = tick
+		return b''.join(out)
+
+	def save(self,filename):
+		with open(filename,'wb') as f:
+			f.write(self.encode())
+
+	@staticmethod
+	def decode(data):
+		import fighters
+		if data[:4] != _MAGIC:
+			raise ValueError('Not a replay')
+		version, seed, tickRate = struct.unpack_from('<BIH',data,4)
+		if version != _VERSION:
+			raise ValueError('Unsupported replay version {}'.format(version))
+		pos = 11
+		choices = {}
+		for pid in ('player-left','player-right'):
+			size = data[pos]
+			choices[pid] = getattr(fighters,data[pos+1:pos+1+size].decode('ascii'))
+			pos += 1 + size
+
+		events = []
+		tick = 0
+		while pos < len(data):
+			delta = shift = 0
+			while True:
+				byte = data[pos]
+				pos += 1
+				delta |= (byte & 0x7f) << shift
+				shift += 7
+				if not byte & 0x80:
+					break
+			tick += delta
+			code = data[pos]
+			pos += 1
+			direction = _DIRECTION_VALUES[(code >> 5) & 3]
+			events.append((tick,'right' if code & 1 else 'left',ACTIONS[(code >> 2) & 7],bool(code & 2),
+				{'direction': direction} if direction is not None else {}))
+		return Recording(choices,seed,tickRate,events)
+
+	@staticmethod
+	def load(filename):
+		with open(filename,'rb') as f:
+			return Recording.decode(f.read())
+
+def startRecording(game,choices):
+	'''
+	Начинает запись ввода игры game (FightGame) и возвращает Recording.
+	'''
+	game.recorder = Recording(choices,game.seed,int(round(1.0 / game.TICK)))
+	return game.recorder
+
+def replay(recording,realtime=False,maxTicks=None):
+	'''
+	Воспроизводит запись в безголовой симуляции: с максимальной скоростью или в реальном времени.
+	'''
+	from sim import Match
+	match = Match(recording.choices,tick=1.0 / recording.tickRate,seed=recording.seed)
+	match.schedule(recording.events)
+	return match.run(maxTicks=maxTicks,realtime=realtime)
+
+if __name__ == '__main__':
+	import time
+	rec = Recording.load(sys.argv[1])
+	started = time.time()
+	res = replay(rec,realtime='--realtime' in sys.argv)
+	print(res)
+	print('{} ticks in {:.3f}s'.format(res['ticks'],time.time() - started))
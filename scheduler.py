@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Очередь отложенных вызовов на двоичной куче: вставка и извлечение за O(log n),
+отмена по описателю и всех вызовов одного владельца.
+'''
+
+import heapq
+
+class TimerHandle(object):
+	'''
+	Описатель отложенного вызова, возвращаемый Scheduler.schedule.
+	'''
+	__slots__ = ('time','callback','owner','cancelled')
+
+	def __init__(self,time,callback,owner):
+		self.time = time
+		self.callback = callback
+		self.owner = owner
+		self.cancelled = False
+
+	def cancel(self):
+		self.cancelled = True
+		self.callback = None
+
+class Scheduler(object):
+	# Отменённые записи удаляются из кучи лениво; если их стало больше половины,
+	# куча перестраивается (но не внутри run: после него).
+	_COMPACT_MIN = 64
+
+	def __init__(self):
+		self._heap = []
+		self._seq = 0
+		self._cancelled = 0
+		self._byOwner = {}
+		self._running = False
+
+	def __len__(self):
+		return len(self._heap) - self._cancelled
+
+	def schedule(self,time,callback,owner=None):
+		handle = TimerHandle(time,callback,owner)
+		self._seq += 1
+		heapq.heappush(self._heap,(time,self._seq,handle))
+		if owner is not None:
+			self._byOwner.setdefault(owner,set()).add(handle)
+		return handle
+
+	def cancel(self,handle):
+		if handle.cancelled:
+			return
+		handle.cancel()
+		self._forget(handle)
+		self._cancelled += 1
+		if not self._running:
+			self._compact()
+
+	def _compact(self):
+		if self._cancelled > self._COMPACT_MIN and self._cancelled * 2 > len(self._heap):
+			self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+			heapq.heapify(self._heap)
+			self._cancelled = 0
+
+	def cancelOwner(self,owner):
+		for handle in list(self._byOwner.get(owner,())):
+			self.cancel(handle)
+
+	def run(self,now):
+		'''
+		Выполняет все вызовы со временем не позже now в порядке времени и постановки.
+		'''
+		heap = self._heap
+		self._running = True
+		try:
+			while heap and heap[0][0] <= now:
+				handle = heapq.heappop(heap)[2]
+				if handle.cancelled:
+					self._cancelled -= 1
+					continue
+				callback = handle.callback
+				handle.cancel()
+				self._forget(handle)
+				self._call(callback)
+		finally:
+			self._running = False
+		self._compact()
+
+	def _call(self,callback):
+		# Подменяется профилировщиком (profiler.py).
+		callback()
+
+	def _forget(self,handle):
+		owner = handle.owner
+		if owner is not None:
+			handles = self._byOwner.get(owner)
+			if handles is not None:
+				handles.discard(handle)
+				if not handles:
+					del self._byOwner[owner]
+
+def _selfcheck():
+	timers = Scheduler()
+	owner = object()
+	for i in range(200):
+		timers.schedule(10.0 + i,lambda: None,owner)
+	calls = []
+
+	def cancelAll():
+		timers.cancelOwner(owner)
+		timers.schedule(1.0,lambda: calls.append('late'))
+	timers.schedule(1.0,cancelAll)
+	timers.run(1.0)
+	assert calls == ['late'], calls
+	assert len(timers) == 0 and timers._cancelled == 0 and not timers._heap, (len(timers),timers._cancelled)
+	print('ok')
+
+if __name__ == '__main__':
+	_selfcheck()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Безголовая симуляция боя на фиксированном шаге времени.
+
+Строит ту же игру, что и GameScreen (уровень rc/lvl/level0.json и бойцы из
+PLAYER_CHOICES), но без окна, звука и игровой консоли. Управление - в словаре
+действий GameLayer._KEYMAP: ('left'|'right', 'jump'|'go'|'hit'|'block'|'throw'|'special').
+'''
+
+import sys
+import time
+
+import pyglet
+# Без скрытого окна, которое pyglet создаёт при импорте pyglet.gl.
+pyglet.options['shadow_window'] = False
+
+import fighters
+from fighters import *
+from fightgame import FightGame
+from snapshot import capture
+
+SIDES = ('left','right')
+
+class Match(object):
+	'''
+	Один раунд между двумя бойцами.
+
+	Скрипт - список событий (tick, side, action, pressed, kw), контроллеры -
+	функции controller(match, side), вызываемые перед каждым шагом.
+	'''
+	def __init__(self,choices=None,level='rc/lvl/level0.json',tick=None,roundTime=ROUND_TIME,seed=None,headless=True):
+		fighters.HEADLESS = headless
+
+		self.winner = None
+		self.finished = False
+
+		self.game = FightGame(seed=seed)
+		if tick is not None:
+			self.game.TICK = tick
+		self.game.roundTime = roundTime
+		self.game.listen('win')
+		self.game.on('win',self.on_win)
+		self.game.listen('round-end')
+		self.game.on('round-end',lambda: self.on_win(roundWinner(self.game)))
+
+		loadLevel(self.game,level)
+		spawnPlayers(self.game,choices)
+
+		self.players = {side: self.game.getEntityById('player-'+side) for side in SIDES}
+		self.controllers = {}
+		self.initial = capture(self.game)
+
+	def restart(self,seed=None):
+		'''
+		Следующий раунд в той же игре: состояние возвращается к началу, уровень и
+		бойцы не создаются заново.
+		'''
+		self.winner = None
+		self.finished = False
+		self.game.resetTo(self.initial,seed)
+
+	@property
+	def ticks(self):
+		return self.game.ticks
+
+	def input(self,side,action,pressed=True,**kw):
+		self.game.input(side,action,pressed,kw)
+
+	def schedule(self,script):
+		self.game.schedule(script)
+
+	def step(self):
+		# Без окна каждый шаг - отдельный кадр.
+		self.game.startFrame()
+		for side, controller in self.controllers.items():
+			controller(self,side)
+
+		self.game.step()
+
+	def run(self,maxTicks=None,realtime=False):
+		'''
+		Играет до конца раунда или maxTicks шагов. realtime - не быстрее реального времени.
+		'''
+		started = time.time()
+		while not self.finished and (maxTicks is None or self.ticks < maxTicks):
+			self.step()
+			if realtime:
+				ahead = started + self.ticks * self.game.TICK - time.time()
+				if ahead > 0:
+					time.sleep(ahead)
+		return self.result()
+
+	def on_win(self,player):
+		if self.finished:
+			return
+		self.finished = True
+		self.winner = player
+
+	def result(self):
+		return {
+			'winner': self.winner.id if self.winner else None,
+			'finished': self.finished,
+			'ticks': self.ticks,
+			'seed': self.game.seed,
+			'fighters': {p.id: p.FIGHTER_NAME for p in self.players.values()},
+			'health': {p.id: p.health for p in self.players.values()},
+		}
+
+if __name__ == '__main__':
+	import random
+
+	rnd = random.Random(0)
+	actions = ['jump','hit','throw','block','go']
+	script = []
+	for t in range(0,3600,10):
+		action = rnd.choice(actions)
+		kw = {'direction': rnd.choice((-1,1))} if action == 'go' else {}
+		side = rnd.choice(SIDES)
+		script.append((t,side,action,True,kw))
+		script.append((t+5,side,action,False,kw))
+
+	match = Match()
+	match.schedule(script)
+	if '--profile' in sys.argv:
+		from profiler import PROFILER
+		PROFILER.enable(entities=[GameEntity],events=[FightGame])
+	started = time.time()
+	res = match.run(maxTicks=3600)
+	elapsed = time.time() - started
+	print(res)
+	print(match.game.poolStats())
+	if '--profile' in sys.argv:
+		PROFILER.frames = res['ticks']
+		print(PROFILER.report())
+		PROFILER.saveTrace('sim.trace.json')
+	print('{} ticks in {:.3f}s, {:.0f} ticks/s'.format(res['ticks'],elapsed,res['ticks']/max(elapsed,1e-9)))
@@ -0,0 +1,466 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Снимки состояния боя (FightGame) в памяти: сохранить на любом шаге и вернуться.
+
+В снимок попадают поля SNAPSHOT_FIELDS бойцов, камеры и всех сущностей из
+пулов, какие из них включены и свободны, теги, очередь отложенных вызовов,
+время, номер шага и состояние генератора случайных чисел игры. Сущности из пулов не
+уничтожаются, поэтому отложенные вызовы, которые на них ссылаются, после
+восстановления остаются верными.
+
+capture(game, previous) делит с предыдущим снимком поля сущностей, которые с
+тех пор не менялись (копируются только изменившиеся).
+
+encode/decode переводят снимок в компактные байты и обратно, DeltaEncoder и
+DeltaDecoder передают последовательность снимков разностями: снимок разбит на
+части (заголовок, генератор, пулы, теги, очередь вызовов, по части на
+сущность), и в разность попадают только изменившиеся части. Сущности
+снимка записываются номерами, другие сущности игры - своим id. Отложенные
+вызовы записываются как методы сущностей и игры или functools.partial над
+ними; другие вызываемые объекты (лямбды, замыкания) записать нельзя, и encode
+бросает ValueError. Поэтому байты читаются в любом процессе с той же игрой.
+'''
+
+import copy
+import functools
+import struct
+
+from pool import Pooled
+from scheduler import TimerHandle
+
+_MISSING = object()
+
+def _fields(entity,previous=None):
+	if previous is not None:
+		for name, old in zip(entity.SNAPSHOT_FIELDS,previous):
+			if getattr(entity,name,_MISSING) != old:
+				break
+		else:
+			return previous
+	values = []
+	for name in entity.SNAPSHOT_FIELDS:
+		value = getattr(entity,name,_MISSING)
+		if isinstance(value,(dict,list)):
+			value = copy.copy(value)
+		values.append(value)
+	return values
+
+def _setFields(entity,values):
+	for name, value in zip(entity.SNAPSHOT_FIELDS,values):
+		if value is _MISSING:
+			continue
+		if isinstance(value,(dict,list)):
+			value = copy.copy(value)
+		# Смена анимации перезапускает её, поэтому одинаковую не переназначаем.
+		if name == 'animation' and getattr(entity,name,_MISSING) == value:
+			continue
+		setattr(entity,name,value)
+
+def statefulEntities(game):
+	'''
+	Сущности, чьё состояние входит в снимок, в постоянном порядке.
+	'''
+	entities = list(game.getEntitiesByTag('player'))
+	entities.sort(key=lambda e: e.id)
+	camera = game.getEntityById('camera-controller')
+	if camera is not None:
+		entities.append(camera)
+	for cls in sorted(game._pools,key=lambda cls: cls.__name__):
+		entities.extend(game._pools[cls].entities)
+	return entities
+
+class GameState(object):
+	def __init__(self,game,previous=None):
+		self.ticks = game.ticks
+		self.currentTime = game.currentTime
+		self.random = game.random.getstate()
+		self.roundOver = game.roundOver
+
+		known = dict(previous.entities) if previous is not None else {}
+		self.entities = [(e,_fields(e,known.get(e))) for e in statefulEntities(game)]
+		self.pools = {cls: (len(p.entities),list(p._free)) for cls, p in game._pools.items()}
+		self.tags = {tag: list(tagged) for tag, tagged in game._tagIndex.items()}
+
+		timers = game.timers
+		self.heap = list(timers._heap)
+		self.handles = [(h,h.callback,h.cancelled) for t, seq, h in self.heap]
+		self.seq = timers._seq
+
+	def restore(self,game):
+		game.ticks = self.ticks
+		game.currentTime = self.currentTime
+		game.random.setstate(self.random)
+		game.roundOver = self.roundOver
+
+		# Сущности, взятые из пулов после снимка, выключаются и возвращаются в пулы.
+		for cls, pool in game._pools.items():
+			count, free = self.pools.get(cls,(0,[]))
+			for e in pool.entities[count:]:
+				if e.active:
+					e.active = False
+					e.deactivate()
+			pool._free = free + pool.entities[count:]
+
+		for e, values in self.entities:
+			active = getattr(e,'active',None)
+			_setFields(e,values)
+			if active is not None and active != e.active:
+				if e.active:
+					e.activate()
+				else:
+					e.deactivate()
+
+		# activate/deactivate выше могли поменять теги и очередь вызовов: теги
+		# (вместе с порядком) и очередь берутся из снимка.
+		for tag, tagged in list(game._tagIndex.items()):
+			wanted = self.tags.get(tag,[])
+			for e in set(tagged).difference(wanted):
+				game.unsetEntityTags(e,tag)
+			for e in set(wanted).difference(tagged):
+				game.setEntityTags(e,tag)
+			game._tagIndex[tag] = dict.fromkeys(wanted)
+
+		timers = game.timers
+		timers._heap = list(self.heap)
+		timers._seq = self.seq
+		timers._byOwner = {}
+		timers._cancelled = 0
+		for h, callback, cancelled in self.handles:
+			h.callback = callback
+			h.cancelled = cancelled
+			if cancelled:
+				timers._cancelled += 1
+			elif h.owner is not None:
+				timers._byOwner.setdefault(h.owner,set()).add(h)
+
+def capture(game,previous=None):
+	return GameState(game,previous)
+
+def restore(game,state):
+	state.restore(game)
+
+# Двоичный формат. Значение - байт-тег и данные (little-endian).
+_MAGIC = b'A33S'
+_DELTA_MAGIC = b'A33D'
+_VERSION = 2
+
+_U8 = struct.Struct('<B')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+_HEADER = struct.Struct('<qdBq')
+
+def _poolClasses():
+	classes = {}
+	stack = [Pooled]
+	while stack:
+		cls = stack.pop()
+		classes[cls.__name__] = cls
+		stack.extend(cls.__subclasses__())
+	return classes
+
+class _Writer(object):
+	def __init__(self,refs,game):
+		self.refs = refs
+		self.game = game
+		self.out = []
+
+	def bytes(self):
+		return b''.join(self.out)
+
+	def value(self,v):
+		out = self.out
+		if v is None:
+			out.append(b'N')
+		elif v is _MISSING:
+			out.append(b'M')
+		elif v is True or v is False:
+			out.append(b'1' if v else b'0')
+		elif type(v) is int:
+			out.append(b'i')
+			out.append(_I64.pack(v))
+		elif type(v) is float:
+			out.append(b'f')
+			out.append(_F64.pack(v))
+		elif isinstance(v,str):
+			data = v.encode('utf-8')
+			out.append(b's')
+			out.append(_U16.pack(len(data)))
+			out.append(data)
+		elif isinstance(v,(tuple,list)):
+			out.append(b't' if isinstance(v,tuple) else b'l')
+			out.append(_U16.pack(len(v)))
+			for x in v:
+				self.value(x)
+		elif isinstance(v,dict):
+			out.append(b'd')
+			out.append(_U16.pack(len(v)))
+			for k, x in v.items():
+				self.value(k)
+				self.value(x)
+		elif v is self.game:
+			out.append(b'g')
+		elif v in self.refs:
+			out.append(b'e')
+			out.append(_U16.pack(self.refs[v]))
+		elif self._named(v):
+			out.append(b'n')
+			self.value(v.id)
+		else:
+			self.callable(v)
+
+	def _named(self,v):
+		eid = getattr(v,'id',None)
+		return isinstance(eid,str) and self.game.getEntityById(eid) is v
+
+	def callable(self,v):
+		'''
+		Метод сущности или игры либо functools.partial над ним.
+		'''
+		out = self.out
+		owner = getattr(v,'__self__',None)
+		if owner is not None and (owner is self.game or owner in self.refs or self._named(owner)):
+			out.append(b'b')
+			self.value(owner)
+			self.value(v.__name__)
+		elif isinstance(v,functools.partial):
+			out.append(b'p')
+			self.value(v.func)
+			self.value(v.args)
+			self.value(v.keywords)
+		else:
+			raise ValueError('Cannot encode {!r} in a snapshot: scheduled callbacks must be '
+				'methods of entities or the game, or functools.partial over them'.format(v))
+
+class _Reader(object):
+	def __init__(self,data,entities,game):
+		self.data = data
+		self.pos = 0
+		self.entities = entities
+		self.game = game
+
+	def _unpack(self,fmt):
+		v, = fmt.unpack_from(self.data,self.pos)
+		self.pos += fmt.size
+		return v
+
+	def value(self):
+		tag = self.data[self.pos:self.pos+1]
+		self.pos += 1
+		if tag == b'N':
+			return None
+		if tag == b'M':
+			return _MISSING
+		if tag == b'1':
+			return True
+		if tag == b'0':
+			return False
+		if tag == b'i':
+			return self._unpack(_I64)
+		if tag == b'f':
+			return self._unpack(_F64)
+		if tag == b's':
+			n = self._unpack(_U16)
+			self.pos += n
+			return self.data[self.pos-n:self.pos].decode('utf-8')
+		if tag in (b't',b'l'):
+			n = self._unpack(_U16)
+			items = [self.value() for i in range(n)]
+			return tuple(items) if tag == b't' else items
+		if tag == b'd':
+			n = self._unpack(_U16)
+			d = {}
+			for i in range(n):
+				k = self.value()
+				d[k] = self.value()
+			return d
+		if tag == b'g':
+			return self.game
+		if tag == b'e':
+			return self.entities[self._unpack(_U16)]
+		if tag == b'n':
+			return self.game.getEntityById(self.value())
+		if tag == b'b':
+			owner = self.value()
+			return getattr(owner,self.value())
+		if tag == b'p':
+			func = self.value()
+			args = self.value()
+			return functools.partial(func,*args,**self.value())
+		raise ValueError('Bad snapshot value tag {!r} at {}'.format(tag,self.pos - 1))
+
+# Части снимка до частей сущностей.
+_HEAD, _RANDOM, _POOLS, _TAGS, _TIMERS = range(5)
+
+def encodeParts(state,game,previous=None):
+	'''
+	Снимок state игры game как список частей (bytes). Части сущностей, поля
+	которых общие с previous (см. capture), берутся из previous без записи.
+	'''
+	entities = [e for e, values in state.entities]
+	refs = {e: i for i, e in enumerate(entities)}
+
+	def write(*values):
+		w = _Writer(refs,game)
+		for v in values:
+			w.value(v)
+		return w.bytes()
+
+	parts = [None] * _TIMERS + [None]
+	parts[_HEAD] = _HEADER.pack(state.ticks,state.currentTime,state.roundOver,state.seq)
+	version, internal, gauss = state.random
+	parts[_RANDOM] = struct.pack('<BH{}I'.format(len(internal)),version,len(internal),*internal) + write(gauss)
+
+	pools = []
+	for cls in sorted(state.pools,key=lambda cls: cls.__name__):
+		count, free = state.pools[cls]
+		pools.append((cls.__name__,count,tuple(refs[e] for e in free)))
+	parts[_POOLS] = write(len(entities),tuple(pools))
+	parts[_TAGS] = write(tuple((tag,tuple(refs[e] for e in tagged)) for tag, tagged in sorted(state.tags.items())))
+	handles = dict((h,(callback,cancelled)) for h, callback, cancelled in state.handles)
+	timers = []
+	for t, seq, h in state.heap:
+		callback, cancelled = handles[h]
+		timers.append((t,seq,None if cancelled else callback,h.owner))
+	parts[_TIMERS] = write(tuple(timers))
+
+	cache = getattr(previous,'_parts',None) or {}
+	mine = state._parts = {}
+	for e, values in state.entities:
+		data = cache.get(e)
+		if data is None or data[0] is not values:
+			data = (values,write(values))
+		mine[e] = data
+		parts.append(data[1])
+	return parts
+
+def decodeParts(parts,game):
+	'''
+	GameState игры game из частей encodeParts. Недостающие сущности пулов создаются.
+	'''
+	classes = _poolClasses()
+	# Сначала пулы: номера сущностей - позиции в statefulEntities.
+	r = _Reader(parts[_POOLS],None,game)
+	count, pools = r.value(), r.value()
+	for name, n, free in pools:
+		game.pool(classes[name]).reserve(n)
+	entities = statefulEntities(game)
+	if len(entities) < count:
+		raise ValueError('Snapshot has {} entities, the game has {}'.format(count,len(entities)))
+
+	def read(data):
+		return _Reader(data,entities,game).value()
+
+	state = GameState.__new__(GameState)
+	state.ticks, state.currentTime, roundOver, state.seq = _HEADER.unpack(parts[_HEAD])
+	state.roundOver = bool(roundOver)
+	version, n = struct.unpack_from('<BH',parts[_RANDOM])
+	internal = struct.unpack_from('<{}I'.format(n),parts[_RANDOM],3)
+	r = _Reader(parts[_RANDOM],entities,game)
+	r.pos = 3 + 4 * n
+	state.random = (version,internal,r.value())
+
+	state.pools = {classes[name]: (n,[entities[i] for i in free]) for name, n, free in pools}
+	state.tags = {tag: [entities[i] for i in tagged] for tag, tagged in read(parts[_TAGS])}
+	state.heap = []
+	state.handles = []
+	for t, seq, callback, owner in read(parts[_TIMERS]):
+		h = TimerHandle(t,callback,owner)
+		h.cancelled = callback is None
+		state.heap.append((t,seq,h))
+		state.handles.append((h,callback,h.cancelled))
+	state.entities = [(e,read(data)) for e, data in zip(entities[:count],parts[_TIMERS+1:])]
+	return state
+
+def _packParts(magic,parts):
+	out = [magic,_U8.pack(_VERSION),_U16.pack(len(parts))]
+	for data in parts:
+		out.append(_U32.pack(len(data)))
+		out.append(data)
+	return b''.join(out)
+
+def _unpackParts(magic,data):
+	if data[:4] != magic:
+		raise ValueError('Not a snapshot')
+	if data[4] != _VERSION:
+		raise ValueError('Unsupported snapshot version {}'.format(data[4]))
+	n, = _U16.unpack_from(data,5)
+	pos = 7
+	parts = []
+	for i in range(n):
+		size, = _U32.unpack_from(data,pos)
+		parts.append(data[pos+4:pos+4+size])
+		pos += 4 + size
+	return parts
+
+def encode(state,game):
+	return _packParts(_MAGIC,encodeParts(state,game))
+
+def decode(data,game):
+	return decodeParts(_unpackParts(_MAGIC,data),game)
+
+def delta(previous,parts):
+	'''
+	Разность частей parts относительно previous: число частей и битовая маска
+	изменившихся, затем сами изменившиеся части.
+	'''
+	mask = bytearray(_U16.pack(len(parts)) + bytes((len(parts) + 7) // 8))
+	changed = []
+	for i, data in enumerate(parts):
+		if i >= len(previous) or previous[i] != data:
+			mask[2 + i // 8] |= 1 << (i % 8)
+			changed.append(data)
+	return _packParts(_DELTA_MAGIC,[bytes(mask)] + changed)
+
+def applyDelta(previous,data):
+	changed = _unpackParts(_DELTA_MAGIC,data)
+	mask = changed[0]
+	n, = _U16.unpack_from(mask)
+	parts = []
+	k = 1
+	for i in range(n):
+		if mask[2 + i // 8] & (1 << (i % 8)):
+			parts.append(changed[k])
+			k += 1
+		else:
+			parts.append(previous[i])
+	return parts
+
+class DeltaEncoder(object):
+	'''
+	Снимки одной игры подряд: первый и каждый keyframe-й - целиком, остальные - разностью.
+	'''
+	def __init__(self,game,keyframe=60):
+		self.game = game
+		self.keyframe = keyframe
+		self._state = None
+		self._parts = None
+		self.count = 0
+
+	def push(self,state):
+		parts = encodeParts(state,self.game,self._state)
+		if self._parts is None or self.count % self.keyframe == 0:
+			data = _packParts(_MAGIC,parts)
+		else:
+			data = delta(self._parts,parts)
+		self._state, self._parts = state, parts
+		self.count += 1
+		return data
+
+class DeltaDecoder(object):
+	def __init__(self,game):
+		self.game = game
+		self._parts = None
+
+	def push(self,data):
+		if data[:4] == _MAGIC:
+			parts = _unpackParts(_MAGIC,data)
+		elif self._parts is None:
+			raise ValueError('Delta before the first full snapshot')
+		else:
+			parts = applyDelta(self._parts,data)
+		self._parts = parts
+		return decodeParts(parts,self.game)
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Банк коротких звуков: все rc/snd/*.wav декодируются один раз, играются на
+фиксированном наборе голосов с ограничением одновременных копий каждого
+звука. Игровой шаг только ставит запрос в очередь, очередь разбирает flush()
+между кадрами.
+'''
+
+import collections
+import glob
+import time
+
+class Voice(object):
+	__slots__ = ('player','sound','started','ends')
+
+	def __init__(self,player):
+		self.player = player
+		self.sound = None
+		self.started = 0.0
+		self.ends = 0.0
+
+	def busy(self,now):
+		return self.sound is not None and now < self.ends
+
+def _pygletVoice():
+	import pyglet
+	return pyglet.media.Player()
+
+def _pygletPlay(player,source):
+	player.pause()
+	while player.source is not None:
+		player.next_source()
+	player.queue(source)
+	player.play()
+
+class SoundBank(object):
+	# Сколько копий одного звука может звучать одновременно.
+	POLYPHONY = {'rc/snd/hit.wav': 3,'rc/snd/chainsaw.wav': 1}
+	DEFAULT_POLYPHONY = 2
+	# Если к кадру накопилось больше запросов, самые старые отбрасываются.
+	QUEUE_LIMIT = 64
+
+	def __init__(self,voices=8,load=None,makeVoice=_pygletVoice,play=_pygletPlay,clock=time.time):
+		self._load = load
+		self._play = play
+		self._clock = clock
+		self._voices = [Voice(makeVoice()) for i in range(voices)]
+		self._sounds = {}
+		self._queue = collections.deque(maxlen=self.QUEUE_LIMIT)
+		self.stats = {'requested': 0,'played': 0,'stolen': 0,'limited': 0,'dropped': 0}
+
+	def preload(self,pattern='rc/snd/*.wav'):
+		'''
+		Начинает декодирование всех звуков. load(path) возвращает описатель с get().
+		'''
+		if self._load is None:
+			from assets import ASSETS
+			self._load = ASSETS.sound
+		for path in sorted(glob.glob(pattern)):
+			path = path.replace('\\','/')
+			self._sounds[path] = self._load(path)
+
+	def play(self,path):
+		'''
+		Вызывается из игровой логики: только ставит звук в очередь.
+		'''
+		self.stats['requested'] += 1
+		queue = self._queue
+		if len(queue) == queue.maxlen:
+			# deque с maxlen сам вытеснит самый старый запрос.
+			self.stats['dropped'] += 1
+		queue.append(path)
+
+	def flush(self,dt=None):
+		'''
+		Проигрывает накопленные запросы. Подходит для pyglet.clock.schedule.
+		'''
+		now = self._clock()
+		queue = self._queue
+		while queue:
+			self._start(queue.popleft(),now)
+
+	def _start(self,path,now):
+		asset = self._sounds.get(path)
+		if asset is None:
+			asset = self._sounds[path] = self._load(path)
+		source = asset.get()
+
+		limit = self.POLYPHONY.get(path,self.DEFAULT_POLYPHONY)
+		same = [v for v in self._voices if v.sound == path and v.busy(now)]
+		if len(same) >= limit:
+			# Перезапускаем самую старую копию того же звука.
+			voice = min(same,key=lambda v: v.started)
+			self.stats['limited'] += 1
+		else:
+			free = [v for v in self._voices if not v.busy(now)]
+			if free:
+				voice = free[0]
+			else:
+				voice = min(self._voices,key=lambda v: v.started)
+				self.stats['stolen'] += 1
+
+		self._play(voice.player,source)
+		voice.sound = path
+		voice.started = now
+		voice.ends = now + (getattr(source,'duration',None) or 0.0)
+		self.stats['played'] += 1
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Равномерная сетка по границам сущностей: какие сущности видны камере или
+находятся рядом с видимой областью, ищется по клеткам, а не перебором всех.
+
+Сущность попадает в сетку, если у её класса CULL = True: её спрайт скрывается,
+пока она вне видимой области. Класс, помеченный updateNearView, кроме того
+обновляется только рядом с видимой областью (см. FightGame.cull).
+'''
+
+import math
+
+# Полуразмер сущности, у которой нет ни width/height, ни спрайта.
+DEFAULT_RADIUS = 64
+
+def updateNearView(cls):
+	'''
+	Декоратор класса: update вызывается, только пока сущность рядом с видимой
+	областью (в FightGame.awake). Вдали от камеры сущность замирает.
+	'''
+	update = cls.update
+
+	def sleepyUpdate(self,dt):
+		if self in self.game.awake:
+			update(self,dt)
+	sleepyUpdate.__doc__ = update.__doc__
+	cls.update = sleepyUpdate
+	cls.CULL = True
+	return cls
+
+def bounds(entity):
+	'''
+	(left, bottom, right, top) сущности с центром в position.
+	'''
+	x, y = entity.position
+	w = getattr(entity,'width',None)
+	h = getattr(entity,'height',None)
+	if w is None or h is None:
+		sprite = getattr(entity,'_sprite',None)
+		if sprite is not None:
+			w, h = sprite.width, sprite.height
+		else:
+			w = h = DEFAULT_RADIUS * 2
+	# Точка привязки спрайта может быть не в центре: берём с запасом.
+	r = max(w,h)
+	return x - r,y - r,x + r,y + r
+
+class SpatialGrid(object):
+	def __init__(self,cellSize=512):
+		self.cellSize = float(cellSize)
+		self._cells = {}
+		self._ranges = {}
+
+	def __len__(self):
+		return len(self._ranges)
+
+	def __contains__(self,entity):
+		return entity in self._ranges
+
+	def _range(self,box):
+		k = self.cellSize
+		return (int(math.floor(box[0] / k)),int(math.floor(box[1] / k)),
+			int(math.floor(box[2] / k)),int(math.floor(box[3] / k)))
+
+	def insert(self,entity,box=None):
+		rng = self._range(box or bounds(entity))
+		self._ranges[entity] = rng
+		cells = self._cells
+		for cx in range(rng[0],rng[2] + 1):
+			for cy in range(rng[1],rng[3] + 1):
+				cells.setdefault((cx,cy),set()).add(entity)
+
+	def remove(self,entity):
+		rng = self._ranges.pop(entity,None)
+		if rng is None:
+			return
+		cells = self._cells
+		for cx in range(rng[0],rng[2] + 1):
+			for cy in range(rng[1],rng[3] + 1):
+				cell = cells.get((cx,cy))
+				if cell is not None:
+					cell.discard(entity)
+					if not cell:
+						del cells[(cx,cy)]
+
+	def move(self,entity,box=None):
+		'''
+		Обновляет клетки сущности; если она не вышла из своих клеток, ничего не делает.
+		'''
+		rng = self._range(box or bounds(entity))
+		if self._ranges.get(entity) == rng:
+			return
+		self.remove(entity)
+		self.insert(entity,box)
+
+	def query(self,left,bottom,right,top):
+		'''
+		Сущности из клеток, пересекающих прямоугольник (с точностью до клетки).
+		'''
+		x0, y0, x1, y1 = self._range((left,bottom,right,top))
+		cells = self._cells
+		found = set()
+		if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+			# Прямоугольник больше занятой части сетки: обходим занятые клетки.
+			for (cx, cy), cell in cells.items():
+				if x0 <= cx <= x1 and y0 <= cy <= y1:
+					found.update(cell)
+			return found
+		for cx in range(x0,x1 + 1):
+			for cy in range(y0,y1 + 1):
+				cell = cells.get((cx,cy))
+				if cell is not None:
+					found.update(cell)
+		return found
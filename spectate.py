@@ -0,0 +1,410 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Трансляция боя зрителям по TCP.
+
+Кадр трансляции (matchFrame) - положения, анимации и здоровье бойцов, летящие
+сущности из пулов, оставшееся время, номер раунда и счёт. GameScreen только
+ставит кадр в очередь (publish), всё остальное делает сервер на asyncio в
+отдельном процессе: разность с прошлым кадром, сжатие (один раз на всех
+зрителей) и рассылка.
+
+Сообщение: u32 длина, u8 вид (KEYFRAME или DELTA), zlib(json). Каждый
+keyframe-й кадр - целиком, остальные - разностью с предыдущим. Новый зритель
+получает последний целый кадр и разности после него. Если зритель не успевает
+читать и его очередь переполнилась, очередь сбрасывается и он так же догоняет
+с последнего целого кадра; игра и другие зрители его не ждут.
+
+	$ python main.py --spectate 47100
+	$ python spectate.py --clients 200 --ticks 600
+'''
+
+import asyncio
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+
+KEYFRAME = 0
+DELTA = 1
+
+_HEAD = struct.Struct('<IB')
+
+def matchFrame(game,globalState=None):
+	'''
+	Кадр трансляции игры game (FightGame); globalState - счёт раундов (game.GLOBAL_STATE).
+	'''
+	entities = {}
+	for p in game.getEntitiesByTag('player'):
+		x, y = p.position
+		entities[p.id] = [round(x,1),round(y,1),p.animation,round(p.health,1),p.state]
+	# Положения и углы летящих - одним чтением хранилища движения, а не свойством каждой.
+	import movement
+	for cls in sorted(game._pools,key=lambda cls: cls.__name__):
+		active = [(i,e) for i, e in enumerate(game._pools[cls].entities) if e.active]
+		moving = [e for i, e in active]
+		if all('_mslot' in e.__dict__ for e in moving):
+			positions, angles = movement.values(moving), movement.values(moving,'rot')
+		else:
+			positions, angles = [e.position for e in moving], [getattr(e,'rotation',0.0) for e in moving]
+		for (i, e), (x, y), angle in zip(active,positions,angles):
+			entities['{}#{}'.format(cls.__name__,i)] = [round(x,1),round(y,1),round(angle,1)]
+	ctl = game.handle('camera-controller').get()
+	timeLeft = game.timeLeft()
+	frame = {'tick': game.ticks,'time': None if timeLeft is None else int(timeLeft),'entities': entities,
+		'camera': None if ctl is None else [round(v,1) for v in ctl.position]}
+	if globalState is not None:
+		frame['round'] = globalState['round']
+		frame['score'] = [globalState['player-left'],globalState['player-right']]
+	return frame
+
+def diff(old,new):
+	'''
+	Разность кадров: изменившиеся поля, изменившиеся и исчезнувшие сущности.
+	'''
+	d = {k: v for k, v in new.items() if k != 'entities' and old.get(k) != v}
+	oldEntities, newEntities = old['entities'], new['entities']
+	changed = {k: v for k, v in newEntities.items() if oldEntities.get(k) != v}
+	if changed:
+		d['set'] = changed
+	gone = [k for k in oldEntities if k not in newEntities]
+	if gone:
+		d['del'] = gone
+	return d
+
+def patch(frame,d):
+	frame = dict(frame)
+	entities = dict(frame['entities'])
+	entities.update(d.get('set',{}))
+	for k in d.get('del',()):
+		entities.pop(k,None)
+	for k, v in d.items():
+		if k not in ('set','del'):
+			frame[k] = v
+	frame['entities'] = entities
+	return frame
+
+def message(kind,payload):
+	data = zlib.compress(json.dumps(payload,separators=(',',':')).encode('utf-8'))
+	return _HEAD.pack(len(data) + 1,kind) + data
+
+async def readMessage(reader):
+	'''
+	(вид, данные) следующего сообщения или None, если соединение закрыто.
+	'''
+	try:
+		head = await reader.readexactly(_HEAD.size)
+	except asyncio.IncompleteReadError:
+		return None
+	size, kind = _HEAD.unpack(head)
+	data = await reader.readexactly(size - 1)
+	return kind, json.loads(zlib.decompress(data).decode('utf-8'))
+
+class _Client(object):
+	__slots__ = ('queue','behind')
+
+	def __init__(self,limit):
+		self.queue = asyncio.Queue(limit)
+		self.behind = True
+
+class _Broadcaster(object):
+	'''
+	Сервер в своём процессе: кадры приходят через очередь frames, статистика
+	уходит через conn.
+	'''
+	def __init__(self,conn,frames,keyframe,queueLimit):
+		self.conn = conn
+		self.frames = frames
+		self.keyframe = keyframe
+		self.queueLimit = queueLimit
+		self.loop = None
+		self._clients = set()
+		self._frame = None
+		# Последний целый кадр и разности после него: с них догоняют зрители.
+		self._catchUp = []
+		self._count = 0
+		self.stats = {'frames': 0,'messages': 0,'bytes': 0,'resyncs': 0,'clients': 0,'peakClients': 0,'encodeTime': 0.0}
+
+	def run(self,host,port):
+		loop = self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(loop)
+		server = loop.run_until_complete(asyncio.start_server(self._serve,host,port))
+		self.conn.send(('port',server.sockets[0].getsockname()[1]))
+		# add_reader на канале не работает на Windows: очередь читает поток.
+		threading.Thread(target=self._feed,name='frames',daemon=True).start()
+		loop.run_forever()
+		server.close()
+		tasks = asyncio.all_tasks(loop)
+		for task in tasks:
+			task.cancel()
+		loop.run_until_complete(asyncio.gather(*tasks,return_exceptions=True))
+		loop.run_until_complete(server.wait_closed())
+		loop.close()
+		self.stats['cpu'] = time.process_time()
+		self.conn.send(('final',self.stats))
+
+	def _feed(self):
+		while True:
+			frame = self.frames.get()
+			self.loop.call_soon_threadsafe(self._receive,frame)
+			if frame is None:
+				return
+
+	def _receive(self,frame):
+		if frame is None:
+			self.loop.stop()
+		else:
+			self._broadcast(frame)
+
+	def _clientsChanged(self,delta):
+		stats = self.stats
+		stats['clients'] += delta
+		stats['peakClients'] = max(stats['peakClients'],stats['clients'])
+		self.stats['cpu'] = time.process_time()
+		self.conn.send(('stats',self.stats))
+
+	def _broadcast(self,frame):
+		started = time.perf_counter()
+		if self._frame is None or self._count % self.keyframe == 0:
+			data = message(KEYFRAME,frame)
+			self._catchUp = [data]
+		else:
+			data = message(DELTA,diff(self._frame,frame))
+			self._catchUp.append(data)
+		self._frame = frame
+		self._count += 1
+		stats = self.stats
+		stats['frames'] += 1
+		for client in self._clients:
+			if client.behind:
+				if not self._enqueue(client,self._catchUp):
+					continue
+				client.behind = False
+			elif not self._enqueue(client,(data,)):
+				# Зритель не успевает: догонит с последнего целого кадра.
+				while not client.queue.empty():
+					client.queue.get_nowait()
+				client.behind = True
+				stats['resyncs'] += 1
+		stats['encodeTime'] += time.perf_counter() - started
+
+	def _enqueue(self,client,messages):
+		queue = client.queue
+		if queue.maxsize - queue.qsize() < len(messages):
+			return False
+		for data in messages:
+			queue.put_nowait(data)
+		return True
+
+	async def _serve(self,reader,writer):
+		client = _Client(max(self.queueLimit,self.keyframe + 1))
+		self._clients.add(client)
+		self._clientsChanged(1)
+		stats = self.stats
+		try:
+			if self._catchUp:
+				self._enqueue(client,self._catchUp)
+				client.behind = False
+			while True:
+				data = await client.queue.get()
+				writer.write(data)
+				stats['messages'] += 1
+				stats['bytes'] += len(data)
+				await writer.drain()
+		except (ConnectionError,asyncio.CancelledError):
+			pass
+		finally:
+			self._clients.discard(client)
+			writer.close()
+			if not self.loop.is_closed() and self.loop.is_running():
+				self._clientsChanged(-1)
+
+def _serverMain(conn,frames,host,port,keyframe,queueLimit):
+	_Broadcaster(conn,frames,keyframe,queueLimit).run(host,port)
+
+class SpectatorServer(object):
+	'''
+	Сервер трансляции в отдельном процессе, чтобы сжатие и рассылка не делили
+	с игрой ни время кадра, ни GIL. publish - только постановка кадра в очередь
+	(сериализует и пишет в канал её поток); если сервер отстал и в очереди уже
+	FRAMES кадров, кадр выбрасывается (dropped), а не ждёт: следующий всё равно
+	придёт разностью с последним принятым.
+	'''
+	FRAMES = 8
+
+	def __init__(self,host='127.0.0.1',port=47100,keyframe=60,queueLimit=120):
+		self.host = host
+		self.port = port
+		self.keyframe = keyframe
+		self.queueLimit = queueLimit
+		self._conn = None
+		self._frames = None
+		self._process = None
+		self.publishTime = 0.0
+		self.published = 0
+		self.dropped = 0
+		self.stats = {}
+
+	def start(self):
+		import multiprocessing
+		self._conn, child = multiprocessing.Pipe()
+		self._frames = multiprocessing.Queue(self.FRAMES)
+		self._process = multiprocessing.Process(target=_serverMain,
+			args=(child,self._frames,self.host,self.port,self.keyframe,self.queueLimit),name='spectators')
+		self._process.daemon = True
+		self._process.start()
+		kind, self.port = self._conn.recv()
+		return self
+
+	def publish(self,frame,block=False):
+		# Время процессора, а не по часам: на занятой машине по часам мерилось бы и чужое.
+		started = time.thread_time()
+		try:
+			self._frames.put(frame,block)
+			self.published += 1
+		except queue.Full:
+			self.dropped += 1
+		self.publishTime += time.thread_time() - started
+
+	def refresh(self):
+		'''
+		Забирает последнюю статистику сервера.
+		'''
+		while self._conn.poll():
+			kind, self.stats = self._conn.recv()
+		return self.stats
+
+	def close(self):
+		if self._process is None:
+			return
+		self._frames.put(None)
+		while self._conn.poll(5.0):
+			kind, self.stats = self._conn.recv()
+			if kind == 'final':
+				break
+		self._process.join(5.0)
+		self._process = None
+		self._frames.close()
+
+	def report(self):
+		s = dict({'frames': 0,'messages': 0,'bytes': 0,'resyncs': 0,'clients': 0,'peakClients': 0,'encodeTime': 0.0,'cpu': 0.0},**self.stats)
+		return '{peakClients} clients at peak ({clients} now), {frames} frames ({2} dropped), {messages} messages, {bytes} bytes, {resyncs} resyncs, ' \
+			'publish CPU {0:.1f} us/frame, encode+fanout {1:.1f} us/frame (server process)'.format(
+				self.publishTime / max(self.published,1) * 1e6,s['encodeTime'] / max(s['frames'],1) * 1e6,
+				self.dropped,**s)
+
+class Spectator(object):
+	'''
+	Зритель: собирает кадры из сообщений сервера.
+	'''
+	def __init__(self):
+		self.frame = None
+		self.messages = 0
+		self.keyframes = 0
+
+	def apply(self,kind,payload):
+		if kind == KEYFRAME:
+			self.frame = payload
+			self.keyframes += 1
+		elif self.frame is not None:
+			self.frame = patch(self.frame,payload)
+		self.messages += 1
+
+	async def watch(self,host,port,until=None):
+		'''
+		Читает трансляцию, пока сервер не закроет соединение или кадр не дойдёт до шага until.
+		'''
+		reader, writer = await asyncio.open_connection(host,port)
+		try:
+			while True:
+				m = await readMessage(reader)
+				if m is None:
+					return
+				self.apply(*m)
+				if until is not None and self.frame is not None and self.frame['tick'] >= until:
+					return
+		finally:
+			writer.close()
+
+def _syntheticFrame(tick):
+	'''
+	Кадр, похожий на настоящий: два бойца, летящая гитара каждые две секунды.
+	'''
+	entities = {'player-left': [round(-500 + tick % 400,1),0.0,'stand',100.0,'standing'],
+		'player-right': [500.0,0.0,'hit' if tick % 30 < 10 else 'stand',round(100 - tick * 0.01,1),'standing']}
+	if tick % 120 < 72:
+		entities['Hurter#0'] = [round(-400 + (tick % 120) * 33.3,1),-100.0,0.0]
+		entities['FlyingGuitar#0'] = [round(-400 + (tick % 120) * 33.3,1),-100.0,round(tick * 12.0 % 360,1)]
+	return {'tick': tick,'time': 60 - tick // 60,'entities': entities,'camera': [0.0,0.0],'round': 1,'score': [0,0]}
+
+def _watchAll(conn,port,count,until):
+	'''
+	Процесс зрителей нагрузочной проверки: count зрителей до шага until, в ответ - их последние кадры.
+	'''
+	spectators = [Spectator() for i in range(count)]
+
+	async def run():
+		await asyncio.gather(*[s.watch('127.0.0.1',port,until) for s in spectators])
+	asyncio.run(run())
+	conn.send([s.frame for s in spectators])
+
+def _loadTest(args):
+	import multiprocessing
+
+	frames = _syntheticFrame
+	if args.match:
+		from sim import Match
+		match = Match(seed=0)
+		state = {'player-left': 0,'player-right': 0,'round': 1}
+		frames = lambda tick: (match.step(),matchFrame(match.game,state))[1]
+
+	server = SpectatorServer(port=0,keyframe=args.keyframe).start()
+	# Зрители - в отдельном процессе, чтобы время процессора сервера мерилось без них.
+	conn, child = multiprocessing.Pipe()
+	watcher = multiprocessing.Process(target=_watchAll,args=(child,server.port,args.clients,args.ticks - 1))
+	watcher.start()
+	while server.refresh().get('clients',0) < args.clients:
+		time.sleep(0.01)
+	serverCpu = server.stats['cpu']
+
+	started = time.perf_counter()
+	cpu = time.process_time()
+	frame = None
+	for tick in range(args.ticks):
+		frame = frames(tick)
+		# Последний кадр - с ожиданием: по нему проверяется, что зрители догнали.
+		server.publish(frame,block=tick == args.ticks - 1)
+		if args.realtime:
+			ahead = started + (tick + 1) / 60.0 - time.perf_counter()
+			if ahead > 0:
+				time.sleep(ahead)
+	received = conn.recv() if conn.poll(30.0) else []
+	elapsed = time.perf_counter() - started
+	cpu = time.process_time() - cpu
+	watcher.join(5.0)
+	server.close()
+
+	s = server.stats
+	print(server.report())
+	print('{:.0f} messages/s, {:.2f} MB/s, {:.1f} bytes/message'.format(
+		s['messages'] / elapsed,s['bytes'] / elapsed / 1e6,s['bytes'] / max(s['messages'],1)))
+	print('CPU per tick: game process {:.3f} ms (with frame building), server process {:.3f} ms'.format(
+		cpu / args.ticks * 1000.0,(s['cpu'] - serverCpu) / args.ticks * 1000.0))
+	synced = sum(1 for f in received if f == frame)
+	print('{}/{} spectators ended on the last frame'.format(synced,args.clients))
+	return synced == args.clients
+
+if __name__ == '__main__':
+	import argparse
+	import sys
+
+	parser = argparse.ArgumentParser(description='Spectator server load test on localhost.')
+	parser.add_argument('--clients',type=int,default=200)
+	parser.add_argument('--ticks',type=int,default=600)
+	parser.add_argument('--keyframe',type=int,default=60)
+	parser.add_argument('--realtime',action='store_true',help='publish at 60 frames per second')
+	parser.add_argument('--match',action='store_true',help='frames from a headless match (sim.Match)')
+	sys.exit(0 if _loadTest(parser.parse_args()) else 1)
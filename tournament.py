@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# coding=UTF-8
+
+'''
+Турнир компьютерных бойцов: все пары из PLAYER_VARIANTS, тысячи матчей на
+пуле процессов, результаты каждого раунда пишутся в компактный двоичный файл.
+
+	$ python tournament.py --matches 1000 --out tournament.bin
+'''
+
+import argparse
+import itertools
+import multiprocessing
+import random
+import struct
+import time
+
+from sim import Match, SIDES
+from fighters import PLAYER_VARIANTS, isGameOver
+
+# Раунды, после которых матч останавливается, даже если всё время ничьи.
+MAX_ROUNDS = 9
+
+_MAGIC = b'T33R'
+# Пара, зерно матча, номер раунда, победитель (0 - ничья, 1 - левый, 2 - правый),
+# число шагов, здоровье левого и правого.
+_RECORD = struct.Struct('<HIBBIff')
+_WINNER_CODES = {None: 0, 'player-left': 1, 'player-right': 2}
+_WINNER_IDS = {v: k for k, v in _WINNER_CODES.items()}
+
+class RandomController(object):
+	'''
+	Простой компьютерный боец: идёт к противнику и время от времени бьёт,
+	прыгает, ставит блок или бросает гитару.
+	'''
+	ACTIONS = ('hit','hit','hit','jump','block','throw')
+
+	def __init__(self,rnd,period=12):
+		self.rnd = rnd
+		self.period = period
+		self._held = None
+
+	def __call__(self,match,side):
+		if match.ticks % self.period:
+			return
+		me = match.players[side]
+		other = match.players['right' if side == 'left' else 'left']
+
+		if self._held is not None:
+			match.input(side,self._held,False)
+			self._held = None
+
+		direction = 1 if other.position[0] > me.position[0] else -1
+		match.input(side,'go',False,direction=-direction)
+		match.input(side,'go',self.rnd.random() < 0.7,direction=direction)
+
+		if self.rnd.random() < 0.5:
+			action = self.rnd.choice(self.ACTIONS)
+			match.input(side,action,True)
+			self._held = action
+
+def playMatch(task):
+	'''
+	Играет один матч до isGameOver (как GameScreen) и возвращает записи раундов.
+	'''
+	pairIndex, left, right, seed = task
+	rnd = random.Random(seed)
+	random.seed(seed)
+
+	choices = {'player-left': PLAYER_VARIANTS[left], 'player-right': PLAYER_VARIANTS[right]}
+	state = {'player-left':0,'player-right':0,'round':1}
+	records = []
+	while not isGameOver(state) and state['round'] <= MAX_ROUNDS:
+		match = Match(choices,seed=rnd.getrandbits(32))
+		for side in SIDES:
+			match.controllers[side] = RandomController(random.Random(rnd.random()))
+		res = match.run()
+
+		records.append(_RECORD.pack(pairIndex,seed,state['round'],_WINNER_CODES[res['winner']],
+			res['ticks'],res['health']['player-left'],res['health']['player-right']))
+
+		state['round'] += 1
+		if res['winner']:
+			state[res['winner']] += 1
+	return records
+
+def readResults(filename):
+	'''
+	Читает файл турнира. Возвращает (имена пар, список раундов).
+	'''
+	with open(filename,'rb') as f:
+		if f.read(4) != _MAGIC:
+			raise ValueError('Not a tournament file: '+filename)
+		n, = struct.unpack('<H',f.read(2))
+		pairs = []
+		for i in range(n):
+			size, = struct.unpack('<H',f.read(2))
+			pairs.append(tuple(f.read(size).decode('utf-8').split('|')))
+		rounds = []
+		while True:
+			chunk = f.read(_RECORD.size)
+			if len(chunk) < _RECORD.size:
+				break
+			pair, seed, rnd, winner, ticks, hl, hr = _RECORD.unpack(chunk)
+			rounds.append({'pair': pair,'seed': seed,'round': rnd,'winner': _WINNER_IDS[winner],
+				'ticks': ticks,'health': {'player-left': hl,'player-right': hr}})
+		return pairs, rounds
+
+def summarize(pairs,rounds):
+	stats = [{'rounds': 0,'player-left': 0,'player-right': 0,None: 0,'dmg-left': 0.0,'dmg-right': 0.0} for p in pairs]
+	for r in rounds:
+		st = stats[r['pair']]
+		st['rounds'] += 1
+		st[r['winner']] += 1
+		st['dmg-left'] += 100.0 - r['health']['player-right']
+		st['dmg-right'] += 100.0 - r['health']['player-left']
+	lines = []
+	for (left, right), st in zip(pairs,stats):
+		n = max(st['rounds'],1)
+		lines.append('{:>8} vs {:<8} rounds {:6d}  wins {:5.1f}% / {:5.1f}%  draws {:5.1f}%  dmg {:6.1f} / {:6.1f}'.format(
+			left,right,st['rounds'],100.0*st['player-left']/n,100.0*st['player-right']/n,100.0*st[None]/n,
+			st['dmg-left']/n,st['dmg-right']/n))
+	return '\n'.join(lines)
+
+def main():
+	parser = argparse.ArgumentParser(description='AI-vs-AI tournament over PLAYER_VARIANTS.')
+	parser.add_argument('--matches',type=int,default=100,help='matches per pairing')
+	parser.add_argument('--workers',type=int,default=multiprocessing.cpu_count())
+	parser.add_argument('--seed',type=int,default=0)
+	parser.add_argument('--out',default='tournament.bin')
+	args = parser.parse_args()
+
+	pairs = list(itertools.product(range(len(PLAYER_VARIANTS)),repeat=2))
+	names = [(PLAYER_VARIANTS[l].FIGHTER_NAME,PLAYER_VARIANTS[r].FIGHTER_NAME) for l, r in pairs]
+	rnd = random.Random(args.seed)
+	tasks = [(i,l,r,rnd.getrandbits(32)) for i, (l, r) in enumerate(pairs) for m in range(args.matches)]
+
+	started = time.time()
+	pool = multiprocessing.Pool(args.workers)
+	with open(args.out,'wb') as f:
+		f.write(_MAGIC)
+		f.write(struct.pack('<H',len(names)))
+		for name in names:
+			data = '|'.join(name).encode('utf-8')
+			f.write(struct.pack('<H',len(data)))
+			f.write(data)
+		# Раунды пишутся по мере готовности матчей, порядок в файле не определён.
+		for records in pool.imap_unordered(playMatch,tasks,chunksize=4):
+			f.write(b''.join(records))
+	pool.close()
+	pool.join()
+	elapsed = time.time() - started
+
+	pairs, rounds = readResults(args.out)
+	print(summarize(pairs,rounds))
+	print('{} matches, {} rounds in {:.1f}s on {} workers'.format(len(tasks),len(rounds),elapsed,args.workers))
+
+if __name__ == '__main__':
+	main()